@@ -0,0 +1,300 @@
+"""
+防作弊規則引擎 (Input Validation)。
+
+每款遊戲在 GAME_SPECS 宣告要解析的欄位與門檻值，規則以 @rule 註冊；
+啟動時編譯成每款遊戲一個 validator，請求時只需解析一次欄位並依序執行規則。
+每條規則的執行次數、命中次數與累計耗時記錄在 rule_stats()。
+"""
+
+import threading
+import time
+
+# 寬容度設定 (考慮網路延遲與 FPS 波動)
+TOLERANCE = 1.2
+
+# 所有遊戲共用的門檻：任何遊戲都不可能在 0.5 秒內完成並獲得分數 (除非是極低分)
+COMMON_LIMITS = {
+    'min_duration': 0.5,
+    'min_score_for_reaction_check': 10,
+}
+
+GAME_SPECS = {
+    # === 🐍 Snake ===
+    'snake': {
+        'fields': ('moves',),
+        'limits': {
+            'moves_per_second': 10,      # TICK_RATE = 100ms
+            'moves_slack': 5,
+            'teleport_min_score': 5,
+            'min_moves_per_point': 2,
+        },
+    },
+    # === 🧱 Tetris ===
+    'tetris': {
+        'fields': ('pieces', 'level', 'lines'),
+        'limits': {
+            'pieces_per_second': 4,
+            'pieces_slack': 10,
+            'max_lines_per_piece': 4,    # 全是 I 型方塊的理論極限
+            'line_score_per_level': 300,
+            'line_score_tolerance': 1.5,
+            'drop_score_per_piece': 40,
+            'score_slack': 2000,
+        },
+    },
+    # === 🔨 Whac-A-Mole ===
+    'whac': {
+        'fields': ('hits',),
+        'limits': {
+            'points_per_hit': 10,
+            'max_cps': 12,               # 金氏世界紀錄約 14 CPS，普通人極限約 7-9
+            'cps_min_duration': 1,
+        },
+    },
+    # === 🪜 Shaft (下樓梯) ===
+    'shaft': {
+        'fields': ('moves',),
+        'limits': {
+            'score_per_second': 6,       # frame / 10，60 FPS
+            'score_slack': 10,
+            'idle_min_score': 50,
+            'idle_min_moves': 5,
+        },
+    },
+    # === 🦖 Dino ===
+    'dino': {
+        'fields': ('jumps',),
+        'limits': {
+            'base_speed': 30,
+            'acceleration': 0.5,
+            'score_slack': 100,
+            'jumpless_max_score': 500,
+        },
+    },
+    # === 🧠 Memory ===
+    'memory': {
+        'fields': ('moves',),
+        'limits': {
+            'min_seconds_per_move': 0.4,
+            'base_score': 1000,
+            'time_penalty': 2,
+            'move_penalty': 5,
+            'score_slack': 300,
+        },
+    },
+}
+
+# (game_name, rule_name, check)；game_name 為 None 代表共用規則
+_RULES = []
+
+
+def rule(game_name, name):
+    """
+    註冊規則。check(score, duration, f, limits) 回傳 None 表示通過，否則回傳拒絕原因。
+    f 是已解析成 int 的欄位 (另含原始的 'hash')。
+    """
+    def decorator(check):
+        _RULES.append((game_name, name, check))
+        return check
+    return decorator
+
+
+# ==========================================
+# 共用規則 (最先執行)
+# ==========================================
+
+@rule(None, 'reaction_time')
+def _reaction_time(score, duration, f, L):
+    if score > L['min_score_for_reaction_check'] and duration < L['min_duration']:
+        return f"Impossible reaction time: {duration}s"
+
+
+# ==========================================
+# 各遊戲規則
+# ==========================================
+
+@rule('snake', 'speed_hack')
+def _snake_speed(score, duration, f, L):
+    max_possible_moves = (duration * L['moves_per_second']) * TOLERANCE + L['moves_slack']
+    if f['moves'] > max_possible_moves:
+        return f"Speed hack: {f['moves']} moves > limit {max_possible_moves:.0f}"
+
+
+@rule('snake', 'teleport')
+def _snake_teleport(score, duration, f, L):
+    if score > L['teleport_min_score'] and f['moves'] < score * L['min_moves_per_point']:
+        return f"Teleport detected: Score {score} with only {f['moves']} moves"
+
+
+@rule('tetris', 'auto_dropper')
+def _tetris_pieces(score, duration, f, L):
+    if f['pieces'] > (duration * L['pieces_per_second']) * TOLERANCE + L['pieces_slack']:
+        return f"Auto-dropper: {f['pieces']} pieces in {duration:.2f}s"
+
+
+@rule('tetris', 'efficiency')
+def _tetris_efficiency(score, duration, f, L):
+    if f['lines'] > f['pieces'] * L['max_lines_per_piece']:
+        return f"Impossible efficiency: {f['lines']} lines with {f['pieces']} pieces"
+
+
+@rule('tetris', 'score_limit')
+def _tetris_score(score, duration, f, L):
+    # 假設全部都是最高效率消行、每個方塊都從頂端掉到底 (Nintendo Scoring 的寬鬆上限)
+    max_line_score = f['lines'] * L['line_score_per_level'] * (f['level'] + 1) * L['line_score_tolerance']
+    max_drop_score = f['pieces'] * L['drop_score_per_piece']
+    max_total = max_line_score + max_drop_score + L['score_slack']
+    if score > max_total:
+        return f"Score mismatch: {score} exceeds limit {max_total:.0f} (Lv.{f['level']})"
+
+
+@rule('whac', 'score_manipulation')
+def _whac_score(score, duration, f, L):
+    if score != f['hits'] * L['points_per_hit']:
+        return f"Score manipulation: {score} != {f['hits']}*{L['points_per_hit']}"
+
+
+@rule('whac', 'auto_clicker')
+def _whac_cps(score, duration, f, L):
+    if duration > L['cps_min_duration'] and (f['hits'] / duration) > L['max_cps']:
+        return f"Auto-clicker: {f['hits']} hits in {duration:.2f}s ({f['hits'] / duration:.1f} CPS)"
+
+
+@rule('shaft', 'speed_hack')
+def _shaft_speed(score, duration, f, L):
+    max_score = (duration * L['score_per_second']) * TOLERANCE + L['score_slack']
+    if score > max_score:
+        return f"Speed hack: Score {score} > Time Limit {max_score:.0f}"
+
+
+@rule('shaft', 'no_input')
+def _shaft_idle(score, duration, f, L):
+    if score > L['idle_min_score'] and f['moves'] < L['idle_min_moves']:
+        return f"No input detected: Score {score} with {f['moves']} moves"
+
+
+@rule('dino', 'speed_hack')
+def _dino_speed(score, duration, f, L):
+    # 遊戲速度隨時間線性增加，距離 (分數) 是速度的積分
+    max_possible_score = (duration * L['base_speed'] + (L['acceleration'] * duration**2)) * TOLERANCE + L['score_slack']
+    if score > max_possible_score:
+        return f"Speed hack: Score {score} > Physics Limit {max_possible_score:.0f}"
+
+
+@rule('dino', 'no_jumps')
+def _dino_jumps(score, duration, f, L):
+    if score > L['jumpless_max_score'] and f['jumps'] == 0:
+        return f"Bot detected: Score {score} with 0 jumps"
+
+
+@rule('memory', 'speed_clicker')
+def _memory_speed(score, duration, f, L):
+    if f['moves'] > 0 and (duration / f['moves']) < L['min_seconds_per_move']:
+        return f"Speed clicker: {f['moves']} moves in {duration:.2f}s"
+
+
+@rule('memory', 'score_recalc')
+def _memory_score(score, duration, f, L):
+    calc_score = max(0, L['base_score'] - (int(duration) * L['time_penalty']) - (f['moves'] * L['move_penalty']))
+    if score > calc_score + L['score_slack']:
+        return f"Score calculation mismatch: Client {score} vs Server {calc_score}"
+
+
+# ==========================================
+# 共用規則 (最後執行)
+# ==========================================
+
+@rule(None, 'missing_hash')
+def _missing_hash(score, duration, f, L):
+    # 這裡只檢查是否有 hash，真正校驗在 submit_score 中
+    if f['hash'] is None:
+        return "Missing security hash"
+
+
+# ==========================================
+# 編譯與統計
+# ==========================================
+
+_stats = {}          # (game_name, rule_name) -> [evaluations, hits, total_ns]
+_stats_lock = threading.Lock()
+
+
+def _stat_slot(game_name, rule_name):
+    with _stats_lock:
+        return _stats.setdefault((game_name, rule_name), [0, 0, 0])
+
+
+def compile_validator(game_name):
+    """把共用規則與該遊戲的規則串成單一 validator(score, data, duration) -> (ok, reason)"""
+    spec = GAME_SPECS.get(game_name, {'fields': (), 'limits': {}})
+    stats_key = game_name if game_name in GAME_SPECS else '*'
+    limits = {**COMMON_LIMITS, **spec['limits']}
+    fields = spec['fields']
+
+    common = [(name, check) for g, name, check in _RULES if g is None]
+    specific = [(name, check) for g, name, check in _RULES if g == game_name and g is not None]
+    # reaction_time 在最前面、missing_hash 在最後面，與原本的檢查順序相同
+    ordered = common[:1] + specific + common[1:]
+    bound = tuple((name, check, _stat_slot(stats_key, name)) for name, check in ordered)
+    perf_counter_ns = time.perf_counter_ns
+
+    def validator(score, data, duration):
+        try:
+            f = {name: int(data.get(name, 0)) for name in fields}
+        except (TypeError, ValueError):
+            return False, "Malformed game data"
+        f['hash'] = data.get('hash')
+        for name, check, slot in bound:
+            start = perf_counter_ns()
+            reason = check(score, duration, f, limits)
+            slot[2] += perf_counter_ns() - start
+            slot[0] += 1
+            if reason:
+                slot[1] += 1
+                return False, reason
+        return True, "Valid"
+
+    return validator
+
+
+VALIDATORS = {game_name: compile_validator(game_name) for game_name in GAME_SPECS}
+_GENERIC_VALIDATOR = compile_validator(None)
+
+
+def parse_fields(game_name, data):
+    """取出並解析該遊戲宣告的欄位 (驗證通過後保存到 scores 用)"""
+    fields = GAME_SPECS.get(game_name, {'fields': ()})['fields']
+    return {name: int(data.get(name, 0)) for name in fields}
+
+
+def validate(game_name, score, data, duration):
+    return VALIDATORS.get(game_name, _GENERIC_VALIDATOR)(score, data, duration)
+
+
+def validate_many(submissions):
+    """批次驗證 [(game_name, score, data, duration), ...]，回傳對應的 [(ok, reason), ...]"""
+    validators = VALIDATORS
+    generic = _GENERIC_VALIDATOR
+    return [
+        validators.get(game_name, generic)(score, data, duration)
+        for game_name, score, data, duration in submissions
+    ]
+
+
+def rule_stats():
+    """每條規則的執行次數、命中次數與耗時 (依總耗時排序，最花時間的在前)"""
+    with _stats_lock:
+        items = [(key, list(slot)) for key, slot in _stats.items()]
+    rows = [
+        {
+            'game': game_name,
+            'rule': rule_name,
+            'evaluations': evaluations,
+            'hits': hits,
+            'total_ms': round(total_ns / 1e6, 3),
+            'avg_ns': round(total_ns / evaluations, 1) if evaluations else 0.0,
+        }
+        for (game_name, rule_name), (evaluations, hits, total_ns) in items
+    ]
+    rows.sort(key=lambda r: r['total_ms'], reverse=True)
+    return rows
@@ -1,15 +1,24 @@
 import os
 import time
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
-from werkzeug.utils import secure_filename
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, g
+from werkzeug.exceptions import RequestEntityTooLarge
 import database
+import rate_limit
+import anticheat
+import anticheat_js
+import game_ticket
+import metrics
+import structured_log
+import replay
+import avatars
 import hashlib
-import uuid
-import random
-import string
 import time
 
 app = Flask(__name__)
+
+# 結構化日誌：寫出在背景執行緒進行，請求只負責放進佇列 (見 structured_log.py)
+structured_log.setup()
+log = structured_log.get_logger('arcade.app')
 # 建議在實際部署時改用環境變數提供隨機且保密的金鑰：
 #   set FLASK_SECRET_KEY=隨機字串
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev-secret-change-me')
@@ -21,22 +30,106 @@ SHARED_SALT = "ArcadeSuperSecretSalt_2025_NoCheating!"
 # 允許的 Timestamp 誤差 (毫秒)
 TIMESTAMP_TOLERANCE_MS = 30000  # 30秒
 
-# 設定圖片上傳路徑
-UPLOAD_FOLDER = os.path.join('static', 'uploads')
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+# 設定圖片上傳路徑 (頭像縮圖與內容定址存檔見 avatars.py)
+UPLOAD_FOLDER = avatars.UPLOAD_FOLDER
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# 排行榜頁是否使用 SSE 即時推播：只有訂閱者不各佔一條執行緒時才開 (asgi.py 會自動設為 True；
+# 以 gevent worker 執行時設 ARCADE_LIVE_RANK=1)，否則頁面改用有 ETag 的 /api/get_rank
+app.config['LIVE_RANK'] = os.environ.get('ARCADE_LIVE_RANK', '0') == '1'
+
 # 初始化 DB
 database.init_db()
 
 # ==========================================
-# 🛡️ 簡單送分數頻率限制（防止洗分 / 暴力打 API）
-# 單機 / 小專案可用記憶體內 dict，正式環境建議改用 Redis 等集中儲存
+# 📈 計量指標 (GET /metrics，Prometheus 文字格式；見 metrics.py)
+# ==========================================
+metrics.instrument_module(database)
+request_seconds = metrics.histogram(
+    'arcade_http_request_duration_seconds', 'HTTP request latency by route', labels=('method', 'route', 'status')
+)
+rate_limit_rejections = metrics.counter(
+    'arcade_rate_limit_rejections_total', 'Requests rejected by a rate limiter', labels=('limiter',)
+)
+anticheat_rejections = metrics.counter(
+    'arcade_anticheat_rejections_total', 'Score submissions rejected by anti-cheat checks', labels=('game', 'reason')
+)
+metrics.gauge('arcade_log_queue_depth', 'Log records waiting to be written', lambda: structured_log.stats()['queued'])
+metrics.gauge(
+    'arcade_log_dropped_total', 'Log records dropped because the queue was full',
+    lambda: structured_log.stats()['dropped'], kind='counter'
+)
+metrics.gauge(
+    'arcade_executor_pending', 'Jobs running or queued per bounded executor',
+    lambda: {(name,): s['pending'] for name, s in database.executor_stats().items()}, labels=('executor',)
+)
+metrics.gauge(
+    'arcade_executor_shed_total', 'Jobs rejected with 503 per bounded executor',
+    lambda: {(name,): s['shed'] for name, s in database.executor_stats().items()}, labels=('executor',), kind='counter'
+)
+metrics.gauge('arcade_rank_stream_subscribers', 'Open leaderboard SSE connections', lambda: database.rank_stream.subscribers)
+metrics.gauge(
+    'arcade_score_queue_depth', 'Scores waiting in the write-behind queue',
+    lambda: database.score_writer_stats().get('queue_depth', 0)
+)
+
+def game_label(game_name):
+    """任意字串都可能出現在請求中，label 只保留已知的遊戲名稱"""
+    return game_name if game_name in database.GAMES else 'other'
+
+def reason_label(reason):
+    """'Speed hack: 120 moves > limit 80' -> 'speed_hack'：去掉數值，避免 label 數量無限增加"""
+    head = reason.split(':', 1)[0]
+    for i, ch in enumerate(head):
+        if ch.isdigit():
+            head = head[:i]
+            break
+    return '_'.join(head.lower().split())[:40] or 'unknown'
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_seconds.observe(time.perf_counter() - start, request.method, route, str(response.status_code))
+    return response
+
+AVATAR_URL_PREFIX = f'{app.static_url_path}/uploads/{avatars.SUBDIR}/'
+
+@app.after_request
+def cache_avatars(response):
+    # 頭像檔名是內容雜湊，內容永遠不變：讓瀏覽器 / CDN 長期快取，不再每次回來驗證
+    if request.path.startswith(AVATAR_URL_PREFIX) and response.status_code in (200, 304):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = 365 * 24 * 3600
+        response.cache_control.immutable = True
+    return response
+
+# 設定 ARCADE_METRICS_TOKEN 時需帶 Authorization: Bearer <token> (Prometheus 的 bearer_token 設定)
+METRICS_TOKEN = os.environ.get('ARCADE_METRICS_TOKEN')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return app.response_class('Unauthorized\n', status=401, mimetype='text/plain')
+    return app.response_class(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+# ==========================================
+# 🛡️ 送分數頻率限制（防止洗分 / 暴力打 API）
+# 預設為行程內記憶體；多個 worker 時設定 ARCADE_RATE_LIMIT_DB 共用 SQLite (見 rate_limit.py)
 # ==========================================
 RATE_LIMIT_WINDOW = 60           # 秒數：一個時間窗
 RATE_LIMIT_MAX_SUBMITS = 30      # 每個使用者在一個時間窗內最多送幾次分數
-_score_submit_log = {}           # user_id -> [timestamp, ...]
+score_rate_limiter = rate_limit.create_rate_limiter(RATE_LIMIT_MAX_SUBMITS, RATE_LIMIT_WINDOW)
+
+# 🎫 遊戲票券：開局資訊簽在票券裡，不寫入 session (見 game_ticket.py)
+game_tickets = game_ticket.create_ticket_book(app.secret_key)
 
 # --- 🛍️ 創意商店物品設定 ---
 SHOP_ITEMS = {
@@ -72,149 +165,69 @@ PRESET_AVATARS = {
 }
 
 def get_current_user():
-    if 'user_id' in session:
-        return database.get_user_by_id(session['user_id'])
-    return None
-
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    """
+    目前登入的使用者資料列。
+    同一個請求內只查一次 (存在 flask.g)；期間若有任何 users 修改 (user_cache.generation 改變) 就重新讀取。
+    """
+    if 'user_id' not in session:
+        return None
+    user_id = session['user_id']
+    cached = g.get('current_user')
+    if cached is not None and cached[0] == user_id and cached[1] == database.user_cache.generation:
+        g.current_user_hits += 1
+        return cached[2]
+    generation = database.user_cache.generation
+    row = database.get_user_by_id(user_id)
+    g.current_user = (user_id, generation, row)
+    g.current_user_hits = g.get('current_user_hits', 0)
+    return row
+
+@app.teardown_request
+def record_user_cache_hits(exc):
+    if 'current_user' in g:
+        database.user_cache.record_request(g.current_user_hits)
+
+def conditional_json(etag, build, cache_control='no-cache'):
+    """
+    以版本號為 ETag 回傳 JSON。
+    瀏覽器帶來的 If-None-Match 相符時直接回 304，build() 不會被呼叫 (不查 DB)。
+    """
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
 
 # ==========================================
 # 🛡️ 防作弊邏輯核心 (Input Validation)
 # ==========================================
 
 def validate_game_logic(game_name, score, data, duration):
-    # 0. 基礎檢查：人類反應極限
-    # 任何遊戲都不可能在 0.5 秒內完成並獲得分數 (除非是極低分)
-    if score > 10 and duration < 0.5:
-        return False, f"Impossible reaction time: {duration}s"
-
-    # 寬容度設定 (考慮網路延遲與 FPS 波動)
-    TOLERANCE = 1.2 
-
-    # === 🐍 Snake 檢測 ===
-    if game_name == 'snake':
-        moves = int(data.get('moves', 0))
-        # 物理極限：每秒最多 10 步 (TICK_RATE = 100ms)
-        max_possible_moves = (duration * 10) * TOLERANCE + 5
-        if moves > max_possible_moves:
-            return False, f"Speed hack: {moves} moves > limit {max_possible_moves:.0f}"
-        # 效率檢測：移動數過少
-        if score > 5 and moves < score * 2:
-            return False, f"Teleport detected: Score {score} with only {moves} moves"
-
-    # === 🧱 Tetris 檢測 ===
-    elif game_name == 'tetris':
-        pieces = int(data.get('pieces', 0))
-        level = int(data.get('level', 0))
-        lines = int(data.get('lines', 0))
-
-        # 1. 物理極限：每秒最多 3-4 個方塊 (考慮動畫與延遲)
-        if pieces > (duration * 4) * TOLERANCE + 10:
-             return False, f"Auto-dropper: {pieces} pieces in {duration:.2f}s"
-        
-        # 2. 邏輯檢測：方塊數與消行數的關係
-        # 最極端情況：全都是 I 型方塊，每 1 個方塊消 4 行 (不可能連續發生，但作為極限值)
-        # 實際上平均約 2.5 個方塊消 1 行 (高手) 到 10 個方塊消 0 行 (新手)
-        if lines > pieces * 4: # 絕對不可能發生的情況
-            return False, f"Impossible efficiency: {lines} lines with {pieces} pieces"
-
-        # 3. 分數檢測 (基於等級的寬鬆上限)
-        # Nintendo Scoring: 
-        # Single: 40*(L+1), Double: 100*(L+1), Triple: 300*(L+1), Tetris: 1200*(L+1)
-        # 假設全部都是 Tetris (最高分效率)，且都在當前最高等級完成
-        # Max Score ≈ (Lines / 4) * 1200 * (Level + 1)
-        # 加上 Soft/Hard Drop 的分數 (每個方塊最多 20~40 分)
-        
-        max_line_score = (lines / 1) * 300 * (level + 1) * 1.5 # 寬容係數 1.5
-        max_drop_score = pieces * 40 # 假設每個方塊都從頂端掉到底
-        max_total = max_line_score + max_drop_score + 2000 # 基礎寬容值
-        
-        if score > max_total:
-             return False, f"Score mismatch: {score} exceeds limit {max_total:.0f} (Lv.{level})"
-
-    # === 🔨 Whac-A-Mole 檢測 ===
-    elif game_name == 'whac':
-        hits = int(data.get('hits', 0))
-        # 邏輯檢測：分數必須等於打擊數 * 10 (後端硬性規定)
-        if score != hits * 10:
-            return False, f"Score manipulation: {score} != {hits}*10"
-        # 物理極限：人類 CPS (Clicks Per Second) 上限
-        # 金氏世界紀錄約 14 CPS，普通人極限約 7-9。設為 10 寬容值。
-        if duration > 1 and (hits / duration) > 12:
-            return False, f"Auto-clicker: {hits} hits in {duration:.2f}s ({hits/duration:.1f} CPS)"
-
-    # === 🪜 Shaft (下樓梯) 檢測 ===
-    elif game_name == 'shaft':
-        moves = int(data.get('moves', 0))
-        # 物理極限：分數是基於時間/幀數 (frame / 10)
-        # 60 FPS 下，每秒最多產生 6 分。
-        max_score = (duration * 6) * TOLERANCE + 10
-        if score > max_score:
-            return False, f"Speed hack: Score {score} > Time Limit {max_score:.0f}"
-        # 邏輯檢測：如果不移動 (moves=0)，很快就會被刺死或摔死
-        if score > 50 and moves < 5:
-            return False, f"No input detected: Score {score} with {moves} moves"
-
-    # === 🦖 Dino 檢測 ===
-    elif game_name == 'dino':
-        jumps = int(data.get('jumps', 0))
-        # 物理極限：計算理論最高分
-        # 遊戲速度隨時間線性增加：Speed(t) = Start + Accel * t
-        # 距離(分數)是速度的積分。這裡用一個簡化寬鬆公式。
-        # 正常玩 60秒約 1000-1500 分。
-        max_possible_score = (duration * 30 + (0.5 * duration**2)) * TOLERANCE + 100
-        if score > max_possible_score:
-            return False, f"Speed hack: Score {score} > Physics Limit {max_possible_score:.0f}"
-        # 邏輯檢測：跳躍檢查
-        # 如果跑了很遠卻沒跳過，除非運氣極好全是天空障礙 (機率極低)
-        if score > 500 and jumps == 0:
-            return False, f"Bot detected: Score {score} with 0 jumps"
-
-    # === 🧠 Memory 檢測 ===
-    elif game_name == 'memory':
-        moves = int(data.get('moves', 0))
-        # 物理極限：最短翻牌時間
-        # 翻開兩張牌 + 判斷 + 下一次點擊，最快也要 0.5~0.8 秒
-        if moves > 0 and (duration / moves) < 0.4:
-            return False, f"Speed clicker: {moves} moves in {duration:.2f}s"
-        # 邏輯檢測：分數計算驗證
-        # 後端重算一次分數，允許微小誤差
-        calc_score = max(0, 1000 - (int(duration) * 2) - (moves * 5))
-        # 如果前端傳來的分數比後端算的還高很多 (例如高出 200 分來自不存在的 combo)
-        if score > calc_score + 300: 
-            return False, f"Score calculation mismatch: Client {score} vs Server {calc_score}"
-
-    # === Hash 檢查 (通用) ===
-    # 注意：這裡只檢查是否有 hash，真正校驗移到 submit_score 中
-    if data.get('hash') is None:
-        print(f"⚠️ Warning: Missing hash for {game_name}")
-        return False, "Missing security hash"
-
-    return True, "Valid"
+    # 各遊戲的門檻與規則宣告在 anticheat.py，啟動時已編譯成 validator
+    is_valid, reason = anticheat.validate(game_name, score, data, duration)
+    if reason == "Missing security hash":
+        log.warning('missing_hash', game=game_name)
+    return is_valid, reason
 
 # --- 頁面路由 ---
+# 預先渲染好的混淆版本池 (見 anticheat_js.py)；每個請求只從記憶體挑一份
+anticheat_variants = anticheat_js.VariantPool(
+    lambda: anticheat_js.render_variant(app.jinja_env.get_template('anticheat.js'), SHARED_SALT)
+)
+
 @app.route('/dynamic/anticheat.js')
 def dynamic_anticheat():
-    # 1. 產生動態變數名稱 (Dynamic Obfuscation)
-    def random_var_name():
-        return ''.join(random.choices(string.ascii_letters, k=8))
-
-    obf = {
-        'var_score': random_var_name(),
-        'var_nonce': random_var_name(),
-        'var_ts': random_var_name(),
-        'var_salt': random_var_name(),
-        'fn_hash': random_var_name(),
-    }
-    
-    # 2. 注入伺服器端的時間戳記修正值 (雖然主要依賴客戶端時間，但可做校時)
-    server_time = int(time.time() * 1000)
-    
-    # 3. 回傳渲染後的 JS (ContentType = application/javascript)
-    # 我們將使用 render_template，需建立 templates/anticheat.js
-    response = render_template('anticheat.js', obf=obf, server_time=server_time, shared_salt=SHARED_SALT)
-    return response, 200, {'Content-Type': 'application/javascript'}
+    etag, body = anticheat_variants.pick(request.if_none_match)
+    if body is None:
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/javascript')
+    response.set_etag(etag)
+    # private：每位玩家各自快取一份；版本輪替後 If-None-Match 不再相符就會拿到新版本
+    response.headers['Cache-Control'] = f'private, max-age={anticheat_js.MAX_AGE}'
+    return response
 
 @app.route('/')
 def home():
@@ -242,7 +255,7 @@ def lobby():
 def game_page(game_name):
     user = get_current_user()
     if not user: return redirect(url_for('home'))
-    if game_name in ['snake', 'dino', 'whac', 'memory', 'tetris', 'shaft']:
+    if game_name in database.GAMES:
         return render_template(f'{game_name}.html', user=user)
     return "Game not found", 404
 
@@ -250,7 +263,7 @@ def game_page(game_name):
 def leaderboard_page():
     user = get_current_user()
     if not user: return redirect(url_for('home'))
-    return render_template('leaderboard.html', user=user)
+    return render_template('leaderboard.html', user=user, live_rank=app.config['LIVE_RANK'])
 
 # --- 商店路由 ---
 @app.route('/shop')
@@ -274,31 +287,43 @@ def profile():
     
     error, success = None, None
     if request.method == 'POST':
-        action = request.form.get('action')
+        # 表單中最大的是頭像上傳：超過上限時 Werkzeug 不解析 multipart，直接丟 413
+        request.max_content_length = avatars.MAX_REQUEST_BYTES
+        try:
+            action = request.form.get('action')
+        except RequestEntityTooLarge:
+            action, error = None, avatars.too_large_message()
         new_avatar_url = None
         
         if action == 'update_id':
             if database.update_username(user['id'], request.form['username']):
+                database.leaderboard_cache.invalidate()
                 session['username'] = request.form['username']
                 success = "Updated!"
             else: error = "ID taken."
             
         elif action == 'upload_avatar':
             f = request.files.get('file')
-            if f and allowed_file(f.filename):
-                fname = secure_filename(f"user_{user['id']}_{f.filename}")
-                f.save(os.path.join(app.config['UPLOAD_FOLDER'], fname))
+            try:
+                if not f or not f.filename:
+                    raise avatars.InvalidAvatar("Invalid file or format.")
+                fname = avatars.save_upload(f.stream)
+            except avatars.InvalidAvatar as e:
+                error = str(e)
+            else:
                 database.update_avatar(user['id'], fname)
+                database.leaderboard_cache.invalidate()
+                avatars.schedule_gc()
                 success = "Avatar updated!"
                 new_avatar_url = url_for('static', filename='uploads/' + fname)
-            else:
-                 error = "Invalid file or format."
 
         elif action == 'apply_preset':
             preset_key = request.form.get('preset')
             preset_url = PRESET_AVATARS.get(preset_key)
             if preset_url:
                 database.update_avatar(user['id'], preset_url)
+                database.leaderboard_cache.invalidate()
+                avatars.schedule_gc()
                 success = "Preset avatar applied!"
                 new_avatar_url = preset_url
             else:
@@ -306,6 +331,8 @@ def profile():
         
         elif action == 'delete_account':
             database.delete_user(user['id'])
+            database.leaderboard_cache.invalidate()
+            avatars.schedule_gc()
             session.clear()
             if is_ajax: return jsonify({'status': 'redirect', 'url': url_for('home')})
             return redirect(url_for('home'))
@@ -316,6 +343,21 @@ def profile():
 
     return render_template('profile.html', user=user, error=error, success=success)
 
+@app.errorhandler(database.Overloaded)
+def handle_overloaded(e):
+    """CPU 密集工作 (密碼雜湊 / 重播驗證) 的執行器已滿：回 503 + Retry-After，讓客戶端稍後重試"""
+    log.warning('overloaded', path=request.path, error=str(e))
+    message = '伺服器忙碌，請稍後再試'
+    if request.path.startswith('/api/'):
+        response = jsonify({'status': 'error', 'message': message})
+    elif request.path == '/register':
+        response = app.make_response(render_template('register.html', error=message))
+    else:
+        response = app.make_response(render_template('login.html', error=message))
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
@@ -351,6 +393,8 @@ def admin_delete(uid):
     if not u or not dict(u).get('is_admin', 0): return jsonify({'status':'error'}), 403
     if uid == u['id']: return jsonify({'status':'error', 'message':'Self-delete'}), 400
     database.delete_user(uid)
+    database.leaderboard_cache.invalidate()
+    avatars.schedule_gc()
     return jsonify({'status':'success'})
 
 @app.route('/admin/user_details/<int:uid>')
@@ -358,7 +402,7 @@ def admin_details(uid):
     u = get_current_user()
     if not u or not dict(u).get('is_admin', 0): return jsonify({'status':'error'}), 403
     scores = database.get_all_scores_by_user(uid)
-    target = database.get_user_by_id(uid)
+    target = u if uid == u['id'] else database.get_user_by_id(uid)
     organized = {}
     for r in scores:
         if r['game_name'] not in organized: organized[r['game_name']] = []
@@ -369,7 +413,9 @@ def admin_details(uid):
         'avatar': target['avatar'],
         'is_admin': bool(target['is_admin']),
         'is_suspect': bool(getattr(target, 'is_suspect', target['is_suspect'] if 'is_suspect' in target.keys() else 0)),
-        'scores': organized
+        'scores': organized,
+        'score_stats': database.get_user_score_stats(uid),
+        'outliers': database.get_score_outliers(uid, limit=20),
     })
 
 # 新增管理員發送警告的 API
@@ -392,6 +438,46 @@ def admin_clear_suspect(uid):
     database.clear_user_suspect(uid)
     return jsonify({'status': 'success'})
 
+@app.route('/admin/stats')
+def admin_stats():
+    """連線池與快取統計 (管理員限定)"""
+    u = get_current_user()
+    if not u or not dict(u).get('is_admin', 0):
+        return jsonify({'status': 'error'}), 403
+    return jsonify({
+        'status': 'success',
+        'db_pool': database.get_pool_stats(),
+        'leaderboard_cache': database.leaderboard_cache.stats(),
+        'rank_stream': database.rank_stream.stats(),
+        'score_writer': database.score_writer_stats(),
+        'rate_limiter': score_rate_limiter.stats(),
+        'anticheat_rules': anticheat.rule_stats(),
+        'anticheat_js': anticheat_variants.stats(),
+        'replay': replay.stats(),
+        'avatars': avatars.stats(),
+        'game_tickets': game_tickets.stats(),
+        'executors': database.executor_stats(),
+        'user_cache': database.user_cache.stats(),
+        'rollup_compactor': database.rollup_compactor.stats(),
+    })
+
+@app.route('/admin/score_stats')
+def admin_score_stats():
+    """各遊戲分數分布與最近的異常分數 (管理員限定)；?user_id= 只看單一玩家"""
+    u = get_current_user()
+    if not u or not dict(u).get('is_admin', 0):
+        return jsonify({'status': 'error'}), 403
+    uid = request.args.get('user_id', type=int)
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    result = {
+        'status': 'success',
+        'games': database.get_score_stats(),
+        'outliers': database.get_score_outliers(uid, limit=limit),
+    }
+    if uid is not None:
+        result['user'] = database.get_user_score_stats(uid)
+    return jsonify(result)
+
 # ==========================================
 # 🚀 API 路由 (含防作弊檢查)
 # ==========================================
@@ -399,61 +485,60 @@ def admin_clear_suspect(uid):
 @app.route('/api/start_game', methods=['POST'])
 def start_game():
     if 'user_id' not in session: return jsonify({'status': 'error'}), 401
-    data = request.get_json()
-    session['game_start_time'] = time.time()
-    session['current_game'] = data.get('game_name')
-    
-    # 產生並儲存 Nonce (隨機字串)
-    nonce = uuid.uuid4().hex
-    session['game_nonce'] = nonce
+    data = request.get_json(silent=True) or {}
+    game_name = data.get('game_name')
+    if game_name not in database.GAMES:
+        return jsonify({'status': 'error', 'message': '未知的遊戲'}), 400
+
+    # 簽發票券 (開始時間、Nonce、重播驗證用的亂數種子都在票券裡，不修改 session)
+    token, ticket = game_tickets.issue(session['user_id'], game_name)
 
-    print(f"🎮 Start: {session['current_game']} by {session['username']} | Nonce: {nonce[:8]}...")
+    log.info('game_started', user=session['username'], game=game_name, nonce=ticket.nonce[:8])
     
-    # 將 Nonce 回傳給前端
-    return jsonify({'status': 'success', 'nonce': nonce})
+    # Nonce 供前端計算雜湊，seed 供 Snake 食物位置 / Tetris 方塊順序 (見 replay.py)，ticket 送分數時帶回
+    return jsonify({'status': 'success', 'nonce': ticket.nonce, 'seed': ticket.seed, 'ticket': token})
 
 @app.route('/api/submit_score', methods=['POST'])
 def submit_score():
     # 1) 基本身分 / 遊戲狀態檢查
     if 'user_id' not in session:
         return jsonify({'status': 'error', 'message': '未登入'}), 401
-    if 'game_start_time' not in session:
-        return jsonify({'status': 'error', 'message': '遊戲狀態失效，請重新開始'}), 400
     if not request.is_json:
         return jsonify({'status': 'error', 'message': '格式錯誤，必須為 JSON'}), 400
 
-    user_id = session['user_id']
+    body, status = process_score_submission(session['user_id'], session['username'], request.get_json(silent=True) or {})
+    return jsonify(body), status
 
-    # 2) 簡單頻率限制：同一 user 在 60 秒內最多送 30 次
+def process_score_submission(user_id, username, data):
+    """送分數的檢查與寫入 (Flask 路由與 asgi.py 共用)；回傳 (JSON 內容, 狀態碼)"""
+    # 2) 頻率限制：同一 user 在 60 秒內最多送 30 次
     now_ts = time.time()
-    history = _score_submit_log.get(user_id, [])
-    history = [t for t in history if now_ts - t < RATE_LIMIT_WINDOW]
-    if len(history) >= RATE_LIMIT_MAX_SUBMITS:
-        _score_submit_log[user_id] = history
-        return jsonify({'status': 'error', 'message': '送分數過於頻繁，請稍後再試'}), 429
-    history.append(now_ts)
-    _score_submit_log[user_id] = history
+    if not score_rate_limiter.hit(user_id, now_ts):
+        rate_limit_rejections.inc('score_submit')
+        return {'status': 'error', 'message': '送分數過於頻繁，請稍後再試'}, 429
 
-    data = request.get_json(silent=True) or {}
     try:
         score = int(data.get('score', 0))
     except (TypeError, ValueError):
-        return jsonify({'status': 'error', 'message': '分數格式錯誤'}), 400
+        return {'status': 'error', 'message': '分數格式錯誤'}, 400
 
     game_name = data.get('game_name')
     if not isinstance(game_name, str):
-        return jsonify({'status': 'error', 'message': '遊戲名稱格式錯誤'}), 400
+        return {'status': 'error', 'message': '遊戲名稱格式錯誤'}, 400
     
-    # 3) 驗證雜湊 (Hash Check)
-    # 取出 session 中的 nonce
-    server_nonce = session.get('game_nonce')
+    # 3) 驗證遊戲票券 (簽章、擁有者、有效期限、是否已提交過)
+    try:
+        ticket = game_tickets.check(data.get('ticket'), user_id)
+    except game_ticket.InvalidTicket as e:
+        anticheat_rejections.inc(game_label(game_name), 'invalid_ticket')
+        return {'status': 'error', 'message': f'遊戲狀態失效，請重新開始 ({e})'}, 400
+
+    # 4) 驗證雜湊 (Hash Check)
+    server_nonce = ticket.nonce
     raw_hash_payload = data.get('hash')
     
-    if not server_nonce:
-        return jsonify({'status': 'error', 'message': '無效的遊戲 session (Nonce missing)'}), 400
-    
     if not raw_hash_payload:
-        return jsonify({'status': 'error', 'message': '缺少安全驗證碼 (Hash missing)'}), 400
+        return {'status': 'error', 'message': '缺少安全驗證碼 (Hash missing)'}, 400
 
     # 支援格式: "HASH" (舊版, 不允許) 或 "HASH|TIMESTAMP" (新版)
     if '|' in raw_hash_payload:
@@ -461,89 +546,216 @@ def submit_score():
     else:
         # 如果前端沒有改，我們可以暫時允許或直接拒絕
         # 為了強制執行時間戳記驗證，這裡直接拒絕
-        return jsonify({'status': 'error', 'message': '驗證碼格式過時，請重新整理頁面'}), 400
+        return {'status': 'error', 'message': '驗證碼格式過時，請重新整理頁面'}, 400
 
-    # 4) 時間戳記驗證 (Timestamp Validation)
+    # 5) 時間戳記驗證 (Timestamp Validation)
     try:
         client_ts_int = int(client_ts)
         server_ts_int = int(time.time() * 1000)
         # 檢查是否過期 (Token 有效視窗期)
         if abs(server_ts_int - client_ts_int) > TIMESTAMP_TOLERANCE_MS:
-             return jsonify({'status': 'error', 'message': '安全憑證已過期 (Timestamp expired)'}), 400
+             return {'status': 'error', 'message': '安全憑證已過期 (Timestamp expired)'}, 400
     except ValueError:
-        return jsonify({'status': 'error', 'message': '時間戳記格式錯誤'}), 400
+        return {'status': 'error', 'message': '時間戳記格式錯誤'}, 400
 
     # 計算預期雜湊: sha256(score:nonce:timestamp:salt)
     # 注意順序必須與前端/Wasm 一致
+    # 單次 SHA-256 只要約 1µs，比送到 process pool 的來回還便宜，所以不經過執行器
     expected_str = f"{score}:{server_nonce}:{client_ts}:{SHARED_SALT}"
     expected_hash = hashlib.sha256(expected_str.encode()).hexdigest()
 
     if client_hash != expected_hash:
-        print(f"🛑 SECURITY ALERT: Hash mismatch! User: {session['username']}")
-        print(f"   Score: {score}, Nonce: {server_nonce}")
-        print(f"   Client Hash: {client_hash}")
-        print(f"   Server Hash: {expected_hash}")
-        return jsonify({'status': 'error', 'message': 'Security verification failed (Invalid Hash)'}), 400
+        anticheat_rejections.inc(game_label(game_name), 'hash_mismatch')
+        log.warning(
+            'hash_mismatch', user=username, game=game_name, score=score,
+            nonce=server_nonce, client_hash=client_hash, expected_hash=expected_hash,
+        )
+        return {'status': 'error', 'message': 'Security verification failed (Invalid Hash)'}, 400
 
     # 計算真實遊玩時間
-    start_time = session.get('game_start_time')
-    current_time = now_ts
-    duration = current_time - start_time
+    duration = now_ts - ticket.start_time
     
-    if session.get('current_game') != game_name:
-        return jsonify({'status': 'error', 'message': '遊戲種類不一致'}), 400
+    if ticket.game_name != game_name:
+        return {'status': 'error', 'message': '遊戲種類不一致'}, 400
     
     # 執行邏輯驗證
     is_valid, reason = validate_game_logic(game_name, score, data, duration=duration)
+
+    # 重播驗證 (Snake / Tetris)：以 start_game 的 seed 重新模擬，算出真正的分數
+    if is_valid and game_name in replay.SIMULATORS:
+        payload = data.get('replay')
+        if payload is not None:
+            # 伺服器忙碌時丟 Overloaded (由 handle_overloaded 回 503)，票券尚未使用，前端可以重送
+            is_valid, reason = replay.verify(game_name, ticket.seed, payload, score, data, duration)
+        elif replay.REQUIRED:
+            return {'status': 'error', 'message': '缺少重播資料，請重新整理頁面'}, 400
     
-    # 驗證後再清除 Session
-    session.pop('game_start_time', None)
-    session.pop('current_game', None)
-    session.pop('game_nonce', None)
+    # 驗證後才標記票券已使用；同一張票券同時送出時只有一個請求會通過
+    if not game_tickets.redeem(ticket):
+        anticheat_rejections.inc(game_label(game_name), 'invalid_ticket')
+        return {'status': 'error', 'message': '遊戲狀態失效，請重新開始 (Ticket already used)'}, 400
 
     if not is_valid:
-        print(f"🚫 CHEAT BLOCKED: User {session['username']} | {game_name} | Score: {score} | Time: {duration:.2f}s | Reason: {reason}")
+        anticheat_rejections.inc(game_label(game_name), reason_label(reason))
+        log.warning(
+            'cheat_blocked', user=username, game=game_name, score=score,
+            duration=round(duration, 2), reason=reason,
+        )
         
         # 自動標記為嫌疑犯
         database.mark_user_suspect(user_id)
 
-        return jsonify({'status': 'error', 'message': f'偵測到異常數據: {reason}'}), 400
+        return {'status': 'error', 'message': f'偵測到異常數據: {reason}'}, 400
 
-    database.insert_score(user_id, game_name, score)
-    return jsonify({'status': 'success'})
+    database.save_score(user_id, game_name, score, duration, anticheat.parse_fields(game_name, data))
+    return {'status': 'success'}, 200
 
 @app.route('/api/get_rank/<g>')
-def rank(g): return jsonify(database.get_leaderboard(g))
+def rank(g):
+    error, etag, build, private = rank_query(g, request.args, session.get('user_id'))
+    if error is not None:
+        return jsonify(error[0]), error[1]
+    if etag is None:
+        return jsonify(build())
+    response = conditional_json(etag, build, cache_control='private, no-cache' if private else 'no-cache')
+    if private:
+        response.vary.add('Cookie')
+    return response
+
+RANK_PAGE_MAX = 100     # ?limit= 上限
+RANK_RADIUS_MAX = 25    # ?around=me&radius= 上限
+
+def int_arg(args, name, default, low, high):
+    """查詢參數轉整數並檢查範圍；不合法時回傳 None"""
+    try:
+        value = int(args.get(name, default))
+    except (TypeError, ValueError):
+        return None
+    return value if low <= value <= high else None
+
+def rank_query(g, args, user_id):
+    """
+    解析 /api/get_rank/<g> 的查詢參數 (Flask 路由與 asgi.py 共用)，不查 DB。
+    回傳 (錯誤 (JSON 內容, 狀態碼) 或 None, ETag 或 None, build(), 是否依使用者而異)
+
+        (無參數)                    前 10 名 (list)
+        ?window=day|week|season     目前期間的排行榜 (預設 all = 歷來最佳)
+        ?limit=50&cursor=...        完整排行榜的一頁 {rows, next_cursor} (keyset 分頁)
+        ?around=me&radius=5         自己與前後各 radius 名 {rows, rank} (需登入)
+    """
+    window = args.get('window', 'all')
+    if window not in database.LEADERBOARD_WINDOWS:
+        return ({'status': 'error', 'message': 'Unknown window'}, 400), None, None, False
+
+    if 'around' in args:
+        if user_id is None:
+            return ({'status': 'error', 'message': 'Login required'}, 401), None, None, False
+        radius = int_arg(args, 'radius', 5, 1, RANK_RADIUS_MAX)
+        if radius is None:
+            return ({'status': 'error', 'message': 'Invalid radius'}, 400), None, None, False
+        view, private = f'around-{user_id}-{radius}', True
+        build = lambda: database.get_leaderboard_around(g, user_id, radius, window)
+    elif 'cursor' in args or 'limit' in args:
+        limit = int_arg(args, 'limit', 50, 1, RANK_PAGE_MAX)
+        cursor = args.get('cursor') or None
+        try:
+            if cursor is not None:
+                database.parse_rank_cursor(cursor)
+        except ValueError:
+            limit = None
+        if limit is None:
+            return ({'status': 'error', 'message': 'Invalid cursor or limit'}, 400), None, None, False
+        view, private = f'page-{limit}-{cursor or 0}', False
+        build = lambda: database.get_leaderboard_page(g, cursor, limit, window)
+    elif window == 'all':
+        view, private = None, False
+        build = lambda: database.leaderboard_cache.get(g)
+    else:
+        view, private = None, False
+        build = lambda: database.get_leaderboard(g, window)
+
+    if g not in database.GAMES:
+        return None, None, build, private
+    epoch = database.version_store.epoch
+    board = database.leaderboard_cache.version(g)
+    if window == 'all' and view is None:
+        return None, f"lb-{epoch}-{g}-{board}", build, False
+    # 其他檢視沒有另外快取：任何新分數 (scores 版本號) 或玩家資料變動 (board 版本號) 都換 ETag，
+    # 時間窗的期間寫在 ETag 裡，跨日 / 跨週自動失效
+    version, = database.get_score_versions((g,))
+    period = database.period_key(window) if window != 'all' else 'all'
+    etag = f"lb-{epoch}-{g}-{window}-{period}-{version}.{board}"
+    if view is not None:
+        etag += f"-{view}"
+    return None, etag, build, private
+
+@app.route('/api/stream/rank/<g>')
+def stream_rank(g):
+    """
+    前 N 名的即時推播 (Server-Sent Events)：連線後先送 snapshot，之後只在名次變動時送 diff。
+    在這裡每個連線佔用一條執行緒；大量訂閱者請以 gevent worker 執行 (gunicorn -k gevent)，
+    或改用 asgi.py (在事件迴圈上原生處理，不佔執行緒)。
+    """
+    if g not in database.GAMES:
+        return jsonify({'status': 'error', 'message': 'Unknown game'}), 404
+    try:
+        events = database.rank_stream.subscribe(g, request.headers.get('Last-Event-ID'))
+    except database.TooManySubscribers:
+        response = jsonify({'status': 'error', 'message': '伺服器忙碌，請稍後再試'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    response = app.response_class(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # 避免 nginx 之類的反向代理緩衝整個回應
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/api/get_my_best_scores')
 def my_best():
-    u = get_current_user()
-    return jsonify(database.get_all_best_scores_by_user_with_rank(u['id'])) if u else jsonify({})
+    user_id = session.get('user_id')
+    if user_id is None:
+        return jsonify({})
+    # 任何遊戲有新分數都可能改變名次，所以 ETag 包含全部遊戲的版本號
+    versions = '.'.join(map(str, database.get_score_versions()))
+    etag = f"best-{database.version_store.epoch}-{user_id}-{versions}"
+    response = conditional_json(
+        etag,
+        lambda: database.get_all_best_scores_by_user_with_rank(user_id),
+        cache_control='private, no-cache',
+    )
+    response.vary.add('Cookie')
+    return response
 
 # --- 商店 API ---
 @app.route('/api/buy', methods=['POST'])
 def api_buy():
     if 'user_id' not in session: return jsonify({'status': 'error', 'message': 'Login required'}), 401
     data = request.get_json()
-    item_id = data.get('item_id')
-    
+    body, status = buy_item(session['user_id'], data.get('item_id'))
+    return jsonify(body), status
+
+def buy_item(user_id, item_id):
+    """購買商品 (Flask 路由與 asgi.py 共用)；回傳 (JSON 內容, 狀態碼)"""
     item = SHOP_ITEMS.get(item_id)
-    if not item: return jsonify({'status': 'error', 'message': 'Invalid item'}), 400
+    if not item: return {'status': 'error', 'message': 'Invalid item'}, 400
     if item['type'] == 'avatar':
-        return jsonify({'status': 'error', 'message': 'Avatar purchases are disabled; please upload your own avatar in profile settings.'}), 400
+        return {'status': 'error', 'message': 'Avatar purchases are disabled; please upload your own avatar in profile settings.'}, 400
     
-    success, msg = database.purchase_item(session['user_id'], item_id, item['type'], item['price'])
+    success, msg = database.purchase_item(user_id, item_id, item['type'], item['price'])
     if success:
-        return jsonify({'status': 'success', 'new_balance': database.get_wallet_info(session['user_id'])['balance']})
+        return {'status': 'success', 'new_balance': database.get_wallet_info(user_id)['balance']}, 200
     else:
-        return jsonify({'status': 'error', 'message': msg})
+        return {'status': 'error', 'message': msg}, 200
 
 @app.route('/api/equip', methods=['POST'])
 def api_equip():
     if 'user_id' not in session: return jsonify({'status': 'error', 'message': 'Login required'}), 401
     data = request.get_json()
-    item_id = data.get('item_id')
-    
+    body, status = equip_shop_item(session['user_id'], data.get('item_id'))
+    return jsonify(body), status
+
+def equip_shop_item(user_id, item_id):
+    """裝備 / 卸下商品 (Flask 路由與 asgi.py 共用)；回傳 (JSON 內容, 狀態碼)"""
     unequip_map = {
         'unequip_title': ('title', ''),
         'unequip_frame': ('avatar_frame', ''),
@@ -551,20 +763,22 @@ def api_equip():
     }
     if item_id in unequip_map:
         item_type, value = unequip_map[item_id]
-        database.equip_item(session['user_id'], item_type, value)
-        return jsonify({'status': 'success'})
+        database.equip_item(user_id, item_type, value)
+        database.leaderboard_cache.invalidate()
+        return {'status': 'success'}, 200
         
     item = SHOP_ITEMS.get(item_id)
-    if not item: return jsonify({'status': 'error', 'message': 'Invalid item'}), 400
+    if not item: return {'status': 'error', 'message': 'Invalid item'}, 400
     if item['type'] == 'avatar':
-        return jsonify({'status': 'error', 'message': 'Avatar equips are disabled; please upload your own avatar in profile settings.'}), 400
+        return {'status': 'error', 'message': 'Avatar equips are disabled; please upload your own avatar in profile settings.'}, 400
     
-    owned = database.get_user_items(session['user_id'])
+    owned = database.get_user_items(user_id)
     if item_id not in owned:
-         return jsonify({'status': 'error', 'message': 'You do not own this item'}), 403
+         return {'status': 'error', 'message': 'You do not own this item'}, 403
          
-    database.equip_item(session['user_id'], item['type'], item['value'])
-    return jsonify({'status': 'success'})
+    database.equip_item(user_id, item['type'], item['value'])
+    database.leaderboard_cache.invalidate()
+    return {'status': 'success'}, 200
 
 if __name__ == '__main__':
     # 開發時可用 debug=True，實際上線請改為 False 或使用 WSGI 伺服器
@@ -0,0 +1,424 @@
+"""
+ASGI 進入點：遊戲 API 以 async handler 處理，不必每個連線佔用一條 worker 執行緒。
+
+    uvicorn asgi:app --workers 4            (或 hypercorn asgi:app)
+
+- 原生處理 start_game / submit_score / get_rank / get_my_best_scores / buy / equip，
+  檢查邏輯與 app.py 共用 (process_score_submission、buy_item、equip_shop_item)
+- 排行榜 SSE (/api/stream/rank/<g>) 也在事件迴圈上原生處理 (rank_stream.aevents)，
+  閒置訂閱者不佔執行緒，開再多連線也不會耗盡處理頁面的執行緒池
+- 事件迴圈只做解析、session 驗章、ETag 比對；會碰 SQLite 的呼叫都透過 db_call() 送到專用執行緒池，
+  池的大小預設等於連線池 (ARCADE_DB_POOL_SIZE)，同時進行的查詢數不會超過可用連線
+- database 的函式維持同步介面，app.py (WSGI) 照常使用
+- 其他路徑 (頁面、登入、/admin、/metrics) 交給原本的 Flask app，在另一個執行緒池執行
+
+    ARCADE_ASGI_DB_THREADS=8        資料庫執行緒池大小
+    ARCADE_ASGI_WSGI_THREADS=16     執行 Flask 路由的執行緒池大小
+    ARCADE_ASGI_MAX_BODY=1048576    API 請求本文上限 (bytes)，超過回 413
+                                    (/profile 的頭像上傳另以 ARCADE_AVATAR_MAX_BYTES 為準，見 avatars.py)
+"""
+
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qsl
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie, parse_etags, quote_etag
+
+import app as arcade
+import avatars
+import database
+from database.pool import DEFAULT_POOL_SIZE
+
+DB_THREADS = int(os.environ.get('ARCADE_ASGI_DB_THREADS', DEFAULT_POOL_SIZE))
+WSGI_THREADS = int(os.environ.get('ARCADE_ASGI_WSGI_THREADS', '16'))
+MAX_BODY = int(os.environ.get('ARCADE_ASGI_MAX_BODY', str(1024 * 1024)))
+
+flask_app = arcade.app
+# SSE 在這裡原生處理，排行榜頁可以使用即時推播
+flask_app.config['LIVE_RANK'] = True
+log = arcade.log
+db_pool = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix='asgi-db')
+wsgi_pool = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+
+_session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+_session_max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+
+
+async def db_call(fn, *args):
+    """在資料庫執行緒池執行同步函式並等待結果"""
+    return await asyncio.get_running_loop().run_in_executor(db_pool, fn, *args)
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        # 與 request.args.get 相同：同名參數取第一個
+        self.args = {}
+        for key, value in parse_qsl(scope.get('query_string', b'').decode('latin-1')):
+            self.args.setdefault(key, value)
+        self.headers = {}
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').lower()
+            value = value.decode('latin-1')
+            # 重複的標頭依 RFC 9110 以逗號合併 (Cookie 以分號)
+            sep = '; ' if name == 'cookie' else ', '
+            self.headers[name] = self.headers[name] + sep + value if name in self.headers else value
+        self.body = body
+        self._session = None
+
+    @property
+    def session(self):
+        """解開 Flask 的 session cookie (唯讀；這些 API 不修改 session)"""
+        if self._session is None:
+            value = parse_cookie(self.headers.get('cookie')).get(flask_app.config['SESSION_COOKIE_NAME'])
+            self._session = {}
+            if value:
+                try:
+                    self._session = _session_serializer.loads(value, max_age=_session_max_age)
+                except BadSignature:
+                    pass
+        return self._session
+
+    @property
+    def is_json(self):
+        mimetype = self.headers.get('content-type', '').split(';', 1)[0].strip().lower()
+        return mimetype == 'application/json' or (mimetype.startswith('application/') and mimetype.endswith('+json'))
+
+    def json(self):
+        """與 request.get_json(silent=True) 相同：格式錯誤回傳 None；非物件一律視為 {}"""
+        if not self.is_json:
+            return None
+        try:
+            data = flask_app.json.loads(self.body)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else {}
+
+
+class Response:
+    def __init__(self, body=b'', status=200, headers=None, content_type=None):
+        self.body = body
+        self.status = status
+        self.headers = list(headers or [])
+        if content_type:
+            self.headers.append(('content-type', content_type))
+
+    async def send(self, send):
+        headers = [(k.encode('latin-1'), v.encode('latin-1')) for k, v in self.headers]
+        headers.append((b'content-length', str(len(self.body)).encode()))
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': self.body})
+
+
+def json_response(data, status=200, headers=None):
+    # 與 jsonify 相同的序列化設定 (flask_app.json)，輸出內容和 WSGI 版本一致
+    body = (flask_app.json.dumps(data) + '\n').encode()
+    return Response(body, status, headers, 'application/json')
+
+
+async def conditional_json(request, etag, build, cache_control='no-cache'):
+    """app.conditional_json 的 async 版：If-None-Match 相符時不進資料庫執行緒池"""
+    headers = [('etag', quote_etag(etag)), ('cache-control', cache_control)]
+    if etag in parse_etags(request.headers.get('if-none-match')):
+        return Response(b'', 304, headers)
+    return json_response(await db_call(build), headers=headers)
+
+
+# --- API 路由 ---
+def login_required(message):
+    return json_response({'status': 'error', 'message': message} if message else {'status': 'error'}, 401)
+
+
+async def start_game(request):
+    session = request.session
+    if 'user_id' not in session:
+        return login_required(None)
+    data = request.json() or {}
+    game_name = data.get('game_name')
+    if game_name not in database.GAMES:
+        return json_response({'status': 'error', 'message': '未知的遊戲'}, 400)
+    # 只有簽章運算，不碰資料庫
+    token, ticket = arcade.game_tickets.issue(session['user_id'], game_name)
+    log.info('game_started', user=session['username'], game=game_name, nonce=ticket.nonce[:8])
+    return json_response({'status': 'success', 'nonce': ticket.nonce, 'seed': ticket.seed, 'ticket': token})
+
+
+async def submit_score(request):
+    session = request.session
+    if 'user_id' not in session:
+        return json_response({'status': 'error', 'message': '未登入'}, 401)
+    if not request.is_json:
+        return json_response({'status': 'error', 'message': '格式錯誤，必須為 JSON'}, 400)
+    # 頻率限制、票券、重播驗證與寫入都可能碰 SQLite (或等待重播執行器)，整段在資料庫執行緒池執行
+    body, status = await db_call(
+        arcade.process_score_submission, session['user_id'], session['username'], request.json() or {}
+    )
+    return json_response(body, status)
+
+
+async def get_rank(request, game_name):
+    error, etag, build, private = arcade.rank_query(game_name, request.args, request.session.get('user_id'))
+    if error is not None:
+        return json_response(*error)
+    if etag is None:
+        return json_response(await db_call(build))
+    response = await conditional_json(request, etag, build, 'private, no-cache' if private else 'no-cache')
+    if private:
+        response.headers.append(('vary', 'Cookie'))
+    return response
+
+
+async def get_my_best_scores(request):
+    user_id = request.session.get('user_id')
+    if user_id is None:
+        return json_response({})
+    versions = '.'.join(map(str, database.get_score_versions()))
+    etag = f'best-{database.version_store.epoch}-{user_id}-{versions}'
+    response = await conditional_json(
+        request, etag,
+        lambda: database.get_all_best_scores_by_user_with_rank(user_id),
+        cache_control='private, no-cache',
+    )
+    response.headers.append(('vary', 'Cookie'))
+    return response
+
+
+def shop_action(fn):
+    async def handler(request):
+        session = request.session
+        if 'user_id' not in session:
+            return login_required('Login required')
+        if not request.is_json:
+            return json_response({'status': 'error', 'message': 'Request body must be JSON'}, 415)
+        data = request.json()
+        if data is None:
+            return json_response({'status': 'error', 'message': 'Invalid JSON'}, 400)
+        body, status = await db_call(fn, session['user_id'], data.get('item_id'))
+        return json_response(body, status)
+    return handler
+
+
+# (method, 路徑) -> (handler, metrics 用的路由名稱 = app.py 的 url rule)；/api/get_rank/<g> 另外比對
+ROUTES = {
+    ('POST', '/api/start_game'): (start_game, '/api/start_game'),
+    ('POST', '/api/submit_score'): (submit_score, '/api/submit_score'),
+    ('GET', '/api/get_my_best_scores'): (get_my_best_scores, '/api/get_my_best_scores'),
+    ('POST', '/api/buy'): (shop_action(arcade.buy_item), '/api/buy'),
+    ('POST', '/api/equip'): (shop_action(arcade.equip_shop_item), '/api/equip'),
+}
+RANK_PREFIX = '/api/get_rank/'
+STREAM_PREFIX = '/api/stream/rank/'
+
+
+def match(method, path):
+    """回傳 (handler, 參數, 路由名稱)；不是原生路由時回傳 None (交給 Flask)"""
+    route = ROUTES.get((method, path))
+    if route is not None:
+        return route[0], (), route[1]
+    if method == 'GET' and path.startswith(RANK_PREFIX):
+        game_name = path[len(RANK_PREFIX):]
+        if game_name and '/' not in game_name:
+            return get_rank, (game_name,), '/api/get_rank/<g>'
+    return None
+
+
+async def read_body(receive, limit=None):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if limit is not None and size > limit:
+            return False
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def handle_api(scope, receive, send, handler, args, route):
+    start = time.perf_counter()
+    body = await read_body(receive, MAX_BODY)
+    if body is None:
+        return
+    if body is False:
+        response = json_response({'status': 'error', 'message': 'Request body too large'}, 413)
+    else:
+        request = Request(scope, body)
+        try:
+            response = await handler(request, *args)
+        except database.Overloaded as e:
+            log.warning('overloaded', path=request.path, error=str(e))
+            response = json_response(
+                {'status': 'error', 'message': '伺服器忙碌，請稍後再試'}, 503, [('retry-after', str(e.retry_after))]
+            )
+        except Exception:
+            log.exception('asgi_error', path=request.path)
+            response = json_response({'status': 'error', 'message': 'Internal Server Error'}, 500)
+    arcade.request_seconds.observe(time.perf_counter() - start, scope['method'], route, str(response.status))
+    await response.send(send)
+
+
+# --- 其他路徑：在執行緒池中執行原本的 Flask app (WSGI) ---
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = name
+        else:
+            key = 'HTTP_' + name
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+_END = object()
+
+
+# --- 排行榜 SSE ---
+async def stream_rank(scope, receive, send, game_name):
+    """app.stream_rank 的原生版本：事件迴圈上等待 channel，斷線時立即歸還訂閱名額"""
+    body = await read_body(receive)
+    if body is None:
+        return
+    start = time.perf_counter()
+    request = Request(scope, body)
+    route = '/api/stream/rank/<g>'
+    if game_name not in database.GAMES:
+        response = json_response({'status': 'error', 'message': 'Unknown game'}, 404)
+    else:
+        try:
+            channel = await db_call(database.rank_stream.acquire, game_name)
+        except database.TooManySubscribers:
+            response = json_response({'status': 'error', 'message': '伺服器忙碌，請稍後再試'}, 503, [('retry-after', '5')])
+        except Exception:
+            log.exception('asgi_error', path=request.path)
+            response = json_response({'status': 'error', 'message': 'Internal Server Error'}, 500)
+        else:
+            arcade.request_seconds.observe(time.perf_counter() - start, scope['method'], route, '200')
+            try:
+                await send_events(receive, send, database.rank_stream.aevents(channel, request.headers.get('last-event-id')))
+            finally:
+                database.rank_stream.unsubscribe()
+            return
+    arcade.request_seconds.observe(time.perf_counter() - start, scope['method'], route, str(response.status))
+    await response.send(send)
+
+
+async def send_events(receive, send, events):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        # 避免 nginx 之類的反向代理緩衝整個回應
+        (b'x-accel-buffering', b'no'),
+    ]})
+    disconnected = asyncio.ensure_future(receive())
+    chunk = None
+    try:
+        while True:
+            chunk = asyncio.ensure_future(events.__anext__())
+            await asyncio.wait((chunk, disconnected), return_when=asyncio.FIRST_COMPLETED)
+            if not chunk.done():
+                break
+            await send({'type': 'http.response.body', 'body': chunk.result().encode(), 'more_body': True})
+    finally:
+        disconnected.cancel()
+        if chunk is not None and not chunk.done():
+            # 等 generator 處理完取消 (移除 waiter) 才能 aclose
+            chunk.cancel()
+            await asyncio.wait((chunk,))
+        await events.aclose()
+
+
+async def call_wsgi(scope, receive, send):
+    # 交給 Flask 前要先讀完本文：頭像上傳在這裡就限制大小，不把超大的本文整個放進記憶體
+    body = await read_body(receive, avatars.MAX_REQUEST_BYTES if scope['path'] == '/profile' else None)
+    if body is None:
+        return
+    if body is False:
+        await Response(b'Request body too large\n', 413, content_type='text/plain').send(send)
+        return
+    loop = asyncio.get_running_loop()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    # 串流回應時用來偵測客戶端斷線
+    disconnected = asyncio.ensure_future(receive())
+    iterable = await loop.run_in_executor(wsgi_pool, flask_app, wsgi_environ(scope, body), start_response)
+    try:
+        iterator = iter(iterable)
+        await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+        while not disconnected.done():
+            chunk = await loop.run_in_executor(wsgi_pool, next, iterator, _END)
+            if chunk is _END:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            await loop.run_in_executor(wsgi_pool, close)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            db_pool.shutdown(wait=False)
+            wsgi_pool.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    if scope['method'] == 'GET' and scope['path'].startswith(STREAM_PREFIX):
+        game_name = scope['path'][len(STREAM_PREFIX):]
+        if game_name and '/' not in game_name:
+            await stream_rank(scope, receive, send, game_name)
+            return
+    route = match(scope['method'], scope['path'])
+    if route is None:
+        await call_wsgi(scope, receive, send)
+    else:
+        await handle_api(scope, receive, send, *route)
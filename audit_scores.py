@@ -0,0 +1,254 @@
+"""
+以 NumPy 向量化方式重新驗證 scores 歷史紀錄 (調整 anticheat.py 門檻後使用)。
+
+    python audit_scores.py                              # 只輸出報告
+    python audit_scores.py --report suspects.csv        # 指定報告路徑
+    python audit_scores.py --mark-suspects              # 一併標記違規玩家
+    python audit_scores.py --game snake --chunk 200000
+
+門檻直接讀取 anticheat.GAME_SPECS，規則與線上的 validator 對應。
+缺少 duration / moves 等欄位的舊紀錄 (NaN) 不會被需要該欄位的規則判定違規；
+另外提供只依分數本身就能判斷的規則 (whac 分數必須是 10 的倍數、memory 分數上限)。
+"""
+
+import argparse
+import csv
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 只有這支離線工具需要 numpy
+    np = None
+
+import anticheat
+import database
+
+TOLERANCE = anticheat.TOLERANCE
+COMMON = anticheat.COMMON_LIMITS
+
+# game_name -> [(rule_name, fn(score, duration, f, L) -> 違規的 bool mask)]
+VECTOR_RULES = {}
+
+
+def vector_rule(game_name, name):
+    def decorator(fn):
+        VECTOR_RULES.setdefault(game_name, []).append((name, fn))
+        return fn
+    return decorator
+
+
+# === 共用 ===
+@vector_rule(None, 'reaction_time')
+def _reaction_time(score, dur, f, L):
+    return (score > L['min_score_for_reaction_check']) & (dur < L['min_duration'])
+
+
+# === 🐍 Snake ===
+@vector_rule('snake', 'speed_hack')
+def _snake_speed(score, dur, f, L):
+    return f['moves'] > (dur * L['moves_per_second']) * TOLERANCE + L['moves_slack']
+
+
+@vector_rule('snake', 'teleport')
+def _snake_teleport(score, dur, f, L):
+    return (score > L['teleport_min_score']) & (f['moves'] < score * L['min_moves_per_point'])
+
+
+# === 🧱 Tetris ===
+@vector_rule('tetris', 'auto_dropper')
+def _tetris_pieces(score, dur, f, L):
+    return f['pieces'] > (dur * L['pieces_per_second']) * TOLERANCE + L['pieces_slack']
+
+
+@vector_rule('tetris', 'efficiency')
+def _tetris_efficiency(score, dur, f, L):
+    return f['lines'] > f['pieces'] * L['max_lines_per_piece']
+
+
+@vector_rule('tetris', 'score_limit')
+def _tetris_score(score, dur, f, L):
+    max_total = (
+        f['lines'] * L['line_score_per_level'] * (f['level'] + 1) * L['line_score_tolerance']
+        + f['pieces'] * L['drop_score_per_piece']
+        + L['score_slack']
+    )
+    return score > max_total
+
+
+# === 🔨 Whac-A-Mole ===
+@vector_rule('whac', 'score_manipulation')
+def _whac_score(score, dur, f, L):
+    hits = f['hits']
+    return ~np.isnan(hits) & (score != hits * L['points_per_hit'])
+
+
+@vector_rule('whac', 'score_multiple')
+def _whac_multiple(score, dur, f, L):
+    # 不需要 hits：分數一定是 points_per_hit 的倍數
+    return np.mod(score, L['points_per_hit']) != 0
+
+
+@vector_rule('whac', 'auto_clicker')
+def _whac_cps(score, dur, f, L):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (dur > L['cps_min_duration']) & (f['hits'] / dur > L['max_cps'])
+
+
+# === 🪜 Shaft ===
+@vector_rule('shaft', 'speed_hack')
+def _shaft_speed(score, dur, f, L):
+    return score > (dur * L['score_per_second']) * TOLERANCE + L['score_slack']
+
+
+@vector_rule('shaft', 'no_input')
+def _shaft_idle(score, dur, f, L):
+    return (score > L['idle_min_score']) & (f['moves'] < L['idle_min_moves'])
+
+
+# === 🦖 Dino ===
+@vector_rule('dino', 'speed_hack')
+def _dino_speed(score, dur, f, L):
+    return score > (dur * L['base_speed'] + L['acceleration'] * dur ** 2) * TOLERANCE + L['score_slack']
+
+
+@vector_rule('dino', 'no_jumps')
+def _dino_jumps(score, dur, f, L):
+    return (score > L['jumpless_max_score']) & (f['jumps'] == 0)
+
+
+# === 🧠 Memory ===
+@vector_rule('memory', 'speed_clicker')
+def _memory_speed(score, dur, f, L):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (f['moves'] > 0) & (dur / f['moves'] < L['min_seconds_per_move'])
+
+
+@vector_rule('memory', 'score_recalc')
+def _memory_score(score, dur, f, L):
+    calc = np.maximum(0, L['base_score'] - np.floor(dur) * L['time_penalty'] - f['moves'] * L['move_penalty'])
+    return score > calc + L['score_slack']
+
+
+@vector_rule('memory', 'score_ceiling')
+def _memory_ceiling(score, dur, f, L):
+    # 不需要 duration / moves：伺服器算出的分數最多就是 base_score
+    return score > L['base_score'] + L['score_slack']
+
+
+def _check_coverage():
+    """anticheat 的每條規則都要有向量版本 (missing_hash 除外：scores 不保存 hash)；漏掉時 import 就失敗"""
+    online = {(g, name) for g, name, _ in anticheat._RULES if name != 'missing_hash'}
+    vector = {(g, name) for g, rules in VECTOR_RULES.items() for name, _ in rules}
+    missing = sorted(f'{g or "*"}:{name}' for g, name in online - vector)
+    if missing:
+        raise RuntimeError(f'audit_scores.py 缺少對應 anticheat 規則的向量版本: {", ".join(missing)}')
+
+
+_check_coverage()
+
+
+# ==========================================
+# 串流掃描
+# ==========================================
+
+_COLUMNS = ('id', 'user_id', 'score', 'duration') + database.SCORE_DETAIL_FIELDS
+
+
+def iter_chunks(conn, chunk_size, games):
+    """以 id 做 keyset 分頁，每次回傳 (game_names, {欄位: float ndarray})"""
+    # +game_name 讓 SQLite 不走 (game_name, score) 索引，維持 rowid 範圍掃描、免排序
+    last_id = 0
+    placeholders = ', '.join('?' for _ in games)
+    query = f'''
+        SELECT game_name, {', '.join(_COLUMNS)} FROM scores
+        WHERE id > ? AND +game_name IN ({placeholders})
+        ORDER BY id LIMIT ?
+    '''
+    cur = conn.cursor()
+    cur.row_factory = None   # 純 tuple，比 sqlite3.Row 快很多
+    while True:
+        rows = cur.execute(query, (last_id, *games, chunk_size)).fetchall()
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        game_names = np.array(columns[0], dtype=object)
+        # None (舊紀錄沒有的欄位) 轉成 NaN，比較運算結果為 False
+        arrays = {name: np.array(col, dtype=float) for name, col in zip(_COLUMNS, columns[1:])}
+        yield game_names, arrays
+        last_id = int(arrays['id'][-1])
+
+
+def audit_chunk(game_names, arrays, games):
+    """回傳 [(score_id, user_id, game, score, rule_name), ...]；每筆只報第一條違反的規則"""
+    flagged = []
+    for game in games:
+        mask = game_names == game
+        if not mask.any():
+            continue
+        spec = anticheat.GAME_SPECS.get(game, {'limits': {}})
+        limits = {**COMMON, **spec['limits']}
+        sub = {name: arr[mask] for name, arr in arrays.items()}
+        f = {name: sub[name] for name in database.SCORE_DETAIL_FIELDS}
+        remaining = np.ones(len(sub['id']), dtype=bool)
+        for rule_name, fn in VECTOR_RULES.get(None, []) + VECTOR_RULES.get(game, []):
+            hit = fn(sub['score'], sub['duration'], f, limits) & remaining
+            if hit.any():
+                for idx in np.flatnonzero(hit):
+                    flagged.append((int(sub['id'][idx]), int(sub['user_id'][idx]), game, int(sub['score'][idx]), rule_name))
+                remaining &= ~hit
+    return flagged
+
+
+def run_audit(chunk_size=100000, games=database.GAMES, report_path=None, mark_suspects=False, out=sys.stdout):
+    conn = database.get_db_connection()
+    total_rows = 0
+    flagged = []
+    start = time.perf_counter()
+    try:
+        for game_names, arrays in iter_chunks(conn, chunk_size, games):
+            total_rows += len(game_names)
+            flagged.extend(audit_chunk(game_names, arrays, games))
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - start
+
+    if report_path:
+        with open(report_path, 'w', newline='', encoding='utf-8') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(['score_id', 'user_id', 'game_name', 'score', 'rule'])
+            writer.writerows(flagged)
+
+    marked = database.mark_users_suspect(user_id for _, user_id, _, _, _ in flagged) if mark_suspects else 0
+
+    rate = total_rows / elapsed if elapsed > 0 else float('inf')
+    print(f"掃描 {total_rows} 筆，{len(flagged)} 筆可疑，耗時 {elapsed:.2f}s ({rate:,.0f} rows/s)", file=out)
+    if report_path:
+        print(f"報告已寫入 {report_path}", file=out)
+    if mark_suspects:
+        print(f"新標記嫌疑玩家 {marked} 位", file=out)
+    return {'rows': total_rows, 'flagged': flagged, 'seconds': elapsed, 'rows_per_second': rate, 'marked': marked}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='離線重新驗證歷史分數')
+    parser.add_argument('--chunk', type=int, default=100000, help='每次讀取的筆數')
+    parser.add_argument('--game', choices=database.GAMES, help='只檢查單一遊戲')
+    parser.add_argument('--report', default='suspect_scores.csv', help='可疑紀錄輸出的 CSV 路徑')
+    parser.add_argument('--mark-suspects', action='store_true', help='將違規玩家標記為嫌疑犯')
+    args = parser.parse_args(argv)
+
+    if np is None:
+        sys.exit("需要 numpy：pip install numpy")
+
+    database.init_db()
+    run_audit(
+        chunk_size=args.chunk,
+        games=(args.game,) if args.game else database.GAMES,
+        report_path=args.report,
+        mark_suspects=args.mark_suspects,
+    )
+
+
+if __name__ == '__main__':
+    main()
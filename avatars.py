@@ -0,0 +1,273 @@
+"""
+頭像上傳：限制大小、解碼後重新編碼成固定尺寸的縮圖、以內容雜湊命名。
+
+- 上傳檔超過 MAX_UPLOAD_BYTES、或像素數超過 MAX_PIXELS (解壓縮炸彈) 直接拒絕
+- 只接受 JPEG / PNG / GIF / WebP (以檔案內容判斷，不看副檔名)；GIF 動畫取第一格
+- 解碼 / 裁切 / 編碼在 executor 中執行 (見 database/offload.py)，同時處理的張數有上限，滿了回 503
+- 輸出 SIZE 與 SMALL_SIZE 見方的兩張 (WebP；Pillow 不支援時改用 PNG)：
+      avatars/<hash>.webp      個人頁面、選單
+      avatars/<hash>-s.webp    排行榜的 40px 圖示
+  <hash> 為縮圖內容的 SHA-256，相同的圖片共用同一組檔案；檔名隨內容改變，
+  所以 /static/uploads/avatars/ 以 immutable 長期快取 (app.py 的 cache_avatars)
+- 不再被 users.avatar 引用的檔案 (換頭像、刪帳號、舊的 user_<id>_<檔名> 原檔) 由 collect_garbage() 刪除：
+  更換頭像後在背景執行緒執行，至多每 GC_INTERVAL 秒一次；最近 GC_GRACE 秒內寫入 / 重用過的檔案不刪
+  (其他請求可能剛存好相同內容、還沒更新資料庫)
+
+    ARCADE_AVATAR_MAX_BYTES=5242880     上傳檔大小上限
+    ARCADE_AVATAR_MAX_PIXELS=40000000   解碼前檢查的寬 x 高上限
+    ARCADE_AVATAR_SIZE=256              縮圖邊長
+    ARCADE_AVATAR_SMALL_SIZE=80         小縮圖邊長 (40px 圖示的 2x)
+    ARCADE_AVATAR_FORMAT=webp           webp / png
+    ARCADE_AVATAR_WORKERS=1             process pool 大小；0 = 在請求執行緒直接執行
+    ARCADE_AVATAR_MAX_PENDING=4         同時最多處理幾張，超過回 503
+    ARCADE_AVATAR_TIMEOUT=10            等待結果的上限 (秒)
+    ARCADE_AVATAR_GC_INTERVAL=600       背景 GC 最短間隔 (秒)；0 = 只手動執行
+    ARCADE_AVATAR_GC_GRACE=3600
+
+手動執行：
+    python avatars.py --migrate     # 把仍在使用的舊上傳原檔轉成縮圖
+    python avatars.py --gc          # 立即刪除不再引用的檔案
+"""
+
+import argparse
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover - 沒有 Pillow 時拒絕上傳，預設頭像照常可用
+    Image = None
+
+import database
+from database.offload import get_executor
+
+UPLOAD_FOLDER = os.path.join('static', 'uploads')
+SUBDIR = 'avatars'
+LEGACY_PREFIX = 'user_'
+
+MAX_UPLOAD_BYTES = int(os.environ.get('ARCADE_AVATAR_MAX_BYTES', str(5 * 1024 * 1024)))
+# 整個 multipart 請求的上限 (檔案 + 欄位與邊界)
+MAX_REQUEST_BYTES = MAX_UPLOAD_BYTES + 64 * 1024
+MAX_PIXELS = int(os.environ.get('ARCADE_AVATAR_MAX_PIXELS', '40000000'))
+SIZE = int(os.environ.get('ARCADE_AVATAR_SIZE', '256'))
+SMALL_SIZE = int(os.environ.get('ARCADE_AVATAR_SMALL_SIZE', '80'))
+FORMAT = os.environ.get('ARCADE_AVATAR_FORMAT', 'webp').lower()
+if FORMAT != 'png' and (Image is None or not features.check('webp')):
+    FORMAT = 'png'
+GC_INTERVAL = float(os.environ.get('ARCADE_AVATAR_GC_INTERVAL', '600'))
+GC_GRACE = float(os.environ.get('ARCADE_AVATAR_GC_GRACE', '3600'))
+
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+
+executor = get_executor('avatar', workers=1, max_pending=4, timeout=10.0)
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_last_gc = None
+_stats = {
+    'stored': 0, 'deduplicated': 0, 'rejected': 0, 'total_ms': 0.0,
+    'gc_runs': 0, 'gc_removed': 0, 'gc_errors': 0,
+}
+
+
+class InvalidAvatar(ValueError):
+    """不是可接受的頭像 (訊息直接顯示給使用者)"""
+
+
+def small_name(avatar):
+    """avatars/<hash>.webp -> avatars/<hash>-s.webp；其他頭像 (預設、網址、舊的原檔) 原樣回傳"""
+    if not avatar.startswith(SUBDIR + '/'):
+        return avatar
+    base, ext = os.path.splitext(avatar)
+    return f'{base}-s{ext}'
+
+
+def _encode(img, fmt):
+    buf = io.BytesIO()
+    if fmt == 'webp':
+        img.save(buf, 'WEBP', quality=85, method=4)
+    else:
+        img.save(buf, 'PNG', optimize=True)
+    return buf.getvalue()
+
+
+def render(data, size=SIZE, small_size=SMALL_SIZE, fmt=FORMAT, max_pixels=MAX_PIXELS):
+    """在 executor 中執行：解碼、轉正、置中裁成正方形，回傳 (縮圖, 小縮圖) 的編碼結果"""
+    if Image is None:
+        raise InvalidAvatar('Avatar uploads are unavailable (Pillow is not installed).')
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # 到這裡只讀了檔頭，尺寸不合就不解碼
+            if img.format not in ACCEPTED_FORMATS:
+                raise InvalidAvatar('Unsupported image format.')
+            if img.width * img.height > max_pixels:
+                raise InvalidAvatar('Image dimensions too large.')
+            # JPEG 可在解碼時直接縮小 (1/2 ~ 1/8)，大照片不必完整解碼
+            img.draft('RGB', (size, size))
+            img = ImageOps.exif_transpose(img)
+            alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+            img = ImageOps.fit(img.convert('RGBA' if alpha else 'RGB'), (size, size), Image.LANCZOS)
+    except InvalidAvatar:
+        raise
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidAvatar('Invalid image file.') from e
+    return _encode(img, fmt), _encode(img.resize((small_size, small_size), Image.LANCZOS), fmt)
+
+
+def _write(path, content):
+    """寫入新檔 (先寫暫存檔再 rename，讀者不會看到寫到一半的檔案)；已存在時只更新修改時間，回傳是否新寫入"""
+    if os.path.exists(path):
+        # 重新計算 GC 的寬限期：這個檔案馬上又要被引用
+        os.utime(path)
+        return False
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, path)
+    return True
+
+
+def store(large, small, folder=UPLOAD_FOLDER):
+    """以內容雜湊存檔，回傳要寫進 users.avatar 的相對路徑 (avatars/<hash>.<ext>)"""
+    os.makedirs(os.path.join(folder, SUBDIR), exist_ok=True)
+    name = f'{SUBDIR}/{hashlib.sha256(large).hexdigest()[:32]}.{FORMAT}'
+    written = _write(os.path.join(folder, name), large)
+    _write(os.path.join(folder, small_name(name)), small)
+    with _lock:
+        _stats['stored' if written else 'deduplicated'] += 1
+    return name
+
+
+def save_upload(stream, folder=UPLOAD_FOLDER):
+    """
+    讀取上傳檔 (最多 MAX_UPLOAD_BYTES)、產生縮圖並存檔，回傳 users.avatar 的新值。
+    不合法丟 InvalidAvatar；executor 已滿或逾時丟 Overloaded。
+    """
+    data = stream.read(MAX_UPLOAD_BYTES + 1)
+    try:
+        if not data:
+            raise InvalidAvatar('Invalid file or format.')
+        if len(data) > MAX_UPLOAD_BYTES:
+            raise InvalidAvatar(too_large_message())
+        start = time.perf_counter()
+        large, small = executor.run(render, data)
+    except InvalidAvatar:
+        with _lock:
+            _stats['rejected'] += 1
+        raise
+    with _lock:
+        _stats['total_ms'] += (time.perf_counter() - start) * 1000
+    return store(large, small, folder)
+
+
+def too_large_message():
+    return f'File too large (max {MAX_UPLOAD_BYTES / (1024 * 1024):g} MB).'
+
+
+def collect_garbage(folder=UPLOAD_FOLDER, grace=GC_GRACE):
+    """刪除不再被引用、且超過 grace 秒沒有寫入的上傳檔 (avatars/ 下的縮圖與舊的 user_<id>_* 原檔)，回傳刪除的檔案數"""
+    keep = set()
+    for avatar in database.get_avatar_filenames():
+        keep.add(avatar)
+        keep.add(small_name(avatar))
+    candidates = [name for name in os.listdir(folder) if name.startswith(LEGACY_PREFIX)]
+    avatar_dir = os.path.join(folder, SUBDIR)
+    if os.path.isdir(avatar_dir):
+        candidates += [f'{SUBDIR}/{name}' for name in os.listdir(avatar_dir)]
+    cutoff = time.time() - grace
+    removed = 0
+    for name in candidates:
+        if name in keep:
+            continue
+        path = os.path.join(folder, name)
+        try:
+            if os.stat(path).st_mtime > cutoff:
+                continue
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+    return removed
+
+
+def _run_gc():
+    try:
+        removed = collect_garbage()
+    except Exception as e:
+        with _lock:
+            _stats['gc_errors'] += 1
+        log.error('avatar_gc_failed', extra={'fields': {'error': str(e)}})
+        return
+    with _lock:
+        _stats['gc_runs'] += 1
+        _stats['gc_removed'] += removed
+    if removed:
+        log.info('avatar_gc', extra={'fields': {'removed': removed}})
+
+
+def schedule_gc():
+    """頭像被取代 / 刪除後呼叫：距離上次超過 GC_INTERVAL 秒才在背景執行緒跑 collect_garbage()"""
+    global _last_gc
+    if GC_INTERVAL <= 0:
+        return False
+    now = time.monotonic()
+    with _lock:
+        if _last_gc is not None and now - _last_gc < GC_INTERVAL:
+            return False
+        _last_gc = now
+    threading.Thread(target=_run_gc, name='avatar-gc', daemon=True).start()
+    return True
+
+
+def migrate_legacy(folder=UPLOAD_FOLDER):
+    """把仍被引用的舊上傳原檔 (user_<id>_<檔名>) 轉成縮圖並更新 users.avatar，回傳 (轉換數, 失敗的檔名)"""
+    converted, failed = 0, []
+    for avatar in sorted(database.get_avatar_filenames()):
+        if not avatar.startswith(LEGACY_PREFIX):
+            continue
+        try:
+            with open(os.path.join(folder, avatar), 'rb') as f:
+                name = save_upload(f, folder)
+        except (OSError, InvalidAvatar):
+            failed.append(avatar)
+            continue
+        database.replace_avatar(avatar, name)
+        converted += 1
+    if converted:
+        database.leaderboard_cache.invalidate()
+    return converted, failed
+
+
+def stats():
+    with _lock:
+        data = dict(_stats)
+    done = data['stored'] + data['deduplicated']
+    data['avg_ms'] = round(data.pop('total_ms') / done, 3) if done else 0.0
+    data['format'] = FORMAT if Image is not None else None
+    data['max_upload_bytes'] = MAX_UPLOAD_BYTES
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='頭像縮圖與不再引用的上傳檔')
+    parser.add_argument('--migrate', action='store_true', help='把舊的上傳原檔轉成縮圖')
+    parser.add_argument('--gc', action='store_true', help='刪除不再引用的檔案')
+    parser.add_argument('--grace', type=float, default=GC_GRACE, help='最近幾秒內寫入的檔案不刪')
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    if args.migrate:
+        converted, failed = migrate_legacy()
+        print(f"轉換：{converted} 個頭像")
+        for name in failed:
+            print(f"  無法轉換 (保留原檔): {name}")
+    if args.gc:
+        print(f"GC：刪除 {collect_garbage(grace=args.grace)} 個檔案")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+/dynamic/anticheat.js 每秒可處理幾個請求 (Flask test client，單執行緒)。
+
+    python benchmarks/bench_anticheat_js.py --requests 5000
+
+- render        舊做法：每個請求產生新變數名稱並 render_template
+- pool          從預先渲染的版本池挑一份 (200)
+- pool_304      瀏覽器帶 If-None-Match，版本仍在池中 (304，沒有 body)
+"""
+
+import argparse
+import contextlib
+import sys
+import time
+
+from common import emit, use_temp_db
+
+
+def run(client, n, headers=None):
+    start = time.perf_counter()
+    for _ in range(n):
+        resp = client.get('/dynamic/anticheat.js', headers=headers)
+    elapsed = time.perf_counter() - start
+    return resp, {
+        'requests_per_second': round(n / elapsed, 1),
+        'mean_us': round(elapsed / n * 1e6, 1),
+        'status': resp.status_code,
+        'bytes': len(resp.get_data()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    use_temp_db()
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as arcade
+    import anticheat_js
+
+    flask_app = arcade.app
+    client = flask_app.test_client()
+    results = {}
+
+    # 舊做法：把 render 函式直接放進版本池，size=1 且每次都過期
+    original = arcade.anticheat_variants
+    arcade.anticheat_variants = anticheat_js.VariantPool(original.render, size=1, rotate_seconds=1e-9)
+    _, results['render'] = run(client, args.requests)
+
+    arcade.anticheat_variants = original
+    resp, results['pool'] = run(client, args.requests)
+    _, results['pool_304'] = run(client, args.requests, {'If-None-Match': resp.headers['ETag']})
+    results['pool_stats'] = original.stats()
+    results['speedup'] = round(results['pool']['requests_per_second'] / results['render']['requests_per_second'], 2)
+    emit('anticheat_js', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
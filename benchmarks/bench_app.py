@@ -0,0 +1,180 @@
+"""
+以 Flask test client 模擬實際流量 (暫存資料庫，單一執行緒，固定亂數種子)。
+
+    python benchmarks/bench_app.py --users 10000 --scores 500000 --requests 3000
+
+情境 (每個情境各跑 --requests 個請求)：
+- play          start_game -> submit_score 迴圈 (Whac-A-Mole，通過防作弊檢查)
+- leaderboard   輪詢 /api/get_rank/<game> 與 /api/get_my_best_scores (一半帶 If-None-Match)
+- shop          /shop 頁面與 /api/buy (每位玩家買不同商品)
+- mixed         依 --mix 的比例混合上述請求與 /lobby
+
+每位虛擬玩家各自一個 test client (各自的 session cookie)；
+送分數頻率限制在壓測中放寬，否則同一玩家很快就會收到 429。
+"""
+
+import argparse
+import contextlib
+import hashlib
+import itertools
+import os
+import random
+import sys
+import time
+
+from common import emit, seed, use_temp_db
+
+
+def summarize(samples, elapsed, statuses):
+    out = {'requests': sum(len(v) for v in samples.values()), 'statuses': statuses}
+    out['requests_per_second'] = round(out['requests'] / elapsed, 1) if elapsed else 0.0
+    endpoints = {}
+    for name, values in sorted(samples.items()):
+        values.sort()
+        endpoints[name] = {
+            'count': len(values),
+            'mean_ms': round(sum(values) / len(values), 4),
+            'p50_ms': round(values[len(values) // 2], 4),
+            'p99_ms': round(values[min(len(values) - 1, int(len(values) * 0.99))], 4),
+        }
+    out['endpoints'] = endpoints
+    return out
+
+
+class Driver:
+    def __init__(self, arcade, database, args):
+        self.arcade = arcade
+        self.database = database
+        self.rnd = random.Random(7)
+        self.clients = []
+        self.etags = {}
+        self.items = [k for k, v in arcade.SHOP_ITEMS.items() if v['type'] != 'avatar']
+        self.next_item = {}
+        self.reset()
+        for n in range(args.players):
+            client = arcade.app.test_client()
+            # 直接寫入 session，不必每位玩家都算一次 scrypt
+            with client.session_transaction() as sess:
+                sess['user_id'] = n + 1
+                sess['username'] = f'user{n}'
+            self.clients.append(client)
+
+    def reset(self):
+        self.samples = {}
+        self.statuses = {}
+
+    def request(self, name, fn):
+        start = time.perf_counter()
+        resp = fn()
+        self.samples.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+        key = str(resp.status_code)
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+        return resp
+
+    def client(self):
+        index = self.rnd.randrange(len(self.clients))
+        return index, self.clients[index]
+
+    # --- 情境 ---
+    def play(self):
+        _, c = self.client()
+        started = self.request('start_game', lambda: c.post('/api/start_game', json={'game_name': 'whac'}))
+        ticket = started.get_json()
+        hits = self.rnd.randint(0, 1)
+        score = hits * 10
+        ts = str(int(time.time() * 1000))
+        digest = hashlib.sha256(f'{score}:{ticket["nonce"]}:{ts}:{self.arcade.SHARED_SALT}'.encode()).hexdigest()
+        body = {
+            'game_name': 'whac', 'score': score, 'hits': hits,
+            'hash': f'{digest}|{ts}', 'ticket': ticket['ticket'],
+        }
+        self.request('submit_score', lambda: c.post('/api/submit_score', json=body))
+
+    def leaderboard(self):
+        index, c = self.client()
+        game = self.rnd.choice(self.database.GAMES)
+        for name, path in (('get_rank', f'/api/get_rank/{game}'), ('get_my_best_scores', '/api/get_my_best_scores')):
+            key = (index, path)
+            headers = {}
+            if key in self.etags and self.rnd.random() < 0.5:
+                headers['If-None-Match'] = self.etags[key]
+            resp = self.request(name, lambda: c.get(path, headers=headers))
+            if resp.headers.get('ETag'):
+                self.etags[key] = resp.headers['ETag']
+
+    def shop(self):
+        index, c = self.client()
+        if self.rnd.random() < 0.3:
+            self.request('shop_page', lambda: c.get('/shop'))
+            return
+        k = self.next_item.get(index, 0)
+        self.next_item[index] = k + 1
+        item_id = self.items[k % len(self.items)]
+        self.request('buy', lambda: c.post('/api/buy', json={'item_id': item_id}))
+
+    def lobby(self):
+        _, c = self.client()
+        self.request('lobby', lambda: c.get('/lobby'))
+
+
+def run(driver, scenario, n):
+    driver.reset()
+    start = time.perf_counter()
+    while sum(len(v) for v in driver.samples.values()) < n:
+        scenario()
+    return summarize(driver.samples, time.perf_counter() - start, driver.statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--scores', type=int, default=500000)
+    parser.add_argument('--players', type=int, default=200, help='同時活動的虛擬玩家數')
+    parser.add_argument('--requests', type=int, default=3000)
+    parser.add_argument('--mix', default='leaderboard=50,play=30,shop=10,lobby=10')
+    args = parser.parse_args()
+
+    use_temp_db()
+    os.environ.setdefault('ARCADE_LOG_LEVEL', 'WARNING')
+    seed(args.users, args.scores)
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as arcade
+    import database
+    import rate_limit
+
+    arcade.score_rate_limiter = rate_limit.create_rate_limiter(10 ** 9, arcade.RATE_LIMIT_WINDOW)
+    # 讓虛擬玩家買得起商店中所有商品
+    conn = database.get_db_connection()
+    try:
+        conn.execute('UPDATE users SET tickets_earned_total = ? WHERE id <= ?', (10 ** 9, args.players))
+        conn.commit()
+    finally:
+        conn.close()
+    database.user_cache.invalidate()
+
+    driver = Driver(arcade, database, args)
+    scenarios = {
+        'play': driver.play,
+        'leaderboard': driver.leaderboard,
+        'shop': driver.shop,
+        'lobby': driver.lobby,
+    }
+    weights = {}
+    for part in args.mix.split(','):
+        name, weight = part.split('=')
+        weights[scenarios[name]] = float(weight)
+    choices, cum = list(weights), list(itertools.accumulate(weights.values()))
+
+    def mixed():
+        scenario = driver.rnd.choices(choices, cum_weights=cum)[0]
+        scenario()
+
+    results = {}
+    for name in ('play', 'leaderboard', 'shop'):
+        results[name] = run(driver, scenarios[name], args.requests)
+    results['mixed'] = run(driver, mixed, args.requests)
+    emit('app', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""
+同步 (app.py，WSGI + 執行緒) 與 async (asgi.py，事件迴圈 + 資料庫執行緒池) 在相同流量下的比較。
+
+    python benchmarks/bench_asgi.py --concurrency 16,64,256 --requests 3000
+
+不經過網路與 HTTP 伺服器，兩邊都以相同的 scope / environ 直接呼叫應用程式：
+- sync    --concurrency 條執行緒，各自迴圈呼叫 Flask WSGI app (相當於 threaded WSGI 伺服器)
+- async   --concurrency 個 asyncio task 呼叫 asgi.app (相當於 uvicorn 單一 worker)
+
+流量比例：get_rank 40% (一半帶 If-None-Match)、get_my_best_scores 20%、
+start_game + submit_score 30%、buy / equip 10%。送分數頻率限制在壓測中放寬。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from common import emit, seed, use_temp_db
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def summarize(samples, elapsed, statuses):
+    samples.sort()
+    return {
+        'requests': len(samples),
+        'requests_per_second': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(samples, 0.5), 4),
+        'p99_ms': round(percentile(samples, 0.99), 4),
+        'max_ms': round(samples[-1], 4),
+        'statuses': statuses,
+    }
+
+
+class Player:
+    """一位虛擬玩家：session cookie、各 URL 最後拿到的 ETag"""
+
+    def __init__(self, asgi, user_id, rnd):
+        self.asgi = asgi
+        self.cookie = asgi._session_serializer.dumps({'user_id': user_id, 'username': f'user{user_id - 1}'})
+        self.rnd = rnd
+        self.etags = {}
+
+    def scope(self, method, path, body=None, headers=()):
+        raw = [(b'cookie', f'session={self.cookie}'.encode()), (b'host', b'bench')]
+        raw += [(k.encode(), v.encode()) for k, v in headers]
+        if body is not None:
+            raw.append((b'content-type', b'application/json'))
+            raw.append((b'content-length', str(len(body)).encode()))
+        return {
+            'type': 'http', 'method': method, 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'headers': raw, 'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+            'server': ('bench', 80), 'client': ('127.0.0.1', 1234),
+        }
+
+    def script(self):
+        """依流量比例產生這一輪的請求 (method, path, JSON, headers)；submit_score 需要 start_game 的回應，send() 回傳回應本文"""
+        roll = self.rnd.random()
+        if roll < 0.4:
+            game = self.rnd.choice(self.asgi.database.GAMES)
+            path = f'/api/get_rank/{game}'
+            headers = ()
+            if path in self.etags and self.rnd.random() < 0.5:
+                headers = (('if-none-match', self.etags[path]),)
+            yield 'GET', path, None, headers
+        elif roll < 0.6:
+            path = '/api/get_my_best_scores'
+            headers = ()
+            if path in self.etags and self.rnd.random() < 0.5:
+                headers = (('if-none-match', self.etags[path]),)
+            yield 'GET', path, None, headers
+        elif roll < 0.9:
+            started = yield 'POST', '/api/start_game', {'game_name': 'whac'}, ()
+            ticket = json.loads(started)
+            hits = self.rnd.randint(0, 1)
+            score = hits * 10
+            ts = str(int(time.time() * 1000))
+            digest = hashlib.sha256(f'{score}:{ticket["nonce"]}:{ts}:{self.asgi.arcade.SHARED_SALT}'.encode()).hexdigest()
+            yield 'POST', '/api/submit_score', {
+                'game_name': 'whac', 'score': score, 'hits': hits,
+                'hash': f'{digest}|{ts}', 'ticket': ticket['ticket'],
+            }, ()
+        elif roll < 0.95:
+            yield 'POST', '/api/buy', {'item_id': 'title_newbie'}, ()
+        else:
+            yield 'POST', '/api/equip', {'item_id': 'unequip_title'}, ()
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []
+        self.statuses = {}
+        self.lock = threading.Lock()
+
+    def record(self, ms, status):
+        with self.lock:
+            self.samples.append(ms)
+            key = str(status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+
+def remember_etag(player, path, headers):
+    for k, v in headers:
+        if k.lower() == 'etag':
+            player.etags[path] = v
+
+
+# --- sync：每個「連線」一條執行緒呼叫 WSGI app ---
+def wsgi_request(asgi, player, method, path, payload, headers):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    environ = asgi.wsgi_environ(player.scope(method, path, body if payload is not None else None, headers), body)
+    started = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = response_headers
+
+    iterable = asgi.flask_app(environ, start_response)
+    try:
+        data = b''.join(iterable)
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+    remember_etag(player, path, started['headers'])
+    return started['status'], data
+
+
+def run_sync(asgi, players, concurrency, total):
+    recorder = Recorder()
+    remaining = [total]
+    lock = threading.Lock()
+
+    def take():
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def worker(k):
+        rnd = random.Random(k)
+        while take():
+            player = players[rnd.randrange(len(players))]
+            steps = player.script()
+            response = None
+            try:
+                while True:
+                    method, path, payload, headers = steps.send(response)
+                    start = time.perf_counter()
+                    status, response = wsgi_request(asgi, player, method, path, payload, headers)
+                    recorder.record((time.perf_counter() - start) * 1000, status)
+            except StopIteration:
+                pass
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(recorder.samples, time.perf_counter() - start, recorder.statuses)
+
+
+# --- async：每個「連線」一個 task 呼叫 ASGI app ---
+async def asgi_request(asgi, player, method, path, payload, headers):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    scope = player.scope(method, path, body if payload is not None else None, headers)
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    out = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # 回應送完之前不會斷線
+        await asyncio.Event().wait()
+
+    async def send(message):
+        out.append(message)
+
+    await asgi.app(scope, receive, send)
+    start = out[0]
+    remember_etag(player, path, [(k.decode(), v.decode()) for k, v in start['headers']])
+    return start['status'], b''.join(m.get('body', b'') for m in out[1:])
+
+
+async def run_async(asgi, players, concurrency, total):
+    recorder = Recorder()
+    remaining = [total]
+
+    async def worker(k):
+        rnd = random.Random(k)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            player = players[rnd.randrange(len(players))]
+            steps = player.script()
+            response = None
+            try:
+                while True:
+                    method, path, payload, headers = steps.send(response)
+                    start = time.perf_counter()
+                    status, response = await asgi_request(asgi, player, method, path, payload, headers)
+                    recorder.record((time.perf_counter() - start) * 1000, status)
+            except StopIteration:
+                pass
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(k) for k in range(concurrency)))
+    return summarize(recorder.samples, time.perf_counter() - start, recorder.statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--scores', type=int, default=200000)
+    parser.add_argument('--players', type=int, default=500)
+    parser.add_argument('--concurrency', default='16,64,256')
+    parser.add_argument('--requests', type=int, default=3000, help='每個模式、每個並行數的請求數')
+    args = parser.parse_args()
+
+    use_temp_db()
+    os.environ.setdefault('ARCADE_LOG_LEVEL', 'WARNING')
+    seed(args.users, args.scores)
+    with contextlib.redirect_stdout(sys.stderr):
+        import asgi
+    import database
+    import rate_limit
+
+    asgi.arcade.score_rate_limiter = rate_limit.create_rate_limiter(10 ** 9, asgi.arcade.RATE_LIMIT_WINDOW)
+    conn = database.get_db_connection()
+    try:
+        conn.execute('UPDATE users SET tickets_earned_total = ? WHERE id <= ?', (10 ** 9, args.players))
+        conn.commit()
+    finally:
+        conn.close()
+    database.user_cache.invalidate()
+
+    rnd = random.Random(11)
+    players = [Player(asgi, n + 1, rnd) for n in range(args.players)]
+    levels = [int(c) for c in args.concurrency.split(',') if c]
+    results = {'sync': {}, 'async': {}}
+    for concurrency in levels:
+        results['sync'][str(concurrency)] = run_sync(asgi, players, concurrency, args.requests)
+        results['async'][str(concurrency)] = asyncio.run(run_async(asgi, players, concurrency, args.requests))
+    emit('asgi', vars(args) | {'db_threads': asgi.DB_THREADS}, results)
+
+
+if __name__ == '__main__':
+    main()
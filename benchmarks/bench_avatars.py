@@ -0,0 +1,104 @@
+"""
+頭像處理：縮圖產生的延遲、輸出大小 (與原檔相比)、GC 掃描。
+
+    python benchmarks/bench_avatars.py --repeat 10 --files 10000
+
+- render[輸入]        avatars.render() (解碼 + 裁切 + 兩種尺寸編碼)，各輸出格式分開量測
+- bytes[輸入]         原檔 / 縮圖 / 小縮圖的大小；舊做法排行榜的 40px 圖示直接載入原檔
+- save_upload         經過 executor (ARCADE_AVATAR_WORKERS) 並存檔的完整流程；重複上傳同一張走去重
+- collect_garbage     --files 個檔案 (一半仍被引用) 的掃描，之後一次實際刪除
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+from common import emit, measure, seed, use_temp_db
+
+
+def photo(image_module, width, height, fmt, variant=0):
+    """漸層 + 放大過的雜訊，壓縮後的大小接近一般照片；variant 不同則像素不同"""
+    noise = image_module.effect_noise((width // 4, height // 4), 48).resize((width, height))
+    gradient = image_module.linear_gradient('L').rotate(variant * 7).resize((width, height))
+    img = image_module.merge('RGB', (noise, gradient, image_module.blend(noise, gradient, 0.5)))
+    buf = io.BytesIO()
+    if fmt == 'JPEG':
+        img.save(buf, 'JPEG', quality=92)
+    else:
+        img.putalpha(gradient)
+        img.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--files', type=int, default=10000)
+    args = parser.parse_args()
+
+    use_temp_db()
+    seed(args.files // 2, 0)
+    import avatars
+    import database
+    from PIL import Image
+
+    inputs = {
+        'jpeg_1mp': photo(Image, 1280, 800, 'JPEG'),
+        'jpeg_12mp': photo(Image, 4032, 3024, 'JPEG'),
+        'png_rgba_2mp': photo(Image, 1920, 1080, 'PNG'),
+    }
+    folder = tempfile.mkdtemp(prefix='arcade-avatars-')
+    results = {}
+    with contextlib.redirect_stdout(sys.stderr):
+        for label, data in inputs.items():
+            for fmt in ('webp', 'png'):
+                if fmt == 'webp' and avatars.FORMAT != 'webp':
+                    continue
+                results[f'render[{label},{fmt}]'] = measure(lambda: avatars.render(data, fmt=fmt), args.repeat)
+                large, small = avatars.render(data, fmt=fmt)
+                results[f'bytes[{label},{fmt}]'] = {'original': len(data), 'avatar': len(large), 'small': len(small)}
+
+        data = inputs['jpeg_12mp']
+        avatars.save_upload(io.BytesIO(data), folder)    # 第一次呼叫包含啟動 process pool
+        # 雜湊取自縮圖內容，每次要用像素不同的圖片才不會去重
+        unique = iter([photo(Image, 4032, 3024, 'JPEG', n + 1) for n in range(args.repeat)])
+        results['save_upload'] = measure(lambda: avatars.save_upload(io.BytesIO(next(unique)), folder), args.repeat)
+        results['save_upload[duplicate]'] = measure(lambda: avatars.save_upload(io.BytesIO(data), folder), args.repeat)
+
+        # GC：--files 個舊上傳檔，前一半仍被引用
+        gc_folder = tempfile.mkdtemp(prefix='arcade-avatars-gc-')
+        conn = database.get_db_connection()
+        try:
+            names = [f'user_{n + 1}_{n}.jpg' for n in range(args.files)]
+            conn.executemany(
+                'UPDATE users SET avatar = ? WHERE id = ?',
+                ((name, n + 1) for n, name in enumerate(names[:args.files // 2])),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        database.user_cache.invalidate()
+        old = time.time() - 2 * avatars.GC_GRACE
+        for name in names:
+            path = os.path.join(gc_folder, name)
+            with open(path, 'wb') as f:
+                f.write(b'x')
+            os.utime(path, (old, old))
+        results['collect_garbage[scan]'] = measure(
+            lambda: avatars.collect_garbage(gc_folder, grace=3 * avatars.GC_GRACE), args.repeat
+        )
+        start = time.perf_counter()
+        removed = avatars.collect_garbage(gc_folder)
+        results['collect_garbage[delete]'] = {
+            'removed': removed, 'ms': round((time.perf_counter() - start) * 1000, 4),
+        }
+    results['stats'] = avatars.stats()
+    emit('avatars', vars(args) | {'format': avatars.FORMAT, 'workers': avatars.executor.workers}, results)
+
+
+if __name__ == '__main__':
+    main()
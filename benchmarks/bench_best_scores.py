@@ -0,0 +1,66 @@
+"""
+/api/get_my_best_scores 的名次計算：舊版逐遊戲 12 次查詢 vs 單一查詢。
+
+    python benchmarks/bench_best_scores.py --users 10000 --scores 1000000
+"""
+
+import argparse
+import random
+
+from common import emit, measure, seed, use_temp_db
+
+
+def legacy_best_scores_with_rank(conn, user_id):
+    """改版前的實作 (每款遊戲兩次查詢，名次需重新聚合整個遊戲)"""
+    results = {}
+    for game_name in ['snake', 'dino', 'whac', 'memory', 'tetris', 'shaft']:
+        user_score_row = conn.execute(
+            'SELECT score, timestamp FROM scores WHERE user_id = ? AND game_name = ? ORDER BY score DESC LIMIT 1',
+            (user_id, game_name),
+        ).fetchone()
+        if user_score_row:
+            rank_row = conn.execute(
+                '''
+                SELECT COUNT(DISTINCT user_id) + 1 AS rank FROM (
+                    SELECT user_id, MAX(score) AS max_score FROM scores WHERE game_name = ? GROUP BY user_id
+                ) AS T WHERE T.max_score > ?
+            ''',
+                (game_name, user_score_row['score']),
+            ).fetchone()
+            results[game_name] = {
+                'score': user_score_row['score'],
+                'timestamp': user_score_row['timestamp'],
+                'rank': rank_row['rank'],
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--scores', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    use_temp_db()
+    seed(args.users, args.scores)
+    import database
+
+    rnd = random.Random(42)
+    user_ids = [rnd.randint(1, args.users) for _ in range(args.repeat)]
+
+    conn = database.get_db_connection()
+    try:
+        it = iter(user_ids)
+        legacy = measure(lambda: legacy_best_scores_with_rank(conn, next(it)), args.repeat)
+    finally:
+        conn.close()
+
+    it = iter(user_ids)
+    current = measure(lambda: database.get_all_best_scores_by_user_with_rank(next(it)), args.repeat)
+
+    emit('best_scores_with_rank', vars(args), {'legacy': legacy, 'current': current})
+
+
+if __name__ == '__main__':
+    main()
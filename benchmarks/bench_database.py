@@ -0,0 +1,173 @@
+"""
+database/database.py 中每個公開函式的延遲 (暫存資料庫，直接呼叫，不經過 Flask)。
+
+    python benchmarks/bench_database.py --users 10000 --scores 1000000 --repeat 200
+    python benchmarks/bench_database.py --only get_leaderboard,get_wallet_info
+
+寫入類函式各自使用獨立的玩家 / 商品，避免彼此影響；
+密碼相關 (create_user / verify_user) 每次都要算 scrypt，重複次數為 --repeat 的 1/20。
+結果中的 uncovered 列出尚未納入的公開函式 (新增函式時記得補上)。
+"""
+
+import argparse
+import contextlib
+import inspect
+import itertools
+import random
+import sys
+
+from common import emit, measure, seed, use_temp_db
+
+
+def build_cases(database, db, args):
+    """回傳 {函式名稱: (呼叫一次的 lambda, 重複次數)}"""
+    rnd = random.Random(42)
+    users = args.users
+    repeat = args.repeat
+    slow = max(3, repeat // 20)
+
+    def random_user():
+        return rnd.randint(1, users)
+
+    # 寫入測試用的玩家 (不影響讀取測試的資料分布)
+    def fresh_users(prefix, n):
+        conn = database.get_db_connection()
+        try:
+            start = conn.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0] + 1
+            conn.executemany(
+                'INSERT INTO users (username, password, tickets_earned_total) VALUES (?, ?, ?)',
+                ((f'{prefix}{i}', 'x', 10 ** 9) for i in range(n)),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        return iter(range(start, start + n))
+
+    with contextlib.redirect_stdout(sys.stderr):
+        database.create_user('bench_login', 'bench-password')
+    counter = itertools.count()
+    buyers = fresh_users('buyer', repeat)
+    doomed = fresh_users('doomed', repeat)
+    renamed = fresh_users('renamed', 1)
+    renamed_id = next(renamed)
+
+    def with_conn(fn):
+        def call():
+            conn = database.get_db_connection()
+            try:
+                fn(conn)
+                conn.commit()
+            finally:
+                conn.close()
+        return call
+
+    def uncached_user():
+        ttl = database.user_cache.ttl
+        database.user_cache.ttl = 0
+        try:
+            database.get_user_by_id(random_user())
+        finally:
+            database.user_cache.ttl = ttl
+
+    def deep_cursor(game, pages):
+        cursor = None
+        for _ in range(pages):
+            cursor = database.get_leaderboard_page(game, cursor)['next_cursor'] or cursor
+        return cursor
+
+    hot_user = random_user()
+    deep = {game: deep_cursor(game, 20) for game in database.GAMES}
+    return {
+        'get_db_connection': (lambda: database.get_db_connection().close(), repeat),
+        'get_pool_stats': (database.get_pool_stats, repeat),
+        'init_db': (database.init_db, repeat),
+        'backfill_user_best_scores': (with_conn(database.backfill_user_best_scores), 3),
+        'rebuild_rank_counts': (with_conn(database.rebuild_rank_counts), 3),
+        'create_user': (lambda: database.create_user(f'bench_new{next(counter)}', 'pw'), slow),
+        'verify_user': (lambda: database.verify_user('bench_login', 'bench-password'), slow),
+        'get_user_by_id': (lambda: database.get_user_by_id(hot_user), repeat),
+        'get_user_by_id[uncached]': (uncached_user, repeat),
+        'update_username': (lambda: database.update_username(renamed_id, f'renamed_{next(counter)}'), repeat),
+        'update_avatar': (lambda: database.update_avatar(random_user(), f'bench_{next(counter)}.png'), repeat),
+        'replace_avatar': (lambda: database.replace_avatar('default.png', 'default.png'), max(3, repeat // 10)),
+        'get_avatar_filenames': (database.get_avatar_filenames, repeat),
+        'delete_user': (lambda: database.delete_user(next(doomed)), repeat),
+        'get_all_users': (database.get_all_users, max(3, repeat // 10)),
+        'insert_score': (
+            lambda: database.insert_score(random_user(), rnd.choice(database.GAMES), int(rnd.expovariate(1 / 500))),
+            repeat,
+        ),
+        'insert_scores[100]': (
+            lambda: database.insert_scores([
+                (random_user(), rnd.choice(database.GAMES), int(rnd.expovariate(1 / 500))) for _ in range(100)
+            ]),
+            max(3, repeat // 10),
+        ),
+        'get_score_versions': (database.get_score_versions, repeat),
+        'get_score_stats': (database.get_score_stats, repeat),
+        'get_user_score_stats': (lambda: database.get_user_score_stats(random_user()), repeat),
+        'get_score_outliers': (database.get_score_outliers, repeat),
+        'get_leaderboard': (lambda: database.get_leaderboard(rnd.choice(database.GAMES)), repeat),
+        'get_leaderboard[week]': (lambda: database.get_leaderboard(rnd.choice(database.GAMES), 'week'), repeat),
+        'get_leaderboard_page': (lambda: database.get_leaderboard_page(rnd.choice(database.GAMES)), repeat),
+        'get_leaderboard_page[deep]': (
+            lambda: database.get_leaderboard_page(*rnd.choice(list(deep.items()))), repeat
+        ),
+        'get_leaderboard_page[week]': (
+            lambda: database.get_leaderboard_page(rnd.choice(database.GAMES), window='week'), repeat
+        ),
+        'get_leaderboard_around': (
+            lambda: database.get_leaderboard_around(rnd.choice(database.GAMES), random_user()), repeat
+        ),
+        'parse_rank_cursor': (lambda: database.parse_rank_cursor('1234:5678:90'), repeat),
+        'get_all_best_scores_by_user_with_rank': (
+            lambda: database.get_all_best_scores_by_user_with_rank(random_user()), repeat
+        ),
+        'get_all_scores_by_user': (lambda: database.get_all_scores_by_user(random_user()), repeat),
+        'get_wallet_info': (lambda: database.get_wallet_info(random_user()), repeat),
+        'recompute_ticket_totals': (with_conn(lambda conn: db.recompute_ticket_totals(conn, random_user())), repeat),
+        'get_user_items': (lambda: database.get_user_items(random_user()), repeat),
+        'purchase_item': (lambda: database.purchase_item(next(buyers), 'title_newbie', 'title', 100), repeat),
+        'equip_item': (lambda: database.equip_item(random_user(), 'title', '🎮 Gamer'), repeat),
+        'mark_user_suspect': (lambda: database.mark_user_suspect(random_user()), repeat),
+        'mark_users_suspect[100]': (
+            lambda: database.mark_users_suspect([random_user() for _ in range(100)]), max(3, repeat // 10)
+        ),
+        'clear_user_suspect': (lambda: database.clear_user_suspect(random_user()), repeat),
+        'set_warning_pending': (lambda: database.set_warning_pending(random_user()), repeat),
+        'clear_warning_pending': (lambda: database.clear_warning_pending(random_user()), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--scores', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--only', default='', help='只跑這些函式 (逗號分隔)')
+    args = parser.parse_args()
+
+    use_temp_db()
+    seed(args.users, args.scores)
+    import database
+    import database.database as db
+
+    cases = build_cases(database, db, args)
+    only = {name for name in args.only.split(',') if name}
+    results = {}
+    with contextlib.redirect_stdout(sys.stderr):
+        for name, (fn, repeat) in cases.items():
+            if only and name.split('[')[0] not in only and name not in only:
+                continue
+            results[name] = measure(fn, repeat)
+
+    public = {
+        name for name, fn in inspect.getmembers(db, inspect.isfunction)
+        if not name.startswith('_') and fn.__module__ == db.__name__
+    }
+    covered = {name.split('[')[0] for name in cases}
+    emit('database', vars(args), {'functions': results, 'uncovered': sorted(public - covered)})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+登入壓測：--clients 個並行使用者反覆 POST /login (Flask test client，每位使用者一條執行緒)。
+
+    python benchmarks/bench_login.py --clients 32 --seconds 5 --workers 4
+
+比較三種 KDF 執行器設定：
+- inline  在請求執行緒直接算 scrypt (ARCADE_KDF_WORKERS=0)
+- pool    交給 --workers 個行程的 process pool，不限排隊長度
+- shed    同上，但同時最多 --max-pending 件，超過回 503 + Retry-After
+
+回報每秒成功登入數、延遲分位數與 503 次數。
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import threading
+import time
+
+from common import emit, use_temp_db
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    return round(samples[min(len(samples) - 1, int(len(samples) * q))], 2)
+
+
+def run_mode(app, users, clients, seconds, executor):
+    import database.database as db
+
+    db.kdf_executor = executor
+    # 暖機：process pool 第一次 submit 要 spawn + import
+    with app.test_client() as c:
+        c.post('/login', data={'username': 'login0', 'password': 'pw0'})
+
+    latencies = []
+    counts = {'ok': 0, 'shed': 0, 'failed': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(index):
+        client = app.test_client()
+        local = []
+        ok = shed = failed = 0
+        i = index
+        while time.perf_counter() < deadline:
+            n = i % users
+            start = time.perf_counter()
+            resp = client.post('/login', data={'username': f'login{n}', 'password': f'pw{n}'})
+            elapsed = (time.perf_counter() - start) * 1000
+            if resp.status_code == 302:
+                ok += 1
+                local.append(elapsed)
+            elif resp.status_code == 503:
+                shed += 1
+                time.sleep(float(resp.headers.get('Retry-After', 1)) / 10)
+            else:
+                failed += 1
+            i += clients
+        with lock:
+            latencies.extend(local)
+            counts['ok'] += ok
+            counts['shed'] += shed
+            counts['failed'] += failed
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+
+    latencies.sort()
+    return {
+        'logins_per_second': round(counts['ok'] / elapsed, 1),
+        'ok': counts['ok'],
+        'shed_503': counts['shed'],
+        'failed': counts['failed'],
+        'p50_ms': percentile(latencies, 0.50),
+        'p99_ms': percentile(latencies, 0.99),
+        'max_ms': percentile(latencies, 1.0),
+        'executor': executor.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--max-pending', type=int, default=0, help='shed 模式的排隊上限 (預設 workers * 2)')
+    args = parser.parse_args()
+
+    use_temp_db()
+    with contextlib.redirect_stdout(sys.stderr):
+        from app import app
+    import database
+    from database.offload import BoundedExecutor
+
+    for n in range(args.users):
+        database.create_user(f'login{n}', f'pw{n}')
+
+    max_pending = args.max_pending or args.workers * 2
+    modes = {
+        'inline': BoundedExecutor('kdf', workers=0, max_pending=10 ** 6),
+        'pool': BoundedExecutor('kdf', workers=args.workers, max_pending=10 ** 6, timeout=60),
+        'shed': BoundedExecutor('kdf', workers=args.workers, max_pending=max_pending),
+    }
+    results = {}
+    with contextlib.redirect_stdout(sys.stderr):
+        for name, executor in modes.items():
+            results[name] = run_mode(app, args.users, args.clients, args.seconds, executor)
+    emit('login', dict(vars(args), max_pending=max_pending), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+購買流程壓力測試：多執行緒同時對同一批玩家下單，檢查沒有重複扣款並量測吞吐量。
+
+    python benchmarks/bench_purchase.py --threads 16 --users 20 --items 50
+
+每位玩家的餘額只夠買 budget_items 件商品；跑完後檢查
+  - spent_points == 擁有商品數 * 價格
+  - spent_points <= 累計 tickets (沒有透支)
+  - 沒有重複持有同一件商品
+"""
+
+import argparse
+import threading
+import time
+
+from common import emit, seed, use_temp_db
+
+PRICE = 100
+
+
+def legacy_purchase_item(database, user_id, item_id, item_type, cost):
+    """改版前的實作：先用另一條連線讀餘額，再寫入 (檢查與寫入之間有競態)"""
+    wallet = database.get_wallet_info(user_id)
+    if wallet['balance'] < cost:
+        return False, 'Insufficient funds'
+    conn = database.get_db_connection()
+    try:
+        if conn.execute('SELECT 1 FROM user_items WHERE user_id=? AND item_id=?', (user_id, item_id)).fetchone():
+            return False, 'Already owned'
+        conn.execute('UPDATE users SET spent_points = spent_points + ? WHERE id = ?', (cost, user_id))
+        conn.execute(
+            'INSERT INTO user_items (user_id, item_id, item_type) VALUES (?, ?, ?)',
+            (user_id, item_id, item_type),
+        )
+        conn.commit()
+        return True, 'Success'
+    except Exception as e:
+        conn.rollback()
+        return False, str(e)
+    finally:
+        conn.close()
+
+
+def reset(database, users, budget_items):
+    conn = database.get_db_connection()
+    try:
+        conn.execute('DELETE FROM user_items')
+        conn.execute('UPDATE users SET spent_points = 0, tickets_earned_total = ?', (PRICE * budget_items,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def run(database, purchase, args):
+    reset(database, args.users, args.budget_items)
+    barrier = threading.Barrier(args.threads)
+    successes = [0] * args.threads
+
+    def worker(idx):
+        barrier.wait()
+        for n in range(args.attempts):
+            user_id = 1 + (idx + n) % args.users
+            item_id = f'item_{(idx * 7 + n) % args.items}'
+            ok, _ = purchase(user_id, item_id, 'title', PRICE)
+            if ok:
+                successes[idx] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    conn = database.get_db_connection()
+    try:
+        overspent = conn.execute(
+            'SELECT COUNT(*) FROM users WHERE spent_points > tickets_earned_total'
+        ).fetchone()[0]
+        mismatched = conn.execute(
+            '''
+            SELECT COUNT(*) FROM users u
+            WHERE u.spent_points != ? * (SELECT COUNT(*) FROM user_items i WHERE i.user_id = u.id)
+        ''',
+            (PRICE,),
+        ).fetchone()[0]
+        duplicates = conn.execute(
+            'SELECT COUNT(*) FROM (SELECT 1 FROM user_items GROUP BY user_id, item_id HAVING COUNT(*) > 1)'
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+    total = args.threads * args.attempts
+    return {
+        'attempts': total,
+        'successful_purchases': sum(successes),
+        'seconds': round(elapsed, 4),
+        'purchases_per_second': round(total / elapsed, 1),
+        'overspent_users': overspent,
+        'spent_mismatch_users': mismatched,
+        'duplicate_items': duplicates,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--budget-items', type=int, default=10)
+    parser.add_argument('--attempts', type=int, default=200)
+    args = parser.parse_args()
+
+    use_temp_db()
+    seed(args.users, 0)
+    import database
+
+    legacy = run(database, lambda *a: legacy_purchase_item(database, *a), args)
+    current = run(database, database.purchase_item, args)
+    emit('purchase_contention', vars(args), {'legacy': legacy, 'current': current})
+
+    assert current['overspent_users'] == 0, 'double spend detected'
+    assert current['spent_mismatch_users'] == 0, 'spent_points does not match owned items'
+    assert current['duplicate_items'] == 0, 'duplicate ownership detected'
+
+
+if __name__ == '__main__':
+    main()
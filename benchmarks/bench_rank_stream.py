@@ -0,0 +1,112 @@
+"""
+排行榜 SSE 推播的扇出 (fan-out)：N 個訂閱者、每次前 N 名變動要多久才送到所有人，以及閒置成本。
+
+    python benchmarks/bench_rank_stream.py --subscribers 2000 --updates 50
+
+訂閱者直接迭代 rank_stream.subscribe() 回傳的事件 (不經過 HTTP)，每個訂閱者一條執行緒
+(與 threaded WSGI 伺服器相同；gevent worker 下則是 greenlet)。
+有安裝 gevent 時加上 --gevent 會先 monkey patch，比較 greenlet 版本。
+
+- idle      所有人連上後閒置 --idle 秒的 CPU 時間 (應接近 0：訂閱者都在 Condition 上等待)
+- fanout    每次寫入擠進前 10 名的分數後，最後一個訂閱者收到 diff 的延遲
+"""
+
+import argparse
+import sys
+
+if '--gevent' in sys.argv:
+    from gevent import monkey
+
+    monkey.patch_all()
+
+import contextlib
+import resource
+import threading
+import time
+
+from common import emit, seed, use_temp_db
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--subscribers', type=int, default=2000)
+    parser.add_argument('--updates', type=int, default=50)
+    parser.add_argument('--idle', type=float, default=2.0)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--scores', type=int, default=20000)
+    parser.add_argument('--gevent', action='store_true')
+    args = parser.parse_args()
+
+    use_temp_db()
+    seed(args.users, args.scores)
+    import database
+
+    game = 'snake'
+    stream = database.rank_stream
+    stream.max_subscribers = max(stream.max_subscribers, args.subscribers)
+    stream.keepalive = 3600          # 不讓 keepalive 混入量測
+    # 每個訂閱者收到第 k 次 diff 的時間
+    received = [[] for _ in range(args.subscribers)]
+    ready = threading.Barrier(args.subscribers + 1)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def subscriber(k):
+        events = stream.subscribe(game)
+        it = iter(events)
+        next(it)     # retry
+        next(it)     # snapshot
+        ready.wait()
+        try:
+            for chunk in it:
+                received[k].append(time.perf_counter())
+                if len(received[k]) >= args.updates:
+                    break
+        finally:
+            events.close()
+
+    threads = [threading.Thread(target=subscriber, args=(k,), daemon=True) for k in range(args.subscribers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    ready.wait()
+    connect_seconds = time.perf_counter() - start
+
+    cpu = time.process_time()
+    time.sleep(args.idle)
+    idle_cpu = time.process_time() - cpu
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # 每次寫入一位新玩家的最高分，保證改變前 10 名
+    top = database.leaderboard_cache.get(game)
+    best = top[0]['score'] if top else 0
+    latencies = []
+    with contextlib.redirect_stdout(sys.stderr):
+        for i in range(args.updates):
+            best += 1
+            published = time.perf_counter()
+            database.save_score(1 + i % args.users, game, best)
+            deadline = published + 10
+            while time.perf_counter() < deadline and any(len(r) <= i for r in received):
+                time.sleep(0.0005)
+            last = max(r[i] for r in received if len(r) > i)
+            latencies.append((last - published) * 1000)
+
+    for t in threads:
+        t.join(5)
+    latencies.sort()
+    emit('rank_stream', vars(args), {
+        'connect_seconds': round(connect_seconds, 3),
+        'idle_cpu_seconds': round(idle_cpu, 4),
+        'max_rss_growth_kb': rss_after - rss_before,
+        'fanout': {
+            'p50_ms': round(latencies[len(latencies) // 2], 3),
+            'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 3),
+            'max_ms': round(latencies[-1], 3),
+        },
+        'deliveries': sum(len(r) for r in received),
+        'stream': stream.stats(),
+    })
+
+
+if __name__ == '__main__':
+    main()
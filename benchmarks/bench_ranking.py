@@ -0,0 +1,119 @@
+"""
+完整排行榜：keyset 分頁與 OFFSET 分頁、「我的附近」、名次計算 (best_score_counts 與 COUNT) 的比較。
+
+    python benchmarks/bench_ranking.py --players 1000000 --limit 50
+
+單一遊戲 (snake) 有 --players 位玩家的最佳成績 (直接寫入 user_best_scores，不產生 scores 歷史)。
+- page[N]           get_leaderboard_page 讀第 N 頁 (cursor 事先以 OFFSET 取得，不計入)
+- offset_page[N]    同一頁改用 LIMIT / OFFSET
+- around[位置]      get_leaderboard_around (前 / 中 / 後段的玩家)
+- rank_count[位置]  舊做法：在 user_best_scores 上 COUNT 比自己高的玩家
+"""
+
+import argparse
+import contextlib
+import random
+import sys
+
+from common import emit, measure, seed, use_temp_db
+
+GAME = 'snake'
+OFFSET_SQL = '''
+    SELECT b.user_id, u.username, b.best_score AS score
+    FROM user_best_scores b JOIN users u ON u.id = b.user_id
+    WHERE b.game_name = ?
+    ORDER BY b.best_score DESC, b.user_id
+    LIMIT ? OFFSET ?
+'''
+
+
+def with_conn(database, fn):
+    conn = database.get_db_connection()
+    try:
+        return fn(conn)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--players', type=int, default=1000000)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--pages', default='1,100,5000', help='要量測的頁碼 (另外會加上最後一頁)')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    use_temp_db()
+    seed(args.players, 0)
+    import database
+
+    rnd = random.Random(5)
+
+    def fill(conn):
+        conn.executemany(
+            'INSERT INTO user_best_scores (user_id, game_name, best_score) VALUES (?, ?, ?)',
+            ((uid, GAME, int(rnd.expovariate(1 / 500))) for uid in range(1, args.players + 1)),
+        )
+        database.rebuild_rank_counts(conn)
+        conn.execute('ANALYZE')
+        conn.commit()
+
+    with_conn(database, fill)
+
+    last_page = (args.players - 1) // args.limit + 1
+    pages = sorted({int(p) for p in args.pages.split(',') if p} | {last_page})
+    results = {}
+    with contextlib.redirect_stdout(sys.stderr):
+        for page in pages:
+            if page > last_page:
+                continue
+            cursor = None
+            if page > 1:
+                # 前一頁最後一名的 (分數, user_id)，名次以 best_score_counts 計算
+                def previous_row(conn):
+                    row = conn.execute(OFFSET_SQL, (GAME, 1, (page - 1) * args.limit - 1)).fetchone()
+                    higher = conn.execute(
+                        'SELECT COALESCE(SUM(players), 0) FROM best_score_counts WHERE game_name = ? AND best_score > ?',
+                        (GAME, row['score']),
+                    ).fetchone()[0]
+                    return f"{row['score']}:{row['user_id']}:{higher + 1}"
+
+                cursor = with_conn(database, previous_row)
+            results[f'page[{page}]'] = measure(
+                lambda: database.get_leaderboard_page(GAME, cursor, args.limit), args.repeat
+            )
+            results[f'offset_page[{page}]'] = measure(
+                lambda: with_conn(
+                    database, lambda conn: conn.execute(OFFSET_SQL, (GAME, args.limit, (page - 1) * args.limit)).fetchall()
+                ),
+                max(3, args.repeat // 10),
+            )
+
+        for label, fraction in (('top', 0.0), ('middle', 0.5), ('bottom', 1.0)):
+            position = min(args.players - 1, int(args.players * fraction))
+            user_id = with_conn(
+                database, lambda conn: conn.execute(OFFSET_SQL, (GAME, 1, position)).fetchone()['user_id']
+            )
+            results[f'around[{label}]'] = measure(
+                lambda: database.get_leaderboard_around(GAME, user_id, 5), args.repeat
+            )
+            results[f'rank_count[{label}]'] = measure(
+                lambda: with_conn(database, lambda conn: conn.execute(
+                    '''
+                    SELECT COUNT(*) + 1 FROM user_best_scores o
+                    WHERE o.game_name = ? AND o.best_score > (
+                        SELECT best_score FROM user_best_scores WHERE user_id = ? AND game_name = ?
+                    )
+                ''',
+                    (GAME, user_id, GAME),
+                ).fetchone()),
+                max(3, args.repeat // 10),
+            )
+            results[f'get_all_best_scores_by_user_with_rank[{label}]'] = measure(
+                lambda: database.get_all_best_scores_by_user_with_rank(user_id), args.repeat
+            )
+    emit('ranking', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
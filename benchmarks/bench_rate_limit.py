@@ -0,0 +1,89 @@
+"""
+送分數頻率限制：每次檢查的成本 (100k 活躍玩家)。
+
+    python benchmarks/bench_rate_limit.py --users 100000 --checks 1000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from common import emit
+
+import rate_limit
+
+WINDOW = 60
+LIMIT = 30
+
+
+class LegacyLimiter:
+    """改版前的作法：每個玩家一個時間戳 list，每次檢查重建過濾後的 list"""
+
+    def __init__(self):
+        self.log = {}
+
+    def hit(self, key, now):
+        history = [t for t in self.log.get(key, []) if now - t < WINDOW]
+        if len(history) >= LIMIT:
+            self.log[key] = history
+            return False
+        history.append(now)
+        self.log[key] = history
+        return True
+
+
+def run(limiter, keys, start_ts, step):
+    now = start_ts
+    begin = time.perf_counter()
+    for key in keys:
+        limiter.hit(key, now)
+        now += step
+    elapsed = time.perf_counter() - begin
+    # 所有玩家閒置兩個時間窗後，再來 2000 位新玩家：看還保留多少 key
+    for i in range(2000):
+        limiter.hit(f'late-{i}', now + 2 * WINDOW + 1)
+    tracked = len(limiter.log) if isinstance(limiter, LegacyLimiter) else len(limiter.backend)
+    return {
+        'checks': len(keys),
+        'seconds': round(elapsed, 4),
+        'ns_per_check': round(elapsed / len(keys) * 1e9, 1),
+        'tracked_keys_after_idle': tracked,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--checks', type=int, default=1000000)
+    parser.add_argument('--sqlite-checks', type=int, default=20000)
+    args = parser.parse_args()
+
+    rnd = random.Random(7)
+    # uniform：所有玩家平均分布；hot：1% 的玩家送出一半的請求 (時間窗內的 list 會長到上限)
+    hot_users = max(1, args.users // 100)
+    scenarios = {
+        'uniform': [rnd.randrange(args.users) for _ in range(args.checks)],
+        'hot': [rnd.randrange(hot_users) if rnd.random() < 0.5 else rnd.randrange(args.users)
+                for _ in range(args.checks)],
+    }
+    # 每次檢查推進的時間，讓整個測試橫跨數個時間窗
+    step = 3 * WINDOW / args.checks
+    start_ts = 1_700_000_000.0
+
+    results = {}
+    for name, keys in scenarios.items():
+        results[name] = {
+            'legacy_list': run(LegacyLimiter(), keys, start_ts, step),
+            'memory': run(rate_limit.RateLimiter(LIMIT, WINDOW, rate_limit.MemoryBackend()), keys, start_ts, step),
+        }
+    path = os.path.join(tempfile.mkdtemp(prefix='arcade-bench-'), 'ratelimit.db')
+    sqlite_limiter = rate_limit.RateLimiter(LIMIT, WINDOW, rate_limit.SQLiteBackend(path))
+    results['uniform']['sqlite'] = run(sqlite_limiter, scenarios['uniform'][:args.sqlite_checks], start_ts, step)
+
+    emit('rate_limit_check', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
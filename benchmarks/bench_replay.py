@@ -0,0 +1,107 @@
+"""
+重播驗證：每核心每秒可以重播幾局 (Snake / Tetris)，以及 process pool 的總吞吐量。
+
+    python benchmarks/bench_replay.py --games 300 --workers 4
+
+Snake 以繞遍整個 20x20 棋盤的路線 (不會撞到自己) 玩 --snake-seconds 秒；
+Tetris 每隔 --tetris-gap 個 tick 隨機移動 / 旋轉後硬降，直到堆滿為止。
+"""
+
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from common import emit, measure
+
+import replay
+
+
+def snake_replay(seed, seconds):
+    ticks = int(seconds / replay.SNAKE_TICK_SECONDS)
+    inputs = []
+    # 向右 19 格、向下 1 格：在環形棋盤上是一條漢米爾頓迴路
+    for t in range(20, ticks + 1, 20):
+        inputs += [t, 2]
+        if t + 1 <= ticks:
+            inputs += [t + 1, 1]
+    return seed, inputs, ticks
+
+
+def tetris_replay(seed, gap, rnd, max_ticks=200000):
+    inputs = []
+    t = 0
+    while t < max_ticks:
+        t += rnd.randint(gap // 2, gap + gap // 2)
+        for _ in range(rnd.randint(0, 2)):
+            inputs += [t, rnd.choice((3, 4))]
+        shift = rnd.randint(-5, 5)
+        inputs += [t, 0 if shift < 0 else 1] * abs(shift)
+        inputs += [t, 5]
+    result = replay.simulate_tetris(seed, inputs, max_ticks)
+    ticks = result['ticks']
+    return seed, [v for k in range(0, len(inputs), 2) if inputs[k] <= ticks for v in inputs[k:k + 2]], ticks
+
+
+def _run_one(args):
+    game_name, seed, inputs, ticks = args
+    return replay.simulate(game_name, seed, inputs, ticks)['score']
+
+
+def bench_inline(game_name, replays):
+    total_ticks = sum(r[2] for r in replays)
+    start = time.perf_counter()
+    for seed, inputs, ticks in replays:
+        replay.simulate(game_name, seed, inputs, ticks)
+    elapsed = time.perf_counter() - start
+    it = iter(replays * 2)
+    latency = measure(lambda: replay.simulate(game_name, *next(it)), min(len(replays), 200))
+    return {
+        'replays': len(replays),
+        'avg_ticks': round(total_ticks / len(replays), 1),
+        'replays_per_second_per_core': round(len(replays) / elapsed, 1),
+        'ticks_per_second': round(total_ticks / elapsed),
+        'latency': latency,
+    }
+
+
+def bench_pool(game_name, replays, workers):
+    jobs = [(game_name, *r) for r in replays]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(_run_one, jobs[:workers], chunksize=1))       # 暖機 (spawn / import)
+        start = time.perf_counter()
+        list(pool.map(_run_one, jobs, chunksize=max(1, len(jobs) // (workers * 8))))
+        elapsed = time.perf_counter() - start
+    return {
+        'workers': workers,
+        'replays_per_second': round(len(jobs) / elapsed, 1),
+        'replays_per_second_per_worker': round(len(jobs) / elapsed / workers, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--games', type=int, default=300)
+    parser.add_argument('--snake-seconds', type=float, default=120)
+    parser.add_argument('--tetris-gap', type=int, default=60, help='平均每幾個 tick 放下一個方塊')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    data = {
+        'snake': [snake_replay(rnd.getrandbits(32), args.snake_seconds) for _ in range(args.games)],
+        'tetris': [tetris_replay(rnd.getrandbits(32), args.tetris_gap, rnd) for _ in range(args.games)],
+    }
+    results = {}
+    for game_name, replays in data.items():
+        results[game_name] = {
+            'inline': bench_inline(game_name, replays),
+            'pool': bench_pool(game_name, replays, args.workers),
+            'avg_score': round(sum(_run_one((game_name, *r)) for r in replays) / len(replays), 1),
+        }
+    emit('replay', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
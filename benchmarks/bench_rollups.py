@@ -0,0 +1,91 @@
+"""
+日 / 週 / 賽季排行榜：預先彙總 (leaderboard_rollups) 與直接以 timestamp 篩選 scores 的比較。
+
+    python benchmarks/bench_rollups.py --sizes 100000,300000,1000000 --days 365
+
+分數的時間平均分散在過去 --days 天；每個規模先補足 scores 再重建彙總，
+然後量測兩種讀法取本週前 10 名的延遲。預期 naive 隨歷史量成長，rollup 維持不變。
+"""
+
+import argparse
+import contextlib
+import random
+import sys
+
+from common import emit, measure, seed, use_temp_db
+
+NAIVE_SQL = '''
+    SELECT u.username, MAX(s.score) AS score
+    FROM scores s JOIN users u ON u.id = s.user_id
+    WHERE s.game_name = ? AND s.timestamp >= ?
+    GROUP BY s.user_id
+    ORDER BY score DESC, s.user_id
+    LIMIT 10
+'''
+
+
+def add_scores(database, rnd, users, n, days):
+    conn = database.get_db_connection()
+    try:
+        conn.executemany(
+            '''
+            INSERT INTO scores (user_id, game_name, score, timestamp)
+            VALUES (?, ?, ?, datetime('now', ?))
+        ''',
+            (
+                (
+                    rnd.randint(1, users), rnd.choice(database.GAMES), int(rnd.expovariate(1 / 500)),
+                    f'-{rnd.uniform(0, days * 86400):.0f} seconds',
+                )
+                for _ in range(n)
+            ),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--sizes', default='100000,300000,1000000')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    use_temp_db()
+    seed(args.users, 0)
+    import database
+    from database import rollups
+
+    rnd = random.Random(3)
+    week_start = database.period_key('week') + ' 00:00:00'
+    results = {}
+    total = 0
+    for size in (int(s) for s in args.sizes.split(',') if s):
+        add_scores(database, rnd, args.users, size - total, args.days)
+        total = size
+        conn = database.get_db_connection()
+        try:
+            rollups.rebuild(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+        def naive():
+            conn = database.get_db_connection()
+            try:
+                conn.execute(NAIVE_SQL, (rnd.choice(database.GAMES), week_start)).fetchall()
+            finally:
+                conn.close()
+
+        with contextlib.redirect_stdout(sys.stderr):
+            results[str(size)] = {
+                'naive_scan': measure(naive, max(3, args.repeat // 10)),
+                'rollup': measure(lambda: database.get_leaderboard(rnd.choice(database.GAMES), 'week'), args.repeat),
+            }
+    emit('rollups', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
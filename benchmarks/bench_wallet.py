@@ -0,0 +1,52 @@
+"""
+錢包讀取：舊版 SUM(tickets_earned) vs users.tickets_earned_total。
+
+    python benchmarks/bench_wallet.py --users 1000 --scores 1000000
+"""
+
+import argparse
+import random
+
+from common import emit, measure, seed, use_temp_db
+
+
+def legacy_wallet_info(conn, user_id):
+    """改版前的實作：每次加總該玩家全部的分數紀錄"""
+    row = conn.execute('SELECT SUM(tickets_earned) as total FROM scores WHERE user_id = ?', (user_id,)).fetchone()
+    total_tickets = row['total'] if row['total'] is not None else 0
+    user = conn.execute('SELECT spent_points, is_admin FROM users WHERE id = ?', (user_id,)).fetchone()
+    spent = user['spent_points'] if user else 0
+    return {'total_earned': total_tickets, 'spent': spent, 'balance': total_tickets - spent}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--scores', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    use_temp_db()
+    seed(args.users, args.scores)
+    import database
+
+    rnd = random.Random(42)
+    user_ids = [rnd.randint(1, args.users) for _ in range(args.repeat)]
+
+    conn = database.get_db_connection()
+    try:
+        it = iter(user_ids)
+        legacy = measure(lambda: legacy_wallet_info(conn, next(it)), args.repeat)
+        for user_id in user_ids[:20]:
+            assert legacy_wallet_info(conn, user_id) == database.get_wallet_info(user_id)
+    finally:
+        conn.close()
+
+    it = iter(user_ids)
+    current = measure(lambda: database.get_wallet_info(next(it)), args.repeat)
+
+    emit('wallet_info', vars(args), {'legacy': legacy, 'current': current})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+壓測共用工具：建立暫存資料庫並灌入假資料、計時、輸出 JSON。
+
+注意：database 套件在 import 時就決定 DB 路徑，
+因此必須先呼叫 use_temp_db()，再 import database。
+"""
+
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def use_temp_db():
+    """設定 ARCADE_DB_PATH 指向新的暫存檔並回傳路徑"""
+    path = os.path.join(tempfile.mkdtemp(prefix='arcade-bench-'), 'arcade.db')
+    os.environ['ARCADE_DB_PATH'] = path
+    return path
+
+
+def seed(users, scores, seed_value=1234):
+    """灌入 users 位玩家與 scores 筆分數紀錄 (直接 executemany，不經過 insert_score)"""
+    import database
+    from database import rollups, score_stats
+    from database.database import GAME_TICKET_RATES
+
+    with contextlib.redirect_stdout(sys.stderr):
+        database.init_db()
+    rnd = random.Random(seed_value)
+    conn = database.get_db_connection()
+    try:
+        conn.executemany(
+            'INSERT INTO users (username, password) VALUES (?, ?)',
+            ((f'user{i}', 'x') for i in range(users)),
+        )
+
+        def score_rows():
+            for _ in range(scores):
+                game = rnd.choice(database.GAMES)
+                score = int(rnd.expovariate(1 / 500))
+                yield (rnd.randint(1, users), game, score, int(round(score * GAME_TICKET_RATES[game])))
+
+        conn.executemany(
+            'INSERT INTO scores (user_id, game_name, score, tickets_earned) VALUES (?, ?, ?, ?)',
+            score_rows(),
+        )
+        database.backfill_user_best_scores(conn)
+        database.recompute_ticket_totals(conn)
+        score_stats.rebuild(conn)
+        rollups.rebuild(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def measure(fn, repeat):
+    """執行 fn repeat 次，回傳延遲統計 (毫秒)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'runs': repeat,
+        'mean_ms': round(statistics.fmean(samples), 4),
+        'p50_ms': round(samples[len(samples) // 2], 4),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 4),
+        'max_ms': round(samples[-1], 4),
+    }
+
+
+def emit(name, params, results):
+    """以 JSON 格式輸出結果 (方便跨 commit 比較)"""
+    print(json.dumps({'benchmark': name, 'params': params, 'results': results}, ensure_ascii=False, indent=2))
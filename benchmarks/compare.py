@@ -0,0 +1,77 @@
+"""
+比較兩次壓測輸出 (同一支 bench_*.py 在不同 commit 的 JSON 結果)。
+
+    python benchmarks/bench_database.py > before.json
+    git checkout <新 commit>
+    python benchmarks/bench_database.py > after.json
+    python benchmarks/compare.py before.json after.json --threshold 20
+
+逐一比對兩邊都有的延遲欄位 (*_ms，越小越好) 與吞吐量欄位 (*_per_second，越大越好)，
+變慢超過 --threshold % 的項目標記為 REGRESSION，並以結束碼 1 結束 (方便放進 CI)。
+"""
+
+import argparse
+import json
+import sys
+
+LATENCY_SUFFIX = '_ms'
+THROUGHPUT_SUFFIX = '_per_second'
+
+
+def flatten(data, prefix=''):
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from flatten(value, f'{prefix}.{key}' if prefix else str(key))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        yield prefix, float(data)
+
+
+def compare(before, after, threshold, metric_filter=None):
+    old = dict(flatten(before.get('results', {})))
+    rows = []
+    for path, new_value in flatten(after.get('results', {})):
+        leaf = path.rsplit('.', 1)[-1]
+        if leaf.endswith(LATENCY_SUFFIX):
+            higher_is_better = False
+        elif leaf.endswith(THROUGHPUT_SUFFIX):
+            higher_is_better = True
+        else:
+            continue
+        if metric_filter and metric_filter not in path:
+            continue
+        old_value = old.get(path)
+        if not old_value:
+            continue
+        change = (new_value - old_value) / old_value * 100
+        worse = -change if higher_is_better else change
+        rows.append((path, old_value, new_value, change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=20.0, help='變慢超過幾 % 視為退步')
+    parser.add_argument('--metric', default='p50_ms', help='只比較路徑中包含此字串的欄位 (空字串 = 全部)')
+    args = parser.parse_args()
+
+    with open(args.before, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(args.after, encoding='utf-8') as f:
+        after = json.load(f)
+    if before.get('benchmark') != after.get('benchmark'):
+        sys.exit(f"benchmark mismatch: {before.get('benchmark')} vs {after.get('benchmark')}")
+
+    rows = compare(before, after, args.threshold, args.metric or None)
+    width = max((len(r[0]) for r in rows), default=10)
+    for path, old_value, new_value, change, regressed in rows:
+        flag = 'REGRESSION' if regressed else ''
+        print(f'{path:<{width}}  {old_value:>12.4f} -> {new_value:>12.4f}  {change:+7.1f}%  {flag}')
+    regressions = sum(1 for r in rows if r[4])
+    print(f'{len(rows)} metrics compared, {regressions} regressions (threshold {args.threshold}%)')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,51 +1,107 @@
 from .database import (
     DB_NAME,
+    GAMES,
+    LEADERBOARD_WINDOWS,
+    SCORE_DETAIL_FIELDS,
+    version_store,
+    rollup_compactor,
     get_db_connection,
+    get_pool_stats,
     init_db,
+    backfill_user_best_scores,
+    rebuild_rank_counts,
     create_user,
     verify_user,
     get_user_by_id,
     update_username,
     update_avatar,
+    replace_avatar,
+    get_avatar_filenames,
     delete_user,
     get_all_users,
     insert_score,
+    insert_scores,
+    get_score_versions,
+    get_score_stats,
+    get_user_score_stats,
+    get_score_outliers,
     get_leaderboard,
+    get_leaderboard_page,
+    get_leaderboard_around,
+    parse_rank_cursor,
     get_all_best_scores_by_user_with_rank,
     get_all_scores_by_user,
     get_wallet_info,
+    recompute_ticket_totals,
     get_user_items,
     purchase_item,
     equip_item,
     mark_user_suspect,
+    mark_users_suspect,
     clear_user_suspect,
     set_warning_pending,
     clear_warning_pending,
 )
+from .leaderboard_cache import leaderboard_cache
+from .rollups import period_key
+from .rank_stream import TooManySubscribers, rank_stream
+from .offload import Overloaded, executor_stats
+from .score_queue import save_score, score_writer, score_writer_stats
+from .user_cache import user_cache
 
 __all__ = [
     "DB_NAME",
+    "GAMES",
+    "LEADERBOARD_WINDOWS",
+    "SCORE_DETAIL_FIELDS",
+    "version_store",
+    "rollup_compactor",
     "get_db_connection",
+    "get_pool_stats",
     "init_db",
+    "backfill_user_best_scores",
+    "rebuild_rank_counts",
     "create_user",
     "verify_user",
     "get_user_by_id",
     "update_username",
     "update_avatar",
+    "replace_avatar",
+    "get_avatar_filenames",
     "delete_user",
     "get_all_users",
     "insert_score",
+    "insert_scores",
+    "get_score_versions",
+    "get_score_stats",
+    "get_user_score_stats",
+    "get_score_outliers",
     "get_leaderboard",
+    "get_leaderboard_page",
+    "get_leaderboard_around",
+    "parse_rank_cursor",
     "get_all_best_scores_by_user_with_rank",
     "get_all_scores_by_user",
     "get_wallet_info",
+    "recompute_ticket_totals",
     "get_user_items",
     "purchase_item",
     "equip_item",
     "mark_user_suspect",
+    "mark_users_suspect",
     "clear_user_suspect",
     "set_warning_pending",
     "clear_warning_pending",
+    "leaderboard_cache",
+    "period_key",
+    "rank_stream",
+    "TooManySubscribers",
+    "Overloaded",
+    "executor_stats",
+    "save_score",
+    "score_writer",
+    "score_writer_stats",
+    "user_cache",
 ]
 
 
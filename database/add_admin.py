@@ -1,24 +1,22 @@
-import sqlite3
+import sys
 from pathlib import Path
 
-DB_PATH = Path(__file__).resolve().parent.parent / "arcade.db"
+# 允許直接以 python database/add_admin.py 執行
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import DB_NAME, get_db_connection  # noqa: E402
+from database.migrations import migrate  # noqa: E402
 
 
 def add_admin_column():
-    print(f"正在連接至資料庫: {DB_PATH} ...")
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    print(f"正在連接至資料庫: {DB_NAME} ...")
 
-    try:
-        # 1. 新增 is_admin 欄位 (預設為 0，即普通使用者)
-        c.execute("ALTER TABLE users ADD COLUMN is_admin INTEGER DEFAULT 0")
-        print("✅ 成功新增 'is_admin' 欄位。")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("ℹ️ 'is_admin' 欄位已存在，跳過新增步驟。")
-        else:
-            print(f"❌ 資料庫錯誤: {e}")
-            return
+    # 1. 確保 schema 為最新版本 (is_admin 欄位由遷移 v001 補上)
+    for version, name, duration_ms in migrate():
+        print(f"✅ 套用遷移 v{version:03d} {name} ({duration_ms:.1f} ms)")
+
+    conn = get_db_connection()
+    c = conn.cursor()
 
     # 2. 設定管理員
     target_username = input("請輸入要設定為「超級管理員」的帳號名稱 (Username): ")
@@ -45,4 +43,3 @@ def add_admin_column():
 if __name__ == '__main__':
     add_admin_column()
 
-
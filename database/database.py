@@ -1,11 +1,19 @@
+import logging
 import os
 import sqlite3
 from pathlib import Path
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from . import rollups, score_stats
+from .offload import get_executor
+from .pool import get_pool
+from .user_cache import user_cache
+from .versions import create_version_store
+
 # 將 DB 路徑鎖定在專案根目錄，避免工作目錄不同造成找不到檔案
+# (測試 / 壓測時可用 ARCADE_DB_PATH 指向其他檔案)
 BASE_DIR = Path(__file__).resolve().parent.parent
-DB_NAME = str(BASE_DIR / 'arcade.db')
+DB_NAME = os.environ.get('ARCADE_DB_PATH', str(BASE_DIR / 'arcade.db'))
 
 # 定義遊戲分數換算 Tickets 的比例
 # 1 Score = ? Tickets
@@ -19,89 +27,99 @@ GAME_TICKET_RATES = {
     'memory': 0.05,   # 原本 0.2 -> 改為 0.05 (20 分 = 1 代幣)
 }
 
+# 平台上的遊戲清單 (路由、排名等處統一引用這裡)
+GAMES = ('snake', 'dino', 'whac', 'memory', 'tetris', 'shaft')
+
+# 隨分數一起保存的遊戲數據欄位 (供離線重新驗證使用，對應 scores 表的同名欄位)
+SCORE_DETAIL_FIELDS = ('moves', 'pieces', 'level', 'lines', 'hits', 'jumps')
+
+# 各遊戲的版本號 (scores:<game> 由 insert_score 遞增、board:<game> 由排行榜快取遞增)
+version_store = create_version_store(
+    [f'scores:{g}' for g in GAMES] + [f'board:{g}' for g in GAMES]
+)
+
+# 密碼雜湊 (scrypt) 的執行器；ARCADE_KDF_WORKERS / ARCADE_KDF_MAX_PENDING / ARCADE_KDF_TIMEOUT
+# 預設交給小型 process pool，scrypt 不佔用請求執行緒 (ARCADE_KDF_WORKERS=0 改回直接執行)
+kdf_executor = get_executor('kdf', workers=min(4, os.cpu_count() or 1), max_pending=32, timeout=5.0)
+
+log = logging.getLogger(__name__)
+
+# 排行榜時間窗 (?window=)；all = 歷來最佳 (user_best_scores)，其餘由 leaderboard_rollups 提供
+LEADERBOARD_WINDOWS = ('all',) + rollups.WINDOWS
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME, timeout=30.0)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """從連線池借出連線；呼叫 conn.close() 即歸還"""
+    return get_pool(DB_NAME).acquire()
 
 
-def add_column_if_missing(cur, table, column_def):
-    """確保指定欄位存在，若缺少則以 column_def 新增"""
-    column_name = column_def.split()[0]
-    cols = [row[1] for row in cur.execute(f"PRAGMA table_info({table})").fetchall()]
-    if column_name not in cols:
-        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column_def}")
-        return True
-    return False
+def get_pool_stats():
+    """連線池統計 (大小、借出次數、等待時間)"""
+    return get_pool(DB_NAME).stats()
+
+
+# 定期壓縮已結束的日 / 週 / 賽季彙總；第一次寫入分數時啟動
+rollup_compactor = rollups.Compactor(get_db_connection)
 
 
 def init_db():
-    """初始化資料庫 (包含商店相關欄位)"""
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute('PRAGMA journal_mode=WAL;')
+    """初始化資料庫：依版本套用 database/migrations.py 中尚未執行的遷移"""
+    from .migrations import migrate
 
-    c.execute(
-        '''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            avatar TEXT DEFAULT 'default.png',
-            is_admin INTEGER DEFAULT 0,
-            spent_points INTEGER DEFAULT 0,
-            equipped_title TEXT DEFAULT '',
-            equipped_frame TEXT DEFAULT '',
-            equipped_badge TEXT DEFAULT '',
-            equipped_effect TEXT DEFAULT ''
-        )
-    '''
-    )
+    for version, name, duration_ms in migrate():
+        print(f"Applied migration v{version:03d} {name} ({duration_ms:.1f} ms)")
 
-    # 若既有資料表缺少新欄位則補上
-    add_column_if_missing(c, 'users', "equipped_frame TEXT DEFAULT ''")
-    add_column_if_missing(c, 'users', "equipped_badge TEXT DEFAULT ''")
-    add_column_if_missing(c, 'users', "equipped_effect TEXT DEFAULT ''")
-    add_column_if_missing(c, 'users', "is_suspect INTEGER DEFAULT 0")
-    add_column_if_missing(c, 'users', "warning_pending INTEGER DEFAULT 0")
 
-    c.execute(
+def backfill_user_best_scores(conn=None):
+    """
+    由 scores 歷史重建 user_best_scores (一次性，或資料不一致時手動執行)，
+    並在同一個交易內重建由它衍生的 best_score_counts，名次不會與最佳成績不一致。
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        conn.execute('DELETE FROM user_best_scores')
+        # SQLite 的 MAX() 聚合會讓其他裸欄位取自最大值那一列，timestamp 即為達成時間
+        conn.execute(
+            '''
+            INSERT INTO user_best_scores (user_id, game_name, best_score, achieved_at)
+            SELECT user_id, game_name, MAX(score), timestamp
+            FROM scores
+            GROUP BY user_id, game_name
         '''
-        CREATE TABLE IF NOT EXISTS scores (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            game_name TEXT NOT NULL,
-            score INTEGER NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
         )
-    '''
-    )
-    
-    # 新增 tickets_earned 欄位
-    if add_column_if_missing(c, 'scores', "tickets_earned INTEGER DEFAULT 0"):
-        print("Migrating existing scores to tickets...")
-        # 若是新加的欄位，執行一次性遷移，將舊分數轉換為 tickets
-        for game, rate in GAME_TICKET_RATES.items():
-            # 使用 ROUND 確保四捨五入，並轉為整數
-            c.execute(f"UPDATE scores SET tickets_earned = CAST(ROUND(score * {rate}) AS INTEGER) WHERE game_name = ?", (game,))
-        conn.commit()
+        # 遷移 v2 呼叫時 best_score_counts 還不存在 (由 v9 建立並重建)
+        if conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'best_score_counts'"
+        ).fetchone():
+            rebuild_rank_counts(conn)
+        if own_conn:
+            conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
 
-    c.execute(
+def rebuild_rank_counts(conn=None):
+    """由 user_best_scores 重建 best_score_counts (各遊戲每個最佳成績有幾位玩家；名次計算用)"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        conn.execute('DELETE FROM best_score_counts')
+        conn.execute(
+            '''
+            INSERT INTO best_score_counts (game_name, best_score, players)
+            SELECT game_name, best_score, COUNT(*)
+            FROM user_best_scores
+            GROUP BY game_name, best_score
         '''
-        CREATE TABLE IF NOT EXISTS user_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            item_id TEXT NOT NULL,
-            item_type TEXT NOT NULL,
-            acquired_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
         )
-    '''
-    )
-
-    conn.commit()
-    conn.close()
+        if own_conn:
+            conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
 
 
 # --- 使用者相關 ---
@@ -109,7 +127,16 @@ def create_user(username, password):
     """建立使用者帳號，密碼以雜湊方式儲存"""
     conn = get_db_connection()
     try:
-        password_hash = generate_password_hash(password)
+        # 名稱重複就不必浪費一次 KDF
+        if conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone():
+            return False
+    finally:
+        conn.close()
+
+    # KDF 交給有上限的執行器，不在持有資料庫連線時計算
+    password_hash = kdf_executor.run(generate_password_hash, password)
+    conn = get_db_connection()
+    try:
         conn.execute(
             'INSERT INTO users (username, password) VALUES (?, ?)',
             (username, password_hash),
@@ -130,6 +157,7 @@ def verify_user(username, password):
     """
     驗證登入帳號密碼。
     自動支援 scrypt, pbkdf2 等多種雜湊格式，並向下相容明文密碼。
+    KDF 在 kdf_executor 中計算，執行器已滿時丟 Overloaded。
     """
     conn = get_db_connection()
     try:
@@ -137,54 +165,65 @@ def verify_user(username, password):
             'SELECT * FROM users WHERE username = ?',
             (username,),
         ).fetchone()
+    finally:
+        # 計算雜湊可能要上百毫秒，先把連線還給連線池
+        conn.close()
 
-        if not row:
-            return None
+    if not row:
+        return None
 
-        stored_pw = row['password']
+    stored_pw = row['password']
 
-        # 統一轉成字串，處理 bytes 或其他型別
-        if stored_pw is None:
-            return None
+    # 統一轉成字串，處理 bytes 或其他型別
+    if stored_pw is None:
+        return None
 
-        if isinstance(stored_pw, bytes):
-            try:
-                stored_pw_str = stored_pw.decode('utf-8', errors='ignore')
-            except Exception:
-                stored_pw_str = str(stored_pw)
-        else:
+    if isinstance(stored_pw, bytes):
+        try:
+            stored_pw_str = stored_pw.decode('utf-8', errors='ignore')
+        except Exception:
             stored_pw_str = str(stored_pw)
+    else:
+        stored_pw_str = str(stored_pw)
 
-        # 1) 優先嘗試標準雜湊驗證 (支援 werkzeug 格式)
+    # 1) 優先嘗試標準雜湊驗證 (支援 werkzeug 格式)
+    try:
+        if kdf_executor.run(check_password_hash, stored_pw_str, password):
+            return row
+    except ValueError:
+        # 若雜湊格式不正確 (如純明文) 會丟 ValueError，改走明文驗證
+        pass
+
+    # 2) 舊格式：明文密碼，直接比對
+    if stored_pw_str == password:
+        # 登入成功，同步升級為雜湊密碼
+        new_hash = kdf_executor.run(generate_password_hash, password)
+        conn = get_db_connection()
         try:
-            if check_password_hash(stored_pw_str, password):
-                return row
-        except ValueError:
-            # 若雜湊格式不正確 (如純明文) 會丟 ValueError，改走明文驗證
-            pass
-
-        # 2) 舊格式：明文密碼，直接比對
-        if stored_pw_str == password:
-            # 登入成功，同步升級為雜湊密碼
-            new_hash = generate_password_hash(password)
             conn.execute(
                 'UPDATE users SET password = ? WHERE id = ?',
                 (new_hash, row['id']),
             )
             conn.commit()
+            user_cache.invalidate(row['id'])
 
             # 回傳升級後的資料列
             return conn.execute(
                 'SELECT * FROM users WHERE id = ?',
                 (row['id'],),
             ).fetchone()
+        finally:
+            conn.close()
 
-        return None
-    finally:
-        conn.close()
+    return None
 
 
 def get_user_by_id(user_id):
+    """讀取使用者資料列 (經過 user_cache，最多 TTL 秒內不重複查詢)"""
+    return user_cache.get(user_id, _load_user)
+
+
+def _load_user(user_id):
     conn = get_db_connection()
     try:
         return conn.execute(
@@ -203,6 +242,7 @@ def update_username(user_id, new_username):
             (new_username, user_id),
         )
         conn.commit()
+        user_cache.invalidate(user_id)
         return True
     except sqlite3.IntegrityError:
         return False
@@ -218,21 +258,57 @@ def update_avatar(user_id, filename):
             (filename, user_id),
         )
         conn.commit()
+        user_cache.invalidate(user_id)
+    finally:
+        conn.close()
+
+
+def replace_avatar(old, new):
+    """所有使用 old 頭像的玩家改用 new (舊上傳檔轉成縮圖時使用)，回傳更新的列數"""
+    conn = get_db_connection()
+    try:
+        updated = conn.execute('UPDATE users SET avatar = ? WHERE avatar = ?', (new, old)).rowcount
+        conn.commit()
+        if updated:
+            user_cache.invalidate()
+        return updated
+    finally:
+        conn.close()
+
+
+def get_avatar_filenames():
+    """目前被任何玩家引用的頭像值 (走 idx_users_avatar，不掃整張 users)；上傳檔的 GC 以此為準"""
+    conn = get_db_connection()
+    try:
+        return {row[0] for row in conn.execute('SELECT DISTINCT avatar FROM users WHERE avatar IS NOT NULL')}
     finally:
         conn.close()
 
 
 def delete_user(user_id):
     conn = get_db_connection()
-    conn.execute('PRAGMA foreign_keys = ON')
     try:
+        score_stats.remove_user(conn, user_id)
+        rollups.remove_user(conn, user_id)
         conn.execute('DELETE FROM scores WHERE user_id = ?', (user_id,))
+        conn.execute(
+            '''
+            UPDATE best_score_counts SET players = players - 1
+            WHERE (game_name, best_score) IN (SELECT game_name, best_score FROM user_best_scores WHERE user_id = ?)
+        ''',
+            (user_id,),
+        )
+        conn.execute('DELETE FROM user_best_scores WHERE user_id = ?', (user_id,))
         conn.execute('DELETE FROM user_items WHERE user_id = ?', (user_id,))
         conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
         conn.commit()
+        user_cache.invalidate(user_id)
+        # 刪除玩家會影響所有遊戲的名次
+        for g in GAMES:
+            version_store.bump(f'scores:{g}')
         return True
     except Exception as e:
-        print(f"Error: {e}")
+        log.error('delete_user_failed', extra={'fields': {'user_id': user_id, 'error': str(e)}})
         conn.rollback()
         raise e
     finally:
@@ -251,32 +327,181 @@ def get_all_users():
 
 
 # --- 分數相關 ---
-def insert_score(user_id, game_name, score):
+def insert_score(user_id, game_name, score, duration=None, details=None):
+    """寫入分數；duration (秒) 與 details (moves / pieces ... ) 會一併保存供日後稽核"""
+    conn = get_db_connection()
+    try:
+        _write_score(conn, user_id, game_name, score, duration, details)
+        conn.commit()
+        user_cache.invalidate(user_id)
+        version_store.bump(f'scores:{game_name}')
+        rollup_compactor.ensure_started()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def insert_scores(rows):
+    """
+    批次寫入 [(user_id, game_name, score[, duration, details]), ...]，
+    整批一次 commit (group commit)
+    """
+    if not rows:
+        return
     conn = get_db_connection()
     try:
-        # 計算 tickets
-        rate = GAME_TICKET_RATES.get(game_name, 1.0) # 預設 1:1
-        tickets = int(round(score * rate))
-        
+        conn.execute('BEGIN IMMEDIATE')
+        for row in rows:
+            _write_score(conn, *row)
+        conn.commit()
+        user_cache.invalidate_many({r[0] for r in rows})
+        for game_name in {r[1] for r in rows}:
+            version_store.bump(f'scores:{game_name}')
+        rollup_compactor.ensure_started()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def _write_score(conn, user_id, game_name, score, duration=None, details=None):
+    """寫入一筆分數並同步更新最佳成績、日 / 週 / 賽季彙總、累計 tickets 與串流統計 (不 commit)"""
+    # 計算 tickets
+    rate = GAME_TICKET_RATES.get(game_name, 1.0) # 預設 1:1
+    tickets = int(round(score * rate))
+    details = details or {}
+
+    cur = conn.execute(
+        f'''
+        INSERT INTO scores (user_id, game_name, score, tickets_earned, duration, {', '.join(SCORE_DETAIL_FIELDS)})
+        VALUES (?, ?, ?, ?, ?, {', '.join('?' for _ in SCORE_DETAIL_FIELDS)})
+    ''',
+        (user_id, game_name, score, tickets, duration, *(details.get(f) for f in SCORE_DETAIL_FIELDS)),
+    )
+    # 同一交易內更新最佳成績 (只有破紀錄才覆寫)，並把名次計數從舊紀錄移到新紀錄
+    previous = conn.execute(
+        'SELECT best_score FROM user_best_scores WHERE user_id = ? AND game_name = ?',
+        (user_id, game_name),
+    ).fetchone()
+    conn.execute(
+        '''
+        INSERT INTO user_best_scores (user_id, game_name, best_score, achieved_at)
+        SELECT user_id, game_name, score, timestamp FROM scores WHERE id = ?
+        ON CONFLICT (user_id, game_name) DO UPDATE SET
+            best_score = excluded.best_score,
+            achieved_at = excluded.achieved_at
+        WHERE excluded.best_score > user_best_scores.best_score
+    ''',
+        (cur.lastrowid,),
+    )
+    if previous is None or score > previous[0]:
+        if previous is not None:
+            conn.execute(
+                'UPDATE best_score_counts SET players = players - 1 WHERE game_name = ? AND best_score = ?',
+                (game_name, previous[0]),
+            )
         conn.execute(
-            'INSERT INTO scores (user_id, game_name, score, tickets_earned) VALUES (?, ?, ?, ?)',
-            (user_id, game_name, score, tickets),
+            '''
+            INSERT INTO best_score_counts (game_name, best_score, players) VALUES (?, ?, 1)
+            ON CONFLICT (game_name, best_score) DO UPDATE SET players = players + 1
+        ''',
+            (game_name, score),
         )
-        conn.commit()
+    rollups.record(conn, cur.lastrowid)
+    conn.execute(
+        'UPDATE users SET tickets_earned_total = tickets_earned_total + ? WHERE id = ?',
+        (tickets, user_id),
+    )
+    score_stats.record(conn, cur.lastrowid, user_id, game_name, score)
+
+
+def get_score_stats(game_names=GAMES):
+    """各遊戲全體玩家的分數統計 (平均、標準差、最高分與 p50 / p90 / p99 估計，不超出實際的最低 / 最高分)"""
+    conn = get_db_connection()
+    try:
+        rows = {
+            r['game_name']: r
+            for r in conn.execute('SELECT game_name, n, mean, m2, min_score, max_score FROM game_score_stats')
+        }
+        result = {}
+        for g in game_names:
+            row = rows.get(g)
+            if row is None:
+                result[g] = {'n': 0}
+                continue
+            buckets = conn.execute(
+                'SELECT bucket, count FROM game_score_histogram WHERE game_name = ? ORDER BY bucket',
+                (g,),
+            ).fetchall()
+            result[g] = {
+                **score_stats.summarize(row['n'], row['mean'], row['m2'], row['max_score']),
+                **score_stats.quantiles([tuple(b) for b in buckets], low=row['min_score'], high=row['max_score']),
+            }
+        return result
     finally:
         conn.close()
 
 
-def get_leaderboard(game_name):
+def get_user_score_stats(user_id):
+    """單一玩家各遊戲的分數統計與最近一次的 z-score"""
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(
+            'SELECT game_name, n, mean, m2, max_score, last_z FROM user_score_stats WHERE user_id = ?',
+            (user_id,),
+        ).fetchall()
+        return {
+            r['game_name']: {
+                **score_stats.summarize(r['n'], r['mean'], r['m2'], r['max_score']),
+                'last_z': None if r['last_z'] is None else round(r['last_z'], 2),
+            }
+            for r in rows
+        }
+    finally:
+        conn.close()
+
+
+def get_score_outliers(user_id=None, limit=50):
+    """最近被判定為異常跳升的分數 (可只看單一玩家)"""
     conn = get_db_connection()
     try:
         query = '''
-            SELECT u.username, u.avatar, u.equipped_title, u.equipped_frame, u.equipped_effect, s.score, s.timestamp
-            FROM scores s
-            JOIN users u ON s.user_id = u.id
-            WHERE s.game_name = ?
-            GROUP BY s.user_id, s.score
-            ORDER BY s.score DESC
+            SELECT o.id, o.score_id, o.user_id, u.username, o.game_name, o.score, o.z_user, o.z_game, o.created_at
+            FROM score_outliers o JOIN users u ON u.id = o.user_id
+        '''
+        params = ()
+        if user_id is not None:
+            query += ' WHERE o.user_id = ?'
+            params = (user_id,)
+        rows = conn.execute(query + ' ORDER BY o.id DESC LIMIT ?', (*params, limit)).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def get_score_versions(game_names=GAMES):
+    """各遊戲目前的 scores 版本號 (不查詢資料庫)"""
+    return tuple(version_store.version(f'scores:{g}') for g in game_names)
+
+
+def get_leaderboard(game_name, window='all'):
+    """前 10 名；window 為 day / week / season 時取目前期間的彙總 (見 rollups.py)"""
+    if window not in LEADERBOARD_WINDOWS:
+        raise ValueError(f'unknown leaderboard window: {window}')
+    conn = get_db_connection()
+    try:
+        if window != 'all':
+            return rollups.top(conn, game_name, window, 10)
+        query = '''
+            SELECT u.username, u.avatar, u.equipped_title, u.equipped_frame, u.equipped_effect,
+                   b.best_score AS score, b.achieved_at AS timestamp
+            FROM user_best_scores b
+            JOIN users u ON b.user_id = u.id
+            WHERE b.game_name = ?
+            ORDER BY b.best_score DESC, b.user_id
             LIMIT 10
         '''
         scores = conn.execute(query, (game_name,)).fetchall()
@@ -285,35 +510,185 @@ def get_leaderboard(game_name):
         conn.close()
 
 
-def get_all_best_scores_by_user_with_rank(user_id):
+# --- 完整排行榜：keyset 分頁與「我的附近」 ---
+_RANK_COLUMNS = '''
+    b.user_id, u.username, u.avatar, u.equipped_title, u.equipped_frame, u.equipped_effect,
+    b.best_score AS score, b.achieved_at AS timestamp
+'''
+
+
+def _board(game_name, window):
+    """(資料表, WHERE 條件, 參數)：all = user_best_scores，其餘為目前期間的 leaderboard_rollups"""
+    if window == 'all':
+        return 'user_best_scores', 'b.game_name = ?', (game_name,)
+    if window not in rollups.WINDOWS:
+        raise ValueError(f'unknown leaderboard window: {window}')
+    return (
+        'leaderboard_rollups',
+        'b.game_name = ? AND b.window = ? AND b.period = ?',
+        (game_name, window, rollups.period_key(window)),
+    )
+
+
+def _board_rows(conn, board, condition, params, order, limit):
+    table, where, base = board
+    rows = conn.execute(
+        f'''
+        SELECT {_RANK_COLUMNS}
+        FROM {table} b JOIN users u ON u.id = b.user_id
+        WHERE {where} AND {condition}
+        ORDER BY {order}
+        LIMIT ?
+    ''',
+        (*base, *params, limit),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def _rows_after(conn, board, score, user_id, limit):
+    """排在 (score, user_id) 之後的 limit 筆：先接同分、user_id 較大者，再接分數較低者 (兩段都是索引範圍掃描)"""
+    rows = _board_rows(conn, board, 'b.best_score = ? AND b.user_id > ?', (score, user_id), 'b.user_id', limit)
+    if len(rows) < limit:
+        rows += _board_rows(
+            conn, board, 'b.best_score < ?', (score,), 'b.best_score DESC, b.user_id', limit - len(rows)
+        )
+    return rows
+
+
+def _rows_before(conn, board, score, user_id, limit):
+    """排在 (score, user_id) 之前最接近的 limit 筆 (反向掃描索引，回傳時依名次排序)"""
+    rows = _board_rows(conn, board, 'b.best_score = ? AND b.user_id < ?', (score, user_id), 'b.user_id DESC', limit)
+    if len(rows) < limit:
+        rows += _board_rows(
+            conn, board, 'b.best_score > ?', (score,), 'b.best_score, b.user_id DESC', limit - len(rows)
+        )
+    rows.reverse()
+    return rows
+
+
+def _count_scores(conn, board, op, score):
+    """分數 > score (op='>') 或 = score (op='=') 的玩家數；歷來榜查 best_score_counts，時間窗直接計數"""
+    table, where, params = board
+    if table == 'user_best_scores':
+        return conn.execute(
+            f'SELECT COALESCE(SUM(players), 0) FROM best_score_counts WHERE game_name = ? AND best_score {op} ?',
+            (params[0], score),
+        ).fetchone()[0]
+    return conn.execute(
+        f'SELECT COUNT(*) FROM {table} b WHERE {where} AND b.best_score {op} ?', (*params, score)
+    ).fetchone()[0]
+
+
+def _assign_ranks(conn, board, rows, previous=None):
+    """
+    rows 已依名次排序，previous = 前一名的 (分數, 名次)。同分同名次；
+    分數改變時名次 = 前一個分數的名次 + 該分數的人數，只有第一筆 (沒有 previous 時) 需要計算高於它的人數。
+    """
+    for row in rows:
+        if previous is None:
+            rank = _count_scores(conn, board, '>', row['score']) + 1
+        elif row['score'] == previous[0]:
+            rank = previous[1]
+        else:
+            rank = previous[1] + _count_scores(conn, board, '=', previous[0])
+        row['rank'] = rank
+        previous = (row['score'], rank)
+
+
+# SQLite INTEGER 為有號 64 位元；超出範圍的值繫結時會丟 OverflowError
+_SQLITE_INT_MIN, _SQLITE_INT_MAX = -(2 ** 63), 2 ** 63 - 1
+
+
+def parse_rank_cursor(cursor):
+    """next_cursor 字串 -> (分數, user_id, 名次)；格式錯誤或超出範圍丟 ValueError"""
+    score, user_id, rank = (int(part) for part in cursor.split(':'))
+    if not _SQLITE_INT_MIN <= score <= _SQLITE_INT_MAX:
+        raise ValueError('cursor score out of range')
+    if not (1 <= user_id <= _SQLITE_INT_MAX and 1 <= rank <= _SQLITE_INT_MAX):
+        raise ValueError('cursor user_id / rank out of range')
+    return score, user_id, rank
+
+
+def _public_rows(rows):
+    return [{k: v for k, v in r.items() if k != 'user_id'} for r in rows]
+
+
+def get_leaderboard_page(game_name, cursor=None, limit=50, window='all'):
+    """
+    完整排行榜的一頁。cursor 為上一頁的 next_cursor (最後一名的分數、user_id、名次)，
+    從該位置沿 (game_name, best_score DESC, user_id) 索引往下讀，不使用 OFFSET，第 5000 頁與第 1 頁成本相同。
+    """
+    board = _board(game_name, window)
+    after = parse_rank_cursor(cursor) if cursor else None
     conn = get_db_connection()
-    game_names = ['snake', 'dino', 'whac', 'memory', 'tetris', 'shaft']
-    results = {}
-    try:
-        for game_name in game_names:
-            user_score_row = conn.execute(
-                '''
-                SELECT score, timestamp FROM scores WHERE user_id = ? AND game_name = ? ORDER BY score DESC LIMIT 1
-            ''',
-                (user_id, game_name),
-            ).fetchone()
+    try:
+        if after is None:
+            rows = _board_rows(conn, board, '1', (), 'b.best_score DESC, b.user_id', limit)
+            _assign_ranks(conn, board, rows)
+        else:
+            score, user_id, rank = after
+            rows = _rows_after(conn, board, score, user_id, limit)
+            _assign_ranks(conn, board, rows, (score, rank))
+    finally:
+        conn.close()
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = f"{last['score']}:{last['user_id']}:{last['rank']}"
+    return {'rows': _public_rows(rows), 'next_cursor': next_cursor}
+
+
+def get_leaderboard_around(game_name, user_id, radius=5, window='all'):
+    """使用者自己 (me=True) 與前後各 radius 名；沒有成績時 rows 為空、rank 為 None"""
+    board = _board(game_name, window)
+    table, where, params = board
+    conn = get_db_connection()
+    try:
+        me = conn.execute(
+            f'''
+            SELECT {_RANK_COLUMNS}
+            FROM {table} b JOIN users u ON u.id = b.user_id
+            WHERE {where} AND b.user_id = ?
+        ''',
+            (*params, user_id),
+        ).fetchone()
+        if me is None:
+            return {'rows': [], 'rank': None}
+        me = dict(me)
+        rows = (
+            _rows_before(conn, board, me['score'], user_id, radius)
+            + [me]
+            + _rows_after(conn, board, me['score'], user_id, radius)
+        )
+        _assign_ranks(conn, board, rows)
+    finally:
+        conn.close()
+    me['me'] = True
+    return {'rows': _public_rows(rows), 'rank': me['rank']}
 
-            if user_score_row:
-                rank_row = conn.execute(
-                    '''
-                    SELECT COUNT(DISTINCT user_id) + 1 AS rank FROM (
-                        SELECT user_id, MAX(score) AS max_score FROM scores WHERE game_name = ? GROUP BY user_id
-                    ) AS T WHERE T.max_score > ?
-                ''',
-                    (game_name, user_score_row['score']),
-                ).fetchone()
-
-                results[game_name] = {
-                    'score': user_score_row['score'],
-                    'timestamp': user_score_row['timestamp'],
-                    'rank': rank_row['rank'],
-                }
-        return results
+
+def get_all_best_scores_by_user_with_rank(user_id):
+    """
+    一次查詢取得使用者在每款遊戲的最佳成績與名次。
+    名次 = 最佳成績比自己高的玩家數 + 1，由 best_score_counts 加總 (筆數為不同分數的個數，與玩家數無關)。
+    """
+    conn = get_db_connection()
+    placeholders = ', '.join('?' for _ in GAMES)
+    try:
+        rows = conn.execute(
+            f'''
+            SELECT b.game_name, b.best_score AS score, b.achieved_at AS timestamp,
+                   (SELECT COALESCE(SUM(c.players), 0) FROM best_score_counts c
+                    WHERE c.game_name = b.game_name AND c.best_score > b.best_score) + 1 AS rank
+            FROM user_best_scores b
+            WHERE b.user_id = ? AND b.game_name IN ({placeholders})
+        ''',
+            (user_id, *GAMES),
+        ).fetchall()
+        return {
+            row['game_name']: {'score': row['score'], 'timestamp': row['timestamp'], 'rank': row['rank']}
+            for row in rows
+        }
     finally:
         conn.close()
 
@@ -334,31 +709,39 @@ def get_all_scores_by_user(user_id):
 def get_wallet_info(user_id):
     conn = get_db_connection()
     try:
-        # 修改：計算總 tickets (從 tickets_earned 欄位)
-        # 如果舊資料 tickets_earned 是 NULL (遷移前)，使用 coalesce 或預設值 (雖已遷移但保險起見)
-        row = conn.execute(
-            'SELECT SUM(tickets_earned) as total FROM scores WHERE user_id = ?',
-            (user_id,),
-        ).fetchone()
-        
-        # 如果剛遷移完但沒分數，total 為 None
-        total_tickets = row['total'] if row['total'] is not None else 0
-        
+        # 累計 tickets 由 insert_score 維護在 users.tickets_earned_total，不必再 SUM 整個 scores
         user = conn.execute(
-            'SELECT spent_points, is_admin FROM users WHERE id = ?',
+            'SELECT tickets_earned_total, spent_points, is_admin FROM users WHERE id = ?',
             (user_id,),
         ).fetchone()
-        spent = user['spent_points'] if user else 0
-
-        # 管理員：提供實質上無限的 tickets，方便測試商店
-        if user and user['is_admin']:
-            return {'total_earned': total_tickets, 'spent': spent, 'balance': 10**12}
-
-        return {'total_earned': total_tickets, 'spent': spent, 'balance': total_tickets - spent}
+        return _wallet_from_row(user)
     finally:
         conn.close()
 
 
+def _wallet_from_row(user):
+    total_tickets = (user['tickets_earned_total'] or 0) if user else 0
+    spent = user['spent_points'] if user else 0
+
+    # 管理員：提供實質上無限的 tickets，方便測試商店
+    if user and user['is_admin']:
+        return {'total_earned': total_tickets, 'spent': spent, 'balance': 10**12}
+
+    return {'total_earned': total_tickets, 'spent': spent, 'balance': total_tickets - spent}
+
+
+def recompute_ticket_totals(conn, user_id=None):
+    """由 scores 重新計算 users.tickets_earned_total (user_id 為 None 時處理全部玩家)"""
+    query = '''
+        UPDATE users SET tickets_earned_total = COALESCE(
+            (SELECT SUM(tickets_earned) FROM scores WHERE scores.user_id = users.id), 0)
+    '''
+    if user_id is None:
+        conn.execute(query)
+    else:
+        conn.execute(query + ' WHERE id = ?', (user_id,))
+
+
 def get_user_items(user_id):
     conn = get_db_connection()
     try:
@@ -372,29 +755,38 @@ def get_user_items(user_id):
 
 
 def purchase_item(user_id, item_id, item_type, cost):
+    """
+    購買商品：餘額檢查、扣點與寫入 user_items 在同一個 BEGIN IMMEDIATE 交易內完成，
+    同時送出的多個購買請求會依序取得寫入鎖，不會重複扣款。
+    是否已擁有由 user_items (user_id, item_id) 唯一索引判斷。
+    """
     # Avatar 購買已禁用，改為使用檔案上傳
     if item_type == 'avatar':
         return False, 'Avatar purchases are disabled'
-    wallet = get_wallet_info(user_id)
-    if wallet['balance'] < cost:
-        return False, 'Insufficient funds'
     conn = get_db_connection()
     try:
-        exists = conn.execute(
-            'SELECT 1 FROM user_items WHERE user_id=? AND item_id=?',
-            (user_id, item_id),
+        conn.execute('BEGIN IMMEDIATE')
+        user = conn.execute(
+            'SELECT tickets_earned_total, spent_points, is_admin FROM users WHERE id = ?',
+            (user_id,),
         ).fetchone()
-        if exists:
+        if _wallet_from_row(user)['balance'] < cost:
+            conn.rollback()
+            return False, 'Insufficient funds'
+        try:
+            conn.execute(
+                'INSERT INTO user_items (user_id, item_id, item_type) VALUES (?, ?, ?)',
+                (user_id, item_id, item_type),
+            )
+        except sqlite3.IntegrityError:
+            conn.rollback()
             return False, 'Already owned'
         conn.execute(
             'UPDATE users SET spent_points = spent_points + ? WHERE id = ?',
             (cost, user_id),
         )
-        conn.execute(
-            'INSERT INTO user_items (user_id, item_id, item_type) VALUES (?, ?, ?)',
-            (user_id, item_id, item_type),
-        )
         conn.commit()
+        user_cache.invalidate(user_id)
         return True, 'Success'
     except Exception as e:
         conn.rollback()
@@ -432,6 +824,7 @@ def equip_item(user_id, item_type, value):
         else:
             return False
         conn.commit()
+        user_cache.invalidate(user_id)
         return True
     except Exception:
         conn.rollback()
@@ -443,30 +836,72 @@ def equip_item(user_id, item_type, value):
 def mark_user_suspect(user_id):
     """將使用者標記為作弊嫌疑犯"""
     conn = get_db_connection()
-    conn.execute('UPDATE users SET is_suspect = 1 WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    try:
+        conn.execute('UPDATE users SET is_suspect = 1 WHERE id = ?', (user_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    user_cache.invalidate(user_id)
+
+
+def mark_users_suspect(user_ids):
+    """批次標記多位使用者為作弊嫌疑犯 (離線稽核用)，回傳實際更新的人數"""
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return 0
+    conn = get_db_connection()
+    try:
+        cur = conn.executemany(
+            'UPDATE users SET is_suspect = 1 WHERE id = ? AND is_suspect = 0',
+            ((uid,) for uid in user_ids),
+        )
+        conn.commit()
+        user_cache.invalidate_many(user_ids)
+        return cur.rowcount
+    finally:
+        conn.close()
 
 
 def clear_user_suspect(user_id):
     """清除使用者的嫌疑標記（並順便清除未讀警告）"""
     conn = get_db_connection()
-    conn.execute('UPDATE users SET is_suspect = 0, warning_pending = 0 WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    try:
+        conn.execute('UPDATE users SET is_suspect = 0, warning_pending = 0 WHERE id = ?', (user_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    user_cache.invalidate(user_id)
 
 
 def set_warning_pending(user_id):
     """設定使用者下次登入需顯示警告"""
     conn = get_db_connection()
-    conn.execute('UPDATE users SET warning_pending = 1 WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    try:
+        conn.execute('UPDATE users SET warning_pending = 1 WHERE id = ?', (user_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    user_cache.invalidate(user_id)
 
 
 def clear_warning_pending(user_id):
     """清除警告標記 (表示已讀)"""
     conn = get_db_connection()
-    conn.execute('UPDATE users SET warning_pending = 0 WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    try:
+        conn.execute('UPDATE users SET warning_pending = 0 WHERE id = ?', (user_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    user_cache.invalidate(user_id)
@@ -0,0 +1,174 @@
+"""
+排行榜快取：每款遊戲在記憶體中保留排序好的前 N 名。
+
+- submit_score 寫入分數後呼叫 record_score()，只有可能擠進前 N 名時才查一次 DB
+- 玩家改名 / 換頭像 / 換裝備 / 刪帳號會影響排行榜顯示，呼叫 invalidate()
+- 以 board:<game> 版本號判斷本地快取是否過期；多個 gunicorn worker 時
+  設定 ARCADE_SHARED_VERSION_FILE 即可共用 (見 versions.py)
+- 前 N 名可能變動時呼叫 add_listener() 註冊的函式 (SSE 推播，見 rank_stream.py)
+"""
+
+import threading
+
+from .database import GAMES, get_db_connection, get_leaderboard, version_store
+
+LEADERBOARD_SIZE = 10
+
+_ROW_COLUMNS = '''
+    b.user_id, u.username, u.avatar, u.equipped_title, u.equipped_frame, u.equipped_effect,
+    b.best_score AS score, b.achieved_at AS timestamp
+'''
+
+
+class LeaderboardCache:
+    def __init__(self, versions=version_store, size=LEADERBOARD_SIZE, games=GAMES):
+        self.versions = versions
+        self.size = size
+        self.games = frozenset(games)
+        self._entries = {}   # game_name -> (version, [row dict 含 user_id])
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.incremental_updates = 0
+        self._listeners = []
+
+    def add_listener(self, fn):
+        """前 N 名可能變動時呼叫 fn(game_name) (見 rank_stream.py)"""
+        self._listeners.append(fn)
+
+    def _notify(self, game_name):
+        for fn in self._listeners:
+            fn(game_name)
+
+    # --- 讀取 ---
+    def version(self, game_name):
+        """前 N 名的版本號 (不查詢資料庫)；不在遊戲清單中的名稱回傳 None"""
+        if game_name not in self.games:
+            return None
+        return self.versions.version(board_key(game_name))
+
+    def get(self, game_name):
+        """回傳與 database.get_leaderboard() 相同格式的前 N 名"""
+        if game_name not in self.games:
+            # 不在遊戲清單中的名稱不快取，避免任意 URL 佔用記憶體
+            return get_leaderboard(game_name)
+
+        version = self.versions.version(board_key(game_name))
+        cached = self._entries.get(game_name)
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            return _public(cached[1])
+
+        self.misses += 1
+        rows = self._load(game_name)
+        with self._lock:
+            self._entries[game_name] = (version, rows)
+        return _public(rows)
+
+    def _load(self, game_name):
+        conn = get_db_connection()
+        try:
+            rows = conn.execute(
+                f'''
+                SELECT {_ROW_COLUMNS}
+                FROM user_best_scores b
+                JOIN users u ON b.user_id = u.id
+                WHERE b.game_name = ?
+                ORDER BY b.best_score DESC, b.user_id
+                LIMIT ?
+            ''',
+                (game_name, self.size),
+            ).fetchall()
+            return [dict(r) for r in rows]
+        finally:
+            conn.close()
+
+    def _load_entry(self, user_id, game_name):
+        conn = get_db_connection()
+        try:
+            row = conn.execute(
+                f'''
+                SELECT {_ROW_COLUMNS}
+                FROM user_best_scores b
+                JOIN users u ON b.user_id = u.id
+                WHERE b.user_id = ? AND b.game_name = ?
+            ''',
+                (user_id, game_name),
+            ).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    # --- 寫入 (write-through) ---
+    def record_score(self, user_id, game_name, score):
+        """
+        insert_score 之後呼叫。若分數改變了前 N 名，就地更新本地快取並遞增共用版本號。
+        回傳前 N 名是否有變動。
+        """
+        if game_name not in self.games:
+            return False
+
+        cached = self._entries.get(game_name)
+        if cached is None or cached[0] != self.versions.version(board_key(game_name)):
+            # 本地沒有最新資料，無法判斷是否擠進前 N 名：保守地讓所有 worker 重新載入
+            self.versions.bump(board_key(game_name))
+            self._notify(game_name)
+            return True
+
+        rows = cached[1]
+        if not self._changes_top(rows, user_id, score):
+            return False
+
+        entry = self._load_entry(user_id, game_name)
+        with self._lock:
+            new_rows = [r for r in rows if r['user_id'] != user_id]
+            if entry is not None:
+                new_rows.append(entry)
+            new_rows.sort(key=lambda r: (-r['score'], r['user_id']))
+            del new_rows[self.size:]
+
+            new_version = self.versions.bump(board_key(game_name))
+            if new_version == cached[0] + 1:
+                self._entries[game_name] = (new_version, new_rows)
+                self.incremental_updates += 1
+            else:
+                # 期間有其他 worker 也改過，本地版本不可信，下次讀取重新載入
+                self._entries.pop(game_name, None)
+        self._notify(game_name)
+        return True
+
+    def _changes_top(self, rows, user_id, score):
+        for r in rows:
+            if r['user_id'] == user_id:
+                return score > r['score']
+        if len(rows) < self.size:
+            return True
+        last = rows[-1]
+        return (-score, user_id) < (-last['score'], last['user_id'])
+
+    def invalidate(self, game_name=None):
+        """玩家資料 (名稱 / 頭像 / 裝備) 變動時讓排行榜重新載入"""
+        for g in ([game_name] if game_name else self.games):
+            self.versions.bump(board_key(g))
+            with self._lock:
+                self._entries.pop(g, None)
+            self._notify(g)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'incremental_updates': self.incremental_updates,
+            'cached_games': len(self._entries),
+        }
+
+
+def board_key(game_name):
+    return f'board:{game_name}'
+
+
+def _public(rows):
+    return [{k: v for k, v in r.items() if k != 'user_id'} for r in rows]
+
+
+leaderboard_cache = LeaderboardCache()
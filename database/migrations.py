@@ -0,0 +1,398 @@
+"""
+版本化的資料庫遷移。
+
+啟動時由 init_db() 呼叫 migrate()：只讀一次 schema_migrations，
+已套用的版本不會再做任何 PRAGMA table_info 探測。
+
+手動檢視 / 執行：
+    python -m database.migrations --plan     # 列出各版本狀態，不做修改
+    python -m database.migrations            # 套用尚未執行的版本並列出耗時
+"""
+
+import argparse
+import time
+
+from . import rollups, score_stats
+from .database import (
+    DB_NAME,
+    GAME_TICKET_RATES,
+    SCORE_DETAIL_FIELDS,
+    backfill_user_best_scores,
+    get_db_connection,
+    rebuild_rank_counts,
+    recompute_ticket_totals,
+)
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """註冊一個遷移步驟；版本號必須遞增且不可重複使用"""
+    def decorator(fn):
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+def add_column_if_missing(cur, table, column_def):
+    """確保指定欄位存在，若缺少則以 column_def 新增"""
+    column_name = column_def.split()[0]
+    cols = [row[1] for row in cur.execute(f"PRAGMA table_info({table})").fetchall()]
+    if column_name not in cols:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column_def}")
+        return True
+    return False
+
+
+# ==========================================
+# 遷移步驟
+# ==========================================
+
+@migration(1, 'base_schema')
+def _base_schema(conn):
+    # 取代舊的 fix_db.py / fix_shop_db.py / migrate_cosmetics.py / add_admin.py 欄位補丁
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            avatar TEXT DEFAULT 'default.png',
+            is_admin INTEGER DEFAULT 0,
+            spent_points INTEGER DEFAULT 0,
+            equipped_title TEXT DEFAULT '',
+            equipped_frame TEXT DEFAULT '',
+            equipped_badge TEXT DEFAULT '',
+            equipped_effect TEXT DEFAULT '',
+            is_suspect INTEGER DEFAULT 0,
+            warning_pending INTEGER DEFAULT 0
+        )
+    '''
+    )
+    for column_def in [
+        "avatar TEXT DEFAULT 'default.png'",
+        "is_admin INTEGER DEFAULT 0",
+        "spent_points INTEGER DEFAULT 0",
+        "equipped_title TEXT DEFAULT ''",
+        "equipped_frame TEXT DEFAULT ''",
+        "equipped_badge TEXT DEFAULT ''",
+        "equipped_effect TEXT DEFAULT ''",
+        "is_suspect INTEGER DEFAULT 0",
+        "warning_pending INTEGER DEFAULT 0",
+    ]:
+        add_column_if_missing(conn, 'users', column_def)
+
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS scores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            game_name TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            tickets_earned INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    '''
+    )
+    if add_column_if_missing(conn, 'scores', "tickets_earned INTEGER DEFAULT 0"):
+        # 舊資料：將分數換算成 tickets
+        for game, rate in GAME_TICKET_RATES.items():
+            conn.execute(
+                f"UPDATE scores SET tickets_earned = CAST(ROUND(score * {rate}) AS INTEGER) WHERE game_name = ?",
+                (game,),
+            )
+
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS user_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            item_id TEXT NOT NULL,
+            item_type TEXT NOT NULL,
+            acquired_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    '''
+    )
+
+
+@migration(2, 'user_best_scores')
+def _user_best_scores(conn):
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS user_best_scores (
+            user_id INTEGER NOT NULL,
+            game_name TEXT NOT NULL,
+            best_score INTEGER NOT NULL,
+            achieved_at DATETIME,
+            PRIMARY KEY (user_id, game_name),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    '''
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_best_scores_game_score '
+        'ON user_best_scores (game_name, best_score DESC, user_id)'
+    )
+    backfill_user_best_scores(conn)
+
+
+@migration(3, 'lookup_indexes')
+def _lookup_indexes(conn):
+    # 錢包 / 個人紀錄 (user_id)、排名 (game_name, score)、商品持有檢查 (user_id, item_id)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scores_user ON scores (user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_scores_game_score ON scores (game_name, score DESC)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_items_user_item ON user_items (user_id, item_id)')
+
+
+@migration(4, 'ticket_totals')
+def _ticket_totals(conn):
+    # 錢包讀取改用累計欄位，避免每次 SUM(tickets_earned)
+    add_column_if_missing(conn, 'users', "tickets_earned_total INTEGER DEFAULT 0")
+    recompute_ticket_totals(conn)
+
+
+@migration(5, 'unique_user_items')
+def _unique_user_items(conn):
+    # 以唯一索引取代購買前的 SELECT 檢查；舊資料若有重複 (過去的競態) 只保留最早的一筆
+    conn.execute(
+        '''
+        DELETE FROM user_items WHERE id NOT IN (
+            SELECT MIN(id) FROM user_items GROUP BY user_id, item_id
+        )
+    '''
+    )
+    conn.execute('DROP INDEX IF EXISTS idx_user_items_user_item')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS uq_user_items_user_item ON user_items (user_id, item_id)')
+
+
+@migration(6, 'score_details')
+def _score_details(conn):
+    # 保存遊玩時間與遊戲數據，門檻調整後可以離線重新驗證歷史分數 (audit_scores.py)
+    add_column_if_missing(conn, 'scores', "duration REAL")
+    for field in SCORE_DETAIL_FIELDS:
+        add_column_if_missing(conn, 'scores', f"{field} INTEGER")
+
+
+@migration(7, 'score_stats')
+def _score_stats(conn):
+    # 串流分數統計與異常紀錄 (database/score_stats.py)，建立後由 scores 歷史回填
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS user_score_stats (
+            user_id INTEGER NOT NULL,
+            game_name TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            m2 REAL NOT NULL,
+            max_score INTEGER NOT NULL,
+            last_z REAL,
+            PRIMARY KEY (user_id, game_name),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS game_score_stats (
+            game_name TEXT PRIMARY KEY,
+            n INTEGER NOT NULL,
+            mean REAL NOT NULL,
+            m2 REAL NOT NULL,
+            min_score INTEGER,
+            max_score INTEGER NOT NULL
+        )
+    '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS game_score_histogram (
+            game_name TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (game_name, bucket)
+        )
+    '''
+    )
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS score_outliers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            score_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            game_name TEXT NOT NULL,
+            score INTEGER NOT NULL,
+            z_user REAL,
+            z_game REAL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    '''
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_score_outliers_user ON score_outliers (user_id)')
+    score_stats.rebuild(conn)
+
+
+@migration(8, 'leaderboard_rollups')
+def _leaderboard_rollups(conn):
+    # 日 / 週 / 賽季排行榜 (database/rollups.py)；讀取走 (game, window, period, best_score) 索引
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS leaderboard_rollups (
+            game_name TEXT NOT NULL,
+            window TEXT NOT NULL,
+            period TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            best_score INTEGER NOT NULL,
+            achieved_at DATETIME,
+            PRIMARY KEY (game_name, window, period, user_id),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    '''
+    )
+    conn.execute(
+        'CREATE INDEX IF NOT EXISTS idx_rollups_rank '
+        'ON leaderboard_rollups (game_name, window, period, best_score DESC, user_id)'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rollups_user ON leaderboard_rollups (user_id)')
+    rollups.rebuild(conn)
+
+
+@migration(9, 'best_score_counts')
+def _best_score_counts(conn):
+    # 名次 = 分數比自己高的玩家數 + 1：加總這張表 (每個不同分數一列)，不必在 user_best_scores 上 COUNT
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS best_score_counts (
+            game_name TEXT NOT NULL,
+            best_score INTEGER NOT NULL,
+            players INTEGER NOT NULL,
+            PRIMARY KEY (game_name, best_score)
+        ) WITHOUT ROWID
+    '''
+    )
+    rebuild_rank_counts(conn)
+
+
+@migration(10, 'users_avatar_index')
+def _users_avatar_index(conn):
+    # 上傳檔 GC 需要「目前被引用的頭像」(見 avatars.py)，DISTINCT 走索引而不掃整張 users
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_avatar ON users (avatar)')
+
+
+@migration(11, 'game_score_min')
+def _game_score_min(conn):
+    # 分位數估計夾在 [最低分, 最高分] 內 (見 score_stats.quantiles)；
+    # v7 之後建立的資料庫已有這個欄位，只有早先套用 v7 的資料庫需要補上並回填
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(game_score_stats)')}
+    if 'min_score' not in columns:
+        conn.execute('ALTER TABLE game_score_stats ADD COLUMN min_score INTEGER')
+        conn.execute(
+            '''
+            UPDATE game_score_stats
+            SET min_score = (SELECT MIN(score) FROM scores s WHERE s.game_name = game_score_stats.game_name)
+        '''
+        )
+
+
+# ==========================================
+# 執行器
+# ==========================================
+
+def _ensure_version_table(conn):
+    conn.execute(
+        '''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            duration_ms REAL
+        )
+    '''
+    )
+
+
+def get_applied_versions(conn):
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+
+
+def plan(conn=None):
+    """回傳 [(version, name, applied)]，不修改資料庫"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        applied = get_applied_versions(conn)
+        return [(version, name, version in applied) for version, name, _ in MIGRATIONS]
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def migrate(conn=None, verbose=False):
+    """
+    依序套用尚未執行的遷移，每個版本各自一個 BEGIN IMMEDIATE 交易。
+    回傳 [(version, name, duration_ms)]；全部已套用時為空 list。
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    results = []
+    try:
+        applied = get_applied_versions(conn)
+        conn.commit()
+        for version, name, fn in MIGRATIONS:
+            if version in applied:
+                continue
+            start = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 多個 worker 同時啟動時，只有拿到寫入鎖的那個會真正執行
+                if conn.execute('SELECT 1 FROM schema_migrations WHERE version = ?', (version,)).fetchone():
+                    conn.rollback()
+                    continue
+                fn(conn)
+                duration_ms = (time.perf_counter() - start) * 1000
+                conn.execute(
+                    'INSERT INTO schema_migrations (version, name, duration_ms) VALUES (?, ?, ?)',
+                    (version, name, duration_ms),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            results.append((version, name, duration_ms))
+            if verbose:
+                print(f"✅ v{version:03d} {name} ({duration_ms:.1f} ms)")
+        return results
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Arcade 資料庫遷移')
+    parser.add_argument('--plan', action='store_true', help='只列出各版本狀態，不做修改')
+    args = parser.parse_args(argv)
+
+    print(f"資料庫: {DB_NAME}")
+    steps = plan()
+    for version, name, applied in steps:
+        print(f"  v{version:03d} {name:<24} {'applied' if applied else 'pending'}")
+    if args.plan:
+        return
+
+    start = time.perf_counter()
+    results = migrate(verbose=True)
+    total_ms = (time.perf_counter() - start) * 1000
+    if results:
+        print(f"🎉 套用 {len(results)} 個版本，共 {total_ms:.1f} ms")
+    else:
+        print("ℹ️ 已是最新版本。")
+
+
+if __name__ == '__main__':
+    main()
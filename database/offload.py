@@ -0,0 +1,164 @@
+"""
+把請求路徑上的 CPU 密集工作 (密碼 KDF、重播驗證) 交給有上限的執行器。
+
+每個執行器同時最多 max_pending 件工作 (執行中 + 排隊中)，超過就立即丟 Overloaded，
+由 app.py 轉成 503 + Retry-After (load shedding)，而不是讓請求在 worker 裡越排越久。
+
+環境變數 (<NAME> 為 KDF / REPLAY / AVATAR)：
+    ARCADE_<NAME>_WORKERS          process pool 大小；0 = 在請求執行緒直接執行 (仍受 max_pending 限制)
+    ARCADE_<NAME>_MAX_PENDING      同時最多幾件工作
+    ARCADE_<NAME>_TIMEOUT          等待結果的上限 (秒)
+
+預設值 (WORKERS / MAX_PENDING / TIMEOUT)：
+    KDF      min(4, CPU 數) / 32 / 5     database.py
+    REPLAY   0 / 64 / 2                  replay.py
+    AVATAR   1 / 4 / 10                  avatars.py
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+
+class Overloaded(Exception):
+    """執行器已滿或等待逾時；retry_after 為建議的重試秒數"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    def __init__(self, name, workers=0, max_pending=32, timeout=5.0):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'shed': 0,
+            'timeouts': 0,
+            'errors': 0,
+            'max_pending_seen': 0,
+            'run_ms_total': 0.0,
+        }
+
+    def _get_pool(self):
+        # fork 出來的 worker 不能沿用父行程的 pool；spawn 避免在多執行緒行程中 fork
+        if self._pool is not None and self._pid == os.getpid():
+            return self._pool
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'))
+                self._pid = os.getpid()
+            return self._pool
+
+    def _enter(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats['shed'] += 1
+                raise Overloaded(f'{self.name} executor saturated ({self._pending} pending)')
+            self._pending += 1
+            self._stats['submitted'] += 1
+            if self._pending > self._stats['max_pending_seen']:
+                self._stats['max_pending_seen'] = self._pending
+
+    def _leave(self, key, elapsed_ms=0.0):
+        with self._lock:
+            self._pending -= 1
+            self._stats[key] += 1
+            self._stats['run_ms_total'] += elapsed_ms
+
+    def run(self, fn, *args):
+        """執行 fn(*args) 並回傳結果；已滿或逾時丟 Overloaded，fn 本身的例外照常往外拋"""
+        self._enter()
+        start = time.perf_counter()
+        if self.workers <= 0:
+            try:
+                result = fn(*args)
+            except Exception:
+                self._leave('errors')
+                raise
+            self._leave('completed', (time.perf_counter() - start) * 1000)
+            return result
+
+        pool = self._get_pool()
+        try:
+            future = pool.submit(fn, *args)
+        except RuntimeError as e:          # BrokenProcessPool / 已關閉
+            self._discard(pool)
+            self._leave('errors')
+            raise Overloaded(f'{self.name} executor unavailable: {e}')
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # 還沒開始的工作直接取消；已在執行的只能讓它跑完，但不再佔用請求
+            future.cancel()
+            self._leave('timeouts')
+            raise Overloaded(f'{self.name} executor timed out after {self.timeout}s')
+        except BrokenProcessPool as e:
+            self._discard(pool)
+            self._leave('errors')
+            raise Overloaded(f'{self.name} executor unavailable: {e}')
+        except Exception:
+            self._leave('errors')
+            raise
+        self._leave('completed', (time.perf_counter() - start) * 1000)
+        return result
+
+    def _discard(self, pool):
+        """子行程異常結束後 pool 無法再使用：丟掉它，下一件工作重新建立"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['pending'] = self._pending
+        done = data['completed']
+        data['avg_ms'] = round(data.pop('run_ms_total') / done, 3) if done else 0.0
+        data['workers'] = self.workers
+        data['max_pending'] = self.max_pending
+        return data
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name, workers=0, max_pending=32, timeout=5.0):
+    """依名稱取得執行器 (每個行程一個)；ARCADE_<NAME>_* 環境變數會覆寫預設值"""
+    with _executors_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            prefix = f'ARCADE_{name.upper()}_'
+            executor = BoundedExecutor(
+                name,
+                workers=int(os.environ.get(prefix + 'WORKERS', workers)),
+                max_pending=int(os.environ.get(prefix + 'MAX_PENDING', max_pending)),
+                timeout=float(os.environ.get(prefix + 'TIMEOUT', timeout)),
+            )
+            _executors[name] = executor
+        return executor
+
+
+def executor_stats():
+    with _executors_lock:
+        executors = list(_executors.values())
+    return {e.name: e.stats() for e in executors}
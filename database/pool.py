@@ -0,0 +1,180 @@
+import os
+import sqlite3
+import threading
+import time
+
+# 連線池預設大小與等待上限 (可用環境變數調整)
+DEFAULT_POOL_SIZE = int(os.environ.get('ARCADE_DB_POOL_SIZE', '8'))
+DEFAULT_ACQUIRE_TIMEOUT = 30.0
+
+
+class PooledConnection(sqlite3.Connection):
+    """由連線池管理的 sqlite3 連線：close() 代表歸還，而非真正關閉"""
+
+    _pool = None
+    _generation = None
+
+    def close(self):
+        pool = self._pool
+        if pool is None:
+            super().close()
+        else:
+            pool.release(self)
+
+    def _really_close(self):
+        self._pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """
+    固定上限的 SQLite 連線池。
+    - 連線重複使用，PRAGMA 只在建立連線時設定一次
+    - fork 之後 (例如 gunicorn 多 worker) 子行程會自動丟棄繼承來的連線
+    - stats() 提供池大小與等待時間統計
+    """
+
+    def __init__(self, db_path, max_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        self.db_path = db_path
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        self._generation = getattr(self, '_generation', 0) + 1
+        self._idle = []
+        self._size = 0
+        self._created = 0
+        self._acquires = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=30.0,
+            check_same_thread=False,
+            factory=PooledConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn._pool = self
+        conn._generation = self._generation
+        return conn
+
+    def _check_fork(self):
+        # 子行程不可沿用父行程的 SQLite 連線，直接丟棄 (不呼叫 close，避免動到父行程的檔案鎖)
+        if self._pid != os.getpid():
+            self._cond = threading.Condition()
+            self._reset_state()
+
+    def acquire(self):
+        self._check_fork()
+        start = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._created += 1
+                    conn = None
+                    break
+                if start is None:
+                    start = time.perf_counter()
+                    self._waits += 1
+                remaining = self.timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    raise sqlite3.OperationalError('database connection pool exhausted')
+                self._cond.wait(remaining)
+
+            self._acquires += 1
+            if start is not None:
+                waited = time.perf_counter() - start
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def release(self, conn):
+        self._check_fork()
+        if conn._pool is not self or conn._generation != self._generation:
+            # fork 前借出的連線：只斷開參照，不在子行程中操作它
+            conn._pool = None
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            # 連線已損壞：丟棄並釋出名額
+            conn._really_close()
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close_all(self):
+        """關閉所有閒置連線 (借出中的連線歸還時會重新入池)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn in idle:
+            conn._really_close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'created': self._created,
+                'acquires': self._acquires,
+                'waits': self._waits,
+                'wait_time_total': round(self._wait_total, 6),
+                'wait_time_max': round(self._wait_max, 6),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path):
+    """取得 (必要時建立) 指定資料庫路徑的連線池"""
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                pool = _pools[db_path] = ConnectionPool(db_path)
+    return pool
+
+
+def _after_fork_in_child():
+    global _pools_lock
+    _pools_lock = threading.Lock()
+    for pool in _pools.values():
+        pool._check_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
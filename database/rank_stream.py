@@ -0,0 +1,290 @@
+"""
+排行榜即時推播 (SSE /api/stream/rank/<game>) 的行程內 pub/sub。
+
+- leaderboard_cache 在前 N 名可能變動時 (record_score / invalidate) 通知這裡
+- 背景執行緒比對 board:<game> 版本號，有變動才讀一次前 N 名 (每個行程每次變動一次查詢，
+  與訂閱人數無關)，只有內容真的不同才發佈 diff
+- 多個 gunicorn worker 時其他行程的變動透過共用版本號發現 (每 POLL_SECONDS 秒讀一次，只是記憶體讀取)
+
+訂閱者不各自持有佇列：每款遊戲一個 Channel，保存最近 HISTORY 筆 diff 與遞增序號，
+訂閱者只記住自己讀到的序號並等待：
+- WSGI (app.py)：在 Condition 上等待，閒置訂閱者佔一個等待中的執行緒 / greenlet
+  (gevent monkey patch 下 Condition 等待即為 greenlet 切換)
+- ASGI (asgi.py)：aevents() 在 asyncio.Event 上等待，發佈時以 loop.call_soon_threadsafe 喚醒，
+  閒置訂閱者不佔任何執行緒
+
+    ARCADE_RANK_STREAM_MAX=5000         每個行程最多幾個訂閱者 (超過回 503)
+    ARCADE_RANK_STREAM_KEEPALIVE=15     幾秒沒有事件就送一行註解，偵測斷線
+    ARCADE_RANK_STREAM_POLL=1           檢查其他行程變動的間隔 (秒)
+"""
+
+import asyncio
+import json
+import os
+import threading
+import uuid
+from collections import deque
+
+from .database import GAMES, version_store
+from .leaderboard_cache import board_key, leaderboard_cache
+
+MAX_SUBSCRIBERS = int(os.environ.get('ARCADE_RANK_STREAM_MAX', '5000'))
+KEEPALIVE_SECONDS = float(os.environ.get('ARCADE_RANK_STREAM_KEEPALIVE', '15'))
+POLL_SECONDS = float(os.environ.get('ARCADE_RANK_STREAM_POLL', '1'))
+HISTORY = 64
+RETRY_MS = 3000
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+def diff_rows(old, new):
+    """回傳 {名次 index: 新的 row}；只包含內容不同的名次 (長度變化由 size 表示)"""
+    changed = {}
+    for i, row in enumerate(new):
+        if i >= len(old) or old[i] != row:
+            changed[str(i)] = row
+    return changed
+
+
+def format_event(event, data, event_id=None):
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+class Channel:
+    def __init__(self, game_name, history=HISTORY):
+        self.game_name = game_name
+        self.cond = threading.Condition()
+        self.seq = 0
+        # 事件 id 為 "<epoch>:<seq>"；epoch 每個行程不同，重新連到別的 worker 時不會誤用序號
+        self.epoch = uuid.uuid4().hex[:8]
+        self.rows = None              # 目前的前 N 名 (None = 尚未載入)
+        self.board_version = None
+        self.history = deque(maxlen=history)   # (seq, 已格式化的 diff 事件)
+        self.waiters = set()                   # async 訂閱者的 (event loop, asyncio.Event)
+
+    def publish(self, rows, board_version):
+        """rows 與目前內容不同時產生 diff 並喚醒所有訂閱者；回傳是否有發佈"""
+        with self.cond:
+            self.board_version = board_version
+            if self.rows is not None and rows == self.rows:
+                return False
+            old = self.rows or []
+            self.rows = rows
+            self.seq += 1
+            payload = {'changed': diff_rows(old, rows), 'size': len(rows)}
+            self.history.append((self.seq, format_event('diff', payload, self.event_id(self.seq))))
+            self.cond.notify_all()
+            for loop, event in self.waiters:
+                try:
+                    loop.call_soon_threadsafe(event.set)
+                except RuntimeError:
+                    # event loop 已關閉；訂閱者會在 aevents() 結束時自行移除
+                    pass
+            return True
+
+    def event_id(self, seq):
+        return f'{self.epoch}:{seq}'
+
+    def snapshot(self):
+        with self.cond:
+            return self.seq, format_event('snapshot', {'rows': self.rows or []}, self.event_id(self.seq))
+
+
+class Subscription:
+    """subscribe() 回傳的 SSE 事件 iterable；WSGI 伺服器在連線結束時呼叫 close() 歸還名額"""
+
+    def __init__(self, stream, events):
+        self._stream = stream
+        self._events = events
+        self._closed = False
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._events.close()
+            self._stream.unsubscribe()
+
+
+class RankStream:
+    def __init__(self, cache=leaderboard_cache, versions=version_store, games=GAMES,
+                 max_subscribers=MAX_SUBSCRIBERS, keepalive=KEEPALIVE_SECONDS, poll=POLL_SECONDS):
+        self.cache = cache
+        self.versions = versions
+        self.channels = {g: Channel(g) for g in games}
+        self.max_subscribers = max_subscribers
+        self.keepalive = keepalive
+        self.poll = poll
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.subscribers = 0
+        self.published = 0
+        self.suppressed = 0
+        self.loads = 0
+        cache.add_listener(self.notify)
+
+    # --- 發佈端 ---
+    def notify(self, game_name=None):
+        """前 N 名可能變動 (由 leaderboard_cache 呼叫)；實際比對在背景執行緒進行"""
+        if self.subscribers:
+            self._wakeup.set()
+
+    def refresh(self, game_name):
+        """版本號有變就重新讀取並發佈 (背景執行緒與測試 / 壓測使用)"""
+        channel = self.channels[game_name]
+        version = self.versions.version(board_key(game_name))
+        if channel.rows is not None and channel.board_version == version:
+            return False
+        rows = self.cache.get(game_name)
+        self.loads += 1
+        if channel.publish(rows, version):
+            self.published += 1
+            return True
+        self.suppressed += 1
+        return False
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.poll)
+            self._wakeup.clear()
+            if not self.subscribers:
+                continue
+            for game_name in self.channels:
+                try:
+                    self.refresh(game_name)
+                except Exception:
+                    # 資料庫暫時無法讀取時下一輪再試，不讓背景執行緒結束
+                    pass
+
+    def _ensure_thread(self):
+        # fork 出來的 worker 需要自己的背景執行緒
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                if self._pid is not None:
+                    for channel in self.channels.values():
+                        with channel.cond:
+                            channel.epoch = uuid.uuid4().hex[:8]
+                            channel.history.clear()
+                self._thread = threading.Thread(target=self._run, name='rank-stream', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    # --- 訂閱端 ---
+    def subscribe(self, game_name, last_event_id=None):
+        """佔用一個訂閱名額並回傳 Subscription；超過上限丟 TooManySubscribers"""
+        channel = self.acquire(game_name)
+        return Subscription(self, self._events(channel, last_event_id))
+
+    def acquire(self, game_name):
+        """佔用一個訂閱名額並回傳該遊戲的 Channel (必要時先讀一次前 N 名)；結束時呼叫 unsubscribe()"""
+        with self._lock:
+            if self.subscribers >= self.max_subscribers:
+                raise TooManySubscribers(f'{self.subscribers} subscribers')
+            self.subscribers += 1
+        self._ensure_thread()
+        channel = self.channels[game_name]
+        try:
+            if channel.rows is None:
+                self.refresh(game_name)
+        except Exception:
+            self.unsubscribe()
+            raise
+        return channel
+
+    def unsubscribe(self):
+        with self._lock:
+            self.subscribers -= 1
+
+    def _events(self, channel, last_event_id):
+        """先送 snapshot (或 Last-Event-ID 之後錯過的 diff)，之後只在前 N 名變動時送 diff"""
+        yield f'retry: {RETRY_MS}\n\n'
+        seq = self._resume(channel, last_event_id)
+        if seq is None:
+            seq, event = channel.snapshot()
+            yield event
+        while True:
+            with channel.cond:
+                if channel.seq == seq:
+                    channel.cond.wait(self.keepalive)
+                pending, seq = self._pending(channel, seq)
+            if pending is None:
+                yield ': keepalive\n\n'
+            else:
+                yield ''.join(pending)
+
+    async def aevents(self, channel, last_event_id):
+        """_events 的 async 版 (asgi.py 使用)：等待時不佔執行緒；名額由呼叫端以 acquire / unsubscribe 管理"""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, asyncio.Event())
+        yield f'retry: {RETRY_MS}\n\n'
+        seq = self._resume(channel, last_event_id)
+        if seq is None:
+            seq, event = channel.snapshot()
+            yield event
+        with channel.cond:
+            channel.waiters.add(waiter)
+        try:
+            while True:
+                # 先清除再檢查序號：檢查之後才發佈的 diff 一定會再次 set
+                waiter[1].clear()
+                with channel.cond:
+                    pending, seq = self._pending(channel, seq)
+                if pending is not None:
+                    yield ''.join(pending)
+                    continue
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+        finally:
+            with channel.cond:
+                channel.waiters.discard(waiter)
+
+    @staticmethod
+    def _pending(channel, seq):
+        """回傳 (seq 之後要送的事件或 None, 新的 seq)；呼叫端需持有 channel.cond"""
+        if channel.seq == seq:
+            return None, seq
+        if channel.history and channel.history[0][0] <= seq + 1:
+            return [event for s, event in channel.history if s > seq], channel.seq
+        # 落後超過保留的 diff 數量：改送完整 snapshot
+        return [format_event('snapshot', {'rows': channel.rows or []}, channel.event_id(channel.seq))], channel.seq
+
+    def _resume(self, channel, last_event_id):
+        """Last-Event-ID 仍在保留範圍內時回傳該序號，讓重新連線只補送錯過的 diff"""
+        epoch, _, seq = (last_event_id or '').partition(':')
+        try:
+            seq = int(seq)
+        except ValueError:
+            return None
+        with channel.cond:
+            if epoch != channel.epoch:
+                return None
+            if seq == channel.seq or (channel.history and channel.history[0][0] <= seq + 1 <= channel.seq):
+                return seq
+        return None
+
+    def stats(self):
+        return {
+            'subscribers': self.subscribers,
+            'max_subscribers': self.max_subscribers,
+            'published': self.published,
+            'suppressed': self.suppressed,
+            'loads': self.loads,
+            'sequences': {g: c.seq for g, c in self.channels.items()},
+        }
+
+
+rank_stream = RankStream()
@@ -0,0 +1,62 @@
+"""
+核對 users.tickets_earned_total 與 scores 的原始加總是否一致。
+
+    python -m database.reconcile_tickets          # 只列出不一致的玩家
+    python -m database.reconcile_tickets --fix    # 以 scores 為準修正
+"""
+
+import argparse
+
+from .database import DB_NAME, get_db_connection, init_db, recompute_ticket_totals
+
+
+def find_ticket_mismatches(conn):
+    """回傳 [(user_id, username, stored_total, actual_total)]"""
+    rows = conn.execute(
+        '''
+        SELECT u.id, u.username, u.tickets_earned_total AS stored,
+               COALESCE(s.total, 0) AS actual
+        FROM users u
+        LEFT JOIN (
+            SELECT user_id, SUM(tickets_earned) AS total FROM scores GROUP BY user_id
+        ) s ON s.user_id = u.id
+        WHERE COALESCE(u.tickets_earned_total, 0) != COALESCE(s.total, 0)
+        ORDER BY u.id
+    '''
+    ).fetchall()
+    return [(r['id'], r['username'], r['stored'], r['actual']) for r in rows]
+
+
+def reconcile(fix=False):
+    conn = get_db_connection()
+    try:
+        mismatches = find_ticket_mismatches(conn)
+        if fix:
+            for user_id, _, _, _ in mismatches:
+                recompute_ticket_totals(conn, user_id)
+            conn.commit()
+        return mismatches
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='核對玩家累計 tickets')
+    parser.add_argument('--fix', action='store_true', help='以 scores 加總覆寫不一致的累計值')
+    args = parser.parse_args(argv)
+
+    print(f"資料庫: {DB_NAME}")
+    init_db()
+    mismatches = reconcile(fix=args.fix)
+    for user_id, username, stored, actual in mismatches:
+        print(f"  #{user_id} {username}: 累計 {stored} / 實際 {actual}")
+    if not mismatches:
+        print("✅ 所有玩家的累計 tickets 都一致。")
+    elif args.fix:
+        print(f"🔧 已修正 {len(mismatches)} 位玩家。")
+    else:
+        print(f"⚠️ {len(mismatches)} 位玩家不一致，加上 --fix 可修正。")
+
+
+if __name__ == '__main__':
+    main()
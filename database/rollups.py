@@ -0,0 +1,229 @@
+"""
+日 / 週 / 賽季排行榜的預先彙總 (由 _write_score 在同一個交易內呼叫)。
+
+- leaderboard_rollups   (game_name, window, period, user_id) -> 該期間的最佳成績
+- 每筆分數對三種期間各做一次 UPSERT (只有破該期間紀錄才覆寫)，與 scores 資料量無關
+- 讀取走 (game_name, window, period, best_score DESC) 索引取前 N 名，不掃 scores、不解析 timestamp
+- 已結束的期間由背景執行緒壓縮成只保留前 KEEP_TOP 名 (仍可查詢過去的榜單)，日榜超過保留天數整期刪除
+
+期間以 UTC (與 scores.timestamp 的 CURRENT_TIMESTAMP 相同) 起始日表示：
+    day     2026-10-17
+    week    該週星期一，例如 2026-10-12
+    season  每 ARCADE_SEASON_MONTHS 個月一季 (每年重新起算)，例如 2026-10-01
+
+    ARCADE_SEASON_MONTHS=3                  賽季長度 (月)；修改後請執行 --rebuild
+    ARCADE_ROLLUP_KEEP_TOP=100              已結束的期間保留前幾名
+    ARCADE_ROLLUP_DAY_RETENTION=90          日榜保留天數
+    ARCADE_ROLLUP_COMPACT_INTERVAL=3600     背景壓縮間隔 (秒)；0 = 不在背景執行
+
+手動執行：
+    python -m database.rollups --compact
+    python -m database.rollups --rebuild    # 由 scores 歷史重建
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+SEASON_MONTHS = max(1, min(12, int(os.environ.get('ARCADE_SEASON_MONTHS', '3'))))
+KEEP_TOP = int(os.environ.get('ARCADE_ROLLUP_KEEP_TOP', '100'))
+DAY_RETENTION = int(os.environ.get('ARCADE_ROLLUP_DAY_RETENTION', '90'))
+COMPACT_INTERVAL = float(os.environ.get('ARCADE_ROLLUP_COMPACT_INTERVAL', '3600'))
+
+# window -> 由 timestamp 欄位算出期間起始日的 SQL 運算式 (寫入與重建共用，必須與 period_key() 一致)
+PERIOD_SQL = {
+    'day': "date({ts})",
+    'week': "date({ts}, 'weekday 0', '-6 days')",
+    'season': (
+        "printf('%04d-%02d-01', CAST(strftime('%Y', {ts}) AS INTEGER), "
+        f"(CAST(strftime('%m', {{ts}}) AS INTEGER) - 1) / {SEASON_MONTHS} * {SEASON_MONTHS} + 1)"
+    ),
+}
+WINDOWS = tuple(PERIOD_SQL)
+
+log = logging.getLogger(__name__)
+
+
+def period_key(window, when=None):
+    """目前 (或 when 時) 所在期間的起始日字串"""
+    day = (when or datetime.now(timezone.utc)).date()
+    if window == 'day':
+        return day.isoformat()
+    if window == 'week':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if window == 'season':
+        return f'{day.year:04d}-{(day.month - 1) // SEASON_MONTHS * SEASON_MONTHS + 1:02d}-01'
+    raise ValueError(f'unknown leaderboard window: {window}')
+
+
+_RECORD_SQL = '''
+    INSERT INTO leaderboard_rollups (game_name, window, period, user_id, best_score, achieved_at)
+    SELECT game_name, window, period, user_id, score, timestamp FROM ({}) WHERE 1
+    ON CONFLICT (game_name, window, period, user_id) DO UPDATE SET
+        best_score = excluded.best_score,
+        achieved_at = excluded.achieved_at
+    WHERE excluded.best_score > leaderboard_rollups.best_score
+'''.format(' UNION ALL '.join(
+    f"SELECT game_name, '{w}' AS window, {sql.format(ts='timestamp')} AS period, user_id, score, timestamp "
+    "FROM scores WHERE id = :score_id"
+    for w, sql in PERIOD_SQL.items()
+))
+
+
+def record(conn, score_id):
+    """把剛寫入的分數併入三種期間的彙總 (一個陳述式)"""
+    conn.execute(_RECORD_SQL, {'score_id': score_id})
+
+
+def remove_user(conn, user_id):
+    conn.execute('DELETE FROM leaderboard_rollups WHERE user_id = ?', (user_id,))
+
+
+def rebuild(conn):
+    """由 scores 歷史重建 (遷移時或修改賽季長度後執行)；SQLite 的 MAX() 讓 timestamp 取自最高分那一列"""
+    conn.execute('DELETE FROM leaderboard_rollups')
+    for window, sql in PERIOD_SQL.items():
+        period = sql.format(ts='timestamp')
+        conn.execute(
+            f'''
+            INSERT INTO leaderboard_rollups (game_name, window, period, user_id, best_score, achieved_at)
+            SELECT game_name, ?, {period}, user_id, MAX(score), timestamp
+            FROM scores
+            GROUP BY game_name, {period}, user_id
+        ''',
+            (window,),
+        )
+
+
+def top(conn, game_name, window, limit, when=None):
+    """目前期間的前 limit 名 (與 get_leaderboard 相同欄位)"""
+    rows = conn.execute(
+        '''
+        SELECT u.username, u.avatar, u.equipped_title, u.equipped_frame, u.equipped_effect,
+               r.best_score AS score, r.achieved_at AS timestamp
+        FROM leaderboard_rollups r
+        JOIN users u ON r.user_id = u.id
+        WHERE r.game_name = ? AND r.window = ? AND r.period = ?
+        ORDER BY r.best_score DESC, r.user_id
+        LIMIT ?
+    ''',
+        (game_name, window, period_key(window, when), limit),
+    ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def compact(conn, when=None, keep_top=KEEP_TOP, day_retention=DAY_RETENTION):
+    """
+    已結束的期間只保留前 keep_top 名，超過 day_retention 天的日榜整期刪除 (不 commit)。
+    回傳刪除的列數。壓縮過的期間每期至多 keep_top 列，之後重複執行只掃描這些列。
+    """
+    now = when or datetime.now(timezone.utc)
+    deleted = 0
+    if day_retention > 0:
+        cutoff = period_key('day', now - timedelta(days=day_retention))
+        deleted += conn.execute(
+            "DELETE FROM leaderboard_rollups WHERE window = 'day' AND period < ?", (cutoff,)
+        ).rowcount
+    for window in WINDOWS:
+        deleted += conn.execute(
+            '''
+            DELETE FROM leaderboard_rollups WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (
+                        PARTITION BY game_name, period ORDER BY best_score DESC, user_id
+                    ) AS position
+                    FROM leaderboard_rollups
+                    WHERE window = ? AND period < ?
+                )
+                WHERE position > ?
+            )
+        ''',
+            (window, period_key(window, now), keep_top),
+        ).rowcount
+    return deleted
+
+
+class Compactor:
+    """定期執行 compact() 的背景執行緒；第一次寫入分數時啟動 (fork 之後每個 worker 各自一條)"""
+
+    def __init__(self, connect, interval=COMPACT_INTERVAL):
+        self.connect = connect
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self.runs = 0
+        self.deleted = 0
+        self.errors = 0
+
+    def ensure_started(self):
+        if self.interval <= 0 or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='rollup-compactor', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.run_once()
+
+    def run_once(self):
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            deleted = compact(conn)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self.errors += 1
+            log.error('rollup_compact_failed', extra={'fields': {'error': str(e)}})
+            return 0
+        finally:
+            conn.close()
+        self.runs += 1
+        self.deleted += deleted
+        if deleted:
+            log.info('rollup_compacted', extra={'fields': {'deleted': deleted}})
+        return deleted
+
+    def stats(self):
+        return {'interval': self.interval, 'runs': self.runs, 'deleted': self.deleted, 'errors': self.errors}
+
+
+def main(argv=None):
+    from .database import DB_NAME, get_db_connection, init_db
+
+    parser = argparse.ArgumentParser(description='日 / 週 / 賽季排行榜彙總')
+    parser.add_argument('--compact', action='store_true', help='壓縮已結束的期間')
+    parser.add_argument('--rebuild', action='store_true', help='由 scores 歷史重建')
+    args = parser.parse_args(argv)
+
+    print(f"資料庫: {DB_NAME}")
+    init_db()
+    conn = get_db_connection()
+    try:
+        if args.rebuild:
+            conn.execute('BEGIN IMMEDIATE')
+            rebuild(conn)
+            conn.commit()
+        if args.compact:
+            conn.execute('BEGIN IMMEDIATE')
+            deleted = compact(conn)
+            conn.commit()
+            print(f"壓縮：刪除 {deleted} 列")
+        for window, period, n in conn.execute(
+            'SELECT window, period, COUNT(*) FROM leaderboard_rollups GROUP BY window, period ORDER BY window, period'
+        ):
+            print(f"  {window:<7} {period}  {n} 列")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+分數寫入：同步 (預設) 或 write-behind 批次寫入。
+
+開啟 write-behind (由單一背景執行緒以 group commit 寫入)：
+    ARCADE_SCORE_WRITE_BEHIND=1
+    ARCADE_SCORE_FLUSH_SIZE=100        # 一批最多幾筆
+    ARCADE_SCORE_FLUSH_INTERVAL=0.05   # 收到第一筆後最多等幾秒就寫入
+    ARCADE_SCORE_QUEUE_SIZE=10000      # 佇列上限，滿了改為同步寫入
+
+行程正常結束 (atexit) 時會先把佇列中的分數全部寫完。
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from .database import insert_score, insert_scores
+from .leaderboard_cache import leaderboard_cache
+
+_STOP = object()
+log = logging.getLogger(__name__)
+
+
+class ScoreWriter:
+    def __init__(self, flush_size=100, flush_interval=0.05, max_queue=10000):
+        self.flush_size = max(1, flush_size)
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._start_lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'flush_ms_total': 0.0,
+            'flush_ms_max': 0.0,
+            'max_depth': 0,
+            'sync_fallbacks': 0,
+            'errors': 0,
+        }
+
+    def _ensure_started(self):
+        # 延後到第一次使用才啟動 (fork 之後每個 worker 各自有一個寫入執行緒)
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._thread = threading.Thread(target=self._run, name='score-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, user_id, game_name, score, duration=None, details=None):
+        self._ensure_started()
+        row = (user_id, game_name, score, duration, details)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # 佇列已滿：由請求執行緒直接寫入，避免遺失
+            self._count('sync_fallbacks')
+            _write_now(*row)
+            return
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self._stats['enqueued'] += 1
+            if depth > self._stats['max_depth']:
+                self._stats['max_depth'] = depth
+
+    def _run(self):
+        q = self._queue
+        while True:
+            item = q.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = q.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stop:
+                self._drain()
+                return
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        for i in range(0, len(batch), self.flush_size):
+            self._flush(batch[i:i + self.flush_size])
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        try:
+            insert_scores(batch)
+        except Exception as e:
+            # 整批失敗時逐筆重試，只丟棄真正寫不進去的那幾筆
+            log.warning('score_batch_failed', extra={'fields': {'size': len(batch), 'error': str(e)}})
+            self._count('errors')
+            written = []
+            for row in batch:
+                try:
+                    insert_score(*row)
+                    written.append(row)
+                except Exception as row_error:
+                    log.error('score_dropped', extra={'fields': {'row': row[:3], 'error': str(row_error)}})
+            batch = written
+        for user_id, game_name, score, *_ in batch:
+            leaderboard_cache.record_score(user_id, game_name, score)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            s = self._stats
+            s['written'] += len(batch)
+            s['batches'] += 1
+            s['last_batch_size'] = len(batch)
+            s['flush_ms_total'] += elapsed_ms
+            s['flush_ms_max'] = max(s['flush_ms_max'], elapsed_ms)
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def close(self, timeout=30.0):
+        """寫完佇列中所有分數後停止背景執行緒"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        with self._stats_lock:
+            data = dict(self._stats)
+        data['queue_depth'] = self._queue.qsize() if self._queue is not None else 0
+        data['flush_ms_total'] = round(data['flush_ms_total'], 3)
+        data['flush_ms_max'] = round(data['flush_ms_max'], 3)
+        return data
+
+
+def _write_now(user_id, game_name, score, duration=None, details=None):
+    insert_score(user_id, game_name, score, duration, details)
+    leaderboard_cache.record_score(user_id, game_name, score)
+
+
+def _create_writer():
+    if os.environ.get('ARCADE_SCORE_WRITE_BEHIND', '0') != '1':
+        return None
+    writer = ScoreWriter(
+        flush_size=int(os.environ.get('ARCADE_SCORE_FLUSH_SIZE', '100')),
+        flush_interval=float(os.environ.get('ARCADE_SCORE_FLUSH_INTERVAL', '0.05')),
+        max_queue=int(os.environ.get('ARCADE_SCORE_QUEUE_SIZE', '10000')),
+    )
+    atexit.register(writer.close)
+    return writer
+
+
+score_writer = _create_writer()
+
+
+def save_score(user_id, game_name, score, duration=None, details=None):
+    """submit_score 的寫入入口：依設定同步寫入或放入 write-behind 佇列"""
+    if score_writer is not None:
+        score_writer.submit(user_id, game_name, score, duration, details)
+    else:
+        _write_now(user_id, game_name, score, duration, details)
+
+
+def score_writer_stats():
+    if score_writer is None:
+        return {'enabled': False}
+    return {'enabled': True, **score_writer.stats()}
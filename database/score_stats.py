@@ -0,0 +1,246 @@
+"""
+串流分數統計與異常偵測 (由 _write_score 在同一個交易內呼叫)。
+
+- user_score_stats   每位玩家每款遊戲的 Welford 平均 / 變異數 (n, mean, m2) 與最高分
+- game_score_stats   每款遊戲全體玩家的 Welford 統計與最低 / 最高分
+- game_score_histogram  對數分桶的分數分布 (每 2 倍分 4 桶，估計分位數誤差約 ±10%)
+- score_outliers     新分數相對自己的歷史或全體分布是極端跳升時記錄一筆
+
+每筆分數只做主鍵查詢與 UPSERT，與 scores 資料量無關 (O(1))。
+
+門檻 (環境變數)：
+    ARCADE_OUTLIER_Z_USER=4      相對自己歷史的 z-score 上限
+    ARCADE_OUTLIER_Z_GAME=6      相對全體玩家的 z-score 上限
+    ARCADE_OUTLIER_MIN_USER=5    自己至少要有幾筆紀錄才判斷
+    ARCADE_OUTLIER_MIN_GAME=30   全體至少要有幾筆紀錄才判斷
+"""
+
+import math
+import os
+
+Z_USER = float(os.environ.get('ARCADE_OUTLIER_Z_USER', '4'))
+Z_GAME = float(os.environ.get('ARCADE_OUTLIER_Z_GAME', '6'))
+MIN_USER_HISTORY = int(os.environ.get('ARCADE_OUTLIER_MIN_USER', '5'))
+MIN_GAME_HISTORY = int(os.environ.get('ARCADE_OUTLIER_MIN_GAME', '30'))
+
+BUCKETS_PER_OCTAVE = 4
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def bucket_of(score):
+    """分數 -> 桶編號；0 分 (含負數) 為第 0 桶"""
+    if score < 1:
+        return 0
+    return int(math.log2(score) * BUCKETS_PER_OCTAVE) + 1
+
+
+def bucket_bounds(bucket):
+    """桶編號 -> [low, high) 分數範圍"""
+    if bucket == 0:
+        return 0.0, 1.0
+    return 2 ** ((bucket - 1) / BUCKETS_PER_OCTAVE), 2 ** (bucket / BUCKETS_PER_OCTAVE)
+
+
+def _std(n, m2):
+    return math.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+
+
+def _z(score, n, mean, m2):
+    std = _std(n, m2)
+    if std == 0:
+        return None
+    return (score - mean) / std
+
+
+def _welford(row, score):
+    """回傳加入 score 後的 (n, mean, m2)"""
+    n, mean, m2 = row if row else (0, 0.0, 0.0)
+    n += 1
+    delta = score - mean
+    mean += delta / n
+    m2 += delta * (score - mean)
+    return n, mean, m2
+
+
+def record(conn, score_id, user_id, game_name, score):
+    """
+    先以更新前的統計計算 z-score (與過去比較)，再把這筆分數併入統計。
+    回傳 (z_user, z_game, flagged)。
+    """
+    user_row = conn.execute(
+        'SELECT n, mean, m2 FROM user_score_stats WHERE user_id = ? AND game_name = ?',
+        (user_id, game_name),
+    ).fetchone()
+    game_row = conn.execute(
+        'SELECT n, mean, m2 FROM game_score_stats WHERE game_name = ?',
+        (game_name,),
+    ).fetchone()
+
+    z_user = _z(score, *user_row) if user_row and user_row[0] >= MIN_USER_HISTORY else None
+    z_game = _z(score, *game_row) if game_row and game_row[0] >= MIN_GAME_HISTORY else None
+    # 只看往上跳：作弊會讓分數變高，突然變低不是問題
+    flagged = (z_user is not None and z_user > Z_USER) or (z_game is not None and z_game > Z_GAME)
+    if flagged:
+        conn.execute(
+            '''
+            INSERT INTO score_outliers (score_id, user_id, game_name, score, z_user, z_game)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''',
+            (score_id, user_id, game_name, score, z_user, z_game),
+        )
+
+    n, mean, m2 = _welford(user_row and tuple(user_row), score)
+    conn.execute(
+        '''
+        INSERT INTO user_score_stats (user_id, game_name, n, mean, m2, max_score, last_z)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, game_name) DO UPDATE SET
+            n = excluded.n, mean = excluded.mean, m2 = excluded.m2,
+            max_score = MAX(user_score_stats.max_score, excluded.max_score),
+            last_z = excluded.last_z
+    ''',
+        (user_id, game_name, n, mean, m2, score, z_user),
+    )
+    n, mean, m2 = _welford(game_row and tuple(game_row), score)
+    conn.execute(
+        '''
+        INSERT INTO game_score_stats (game_name, n, mean, m2, min_score, max_score) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (game_name) DO UPDATE SET
+            n = excluded.n, mean = excluded.mean, m2 = excluded.m2,
+            min_score = MIN(COALESCE(game_score_stats.min_score, excluded.min_score), excluded.min_score),
+            max_score = MAX(game_score_stats.max_score, excluded.max_score)
+    ''',
+        (game_name, n, mean, m2, score, score),
+    )
+    conn.execute(
+        '''
+        INSERT INTO game_score_histogram (game_name, bucket, count) VALUES (?, ?, 1)
+        ON CONFLICT (game_name, bucket) DO UPDATE SET count = count + 1
+    ''',
+        (game_name, bucket_of(score)),
+    )
+    return z_user, z_game, flagged
+
+
+def remove_user(conn, user_id):
+    """刪除玩家前呼叫：把該玩家的分數從全體統計中扣除 (Chan 合併公式的反向)"""
+    rows = conn.execute(
+        'SELECT game_name, n, mean, m2 FROM user_score_stats WHERE user_id = ?',
+        (user_id,),
+    ).fetchall()
+    for game_name, n_u, mean_u, m2_u in rows:
+        game_row = conn.execute(
+            'SELECT n, mean, m2 FROM game_score_stats WHERE game_name = ?',
+            (game_name,),
+        ).fetchone()
+        if not game_row:
+            continue
+        n, mean, m2 = game_row
+        n_rest = n - n_u
+        if n_rest <= 0:
+            conn.execute('DELETE FROM game_score_stats WHERE game_name = ?', (game_name,))
+            continue
+        mean_rest = (n * mean - n_u * mean_u) / n_rest
+        delta = mean_u - mean_rest
+        m2_rest = max(0.0, m2 - m2_u - delta * delta * n_rest * n_u / n)
+        # 最低 / 最高分無法扣回，改由其他玩家的分數重新取得 (走 idx_scores_game_score，遇到第一筆別人的分數即停)
+        min_rest, max_rest = (
+            conn.execute(
+                f'SELECT score FROM scores WHERE game_name = ? AND user_id != ? ORDER BY score {order} LIMIT 1',
+                (game_name, user_id),
+            ).fetchone()
+            for order in ('ASC', 'DESC')
+        )
+        conn.execute(
+            'UPDATE game_score_stats SET n = ?, mean = ?, m2 = ?, min_score = ?, max_score = ? WHERE game_name = ?',
+            (n_rest, mean_rest, m2_rest, min_rest and min_rest[0], max_rest and max_rest[0], game_name),
+        )
+    # 分布桶：以該玩家自己的分數扣回 (走 idx_scores_user)
+    counts = {}
+    for game_name, score in conn.execute('SELECT game_name, score FROM scores WHERE user_id = ?', (user_id,)):
+        key = (game_name, bucket_of(score))
+        counts[key] = counts.get(key, 0) + 1
+    conn.executemany(
+        'UPDATE game_score_histogram SET count = MAX(0, count - ?) WHERE game_name = ? AND bucket = ?',
+        ((c, g, b) for (g, b), c in counts.items()),
+    )
+    conn.execute('DELETE FROM user_score_stats WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM score_outliers WHERE user_id = ?', (user_id,))
+
+
+def rebuild(conn):
+    """由 scores 歷史重建所有統計 (遷移時或資料不一致時手動執行；不會產生 outlier 紀錄)"""
+    conn.execute('DELETE FROM user_score_stats')
+    conn.execute('DELETE FROM game_score_stats')
+    conn.execute('DELETE FROM game_score_histogram')
+    # m2 = Σ(x - mean)² 分兩趟算：先取各組平均，再以 REAL 累加離差平方。
+    # 不用 Σx² - n·mean²：score * score 是整數，SUM 超過 2^63 會溢位 (兩筆 2.5e9 分就會)，
+    # 改用浮點數相減也會因相消失去精度
+    conn.execute(
+        '''
+        INSERT INTO user_score_stats (user_id, game_name, n, mean, m2, max_score)
+        SELECT g.user_id, g.game_name, g.n, g.mean, SUM((s.score - g.mean) * (s.score - g.mean)), g.max_score
+        FROM (
+            SELECT user_id, game_name, COUNT(*) AS n, AVG(score) AS mean, MAX(score) AS max_score
+            FROM scores GROUP BY user_id, game_name
+        ) g
+        JOIN scores s ON s.user_id = g.user_id AND s.game_name = g.game_name
+        GROUP BY g.user_id, g.game_name
+    '''
+    )
+    conn.execute(
+        '''
+        INSERT INTO game_score_stats (game_name, n, mean, m2, min_score, max_score)
+        SELECT g.game_name, g.n, g.mean, SUM((s.score - g.mean) * (s.score - g.mean)), g.min_score, g.max_score
+        FROM (
+            SELECT game_name, COUNT(*) AS n, AVG(score) AS mean, MIN(score) AS min_score, MAX(score) AS max_score
+            FROM scores GROUP BY game_name
+        ) g
+        JOIN scores s ON s.game_name = g.game_name
+        GROUP BY g.game_name
+    '''
+    )
+    counts = {}
+    for game_name, score, c in conn.execute('SELECT game_name, score, COUNT(*) FROM scores GROUP BY game_name, score'):
+        key = (game_name, bucket_of(score))
+        counts[key] = counts.get(key, 0) + c
+    conn.executemany(
+        'INSERT INTO game_score_histogram (game_name, bucket, count) VALUES (?, ?, ?)',
+        ((g, b, c) for (g, b), c in counts.items()),
+    )
+
+
+def quantiles(buckets, qs=QUANTILES, low=None, high=None):
+    """
+    由 [(bucket, count), ...] (依 bucket 排序) 估計分位數，桶內以幾何內插。
+    內插值可能超出實際出現過的分數 (例如最高分落在桶的下緣)，有 low / high 時夾在 [low, high] 內。
+    """
+    total = sum(c for _, c in buckets)
+    result = {}
+    if total == 0:
+        return {f'p{round(q * 100)}': None for q in qs}
+    for q in qs:
+        target = q * total
+        seen = 0
+        for bucket, c in buckets:
+            if c and seen + c >= target:
+                lo, hi = bucket_bounds(bucket)
+                frac = (target - seen) / c
+                value = lo * (hi / lo) ** frac if lo > 0 else hi * frac
+                if low is not None:
+                    value = max(value, float(low))
+                if high is not None:
+                    value = min(value, float(high))
+                result[f'p{round(q * 100)}'] = round(value, 1)
+                break
+            seen += c
+    return result
+
+
+def summarize(n, mean, m2, max_score):
+    return {
+        'n': n,
+        'mean': round(mean, 2),
+        'std': round(_std(n, m2), 2),
+        'max': max_score,
+    }
@@ -0,0 +1,109 @@
+"""
+使用者資料列的行程內 LRU 快取 (get_user_by_id)。
+
+- 每筆快取最多保留 ARCADE_USER_CACHE_TTL 秒 (預設 1 秒；0 = 停用)，最多 ARCADE_USER_CACHE_SIZE 筆
+- database.py 中所有修改 users 的函式在 commit 後呼叫 invalidate(user_id)
+- 多個 gunicorn worker 時其他行程的修改不會通知到這裡，最多延遲 TTL 秒才看到
+  (購買扣款等交易仍直接查 DB，不經過快取)
+
+同一個請求內的重複查詢由 app.py 的 get_current_user() 以 flask.g 處理，
+命中次數記在 request_hits，用來觀察每個請求省下幾次查詢。
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    def __init__(self, ttl=1.0, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()   # user_id -> (expires_at, row)
+        self._lock = threading.Lock()
+        # 每次 invalidate 都遞增；載入期間若有修改就不寫入快取，避免存到舊資料
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+        self.requests = 0
+        self.request_hits = 0
+
+    def get(self, user_id, load):
+        """回傳 user_id 的資料列；不在快取中 (或已過期) 時呼叫 load(user_id)"""
+        if self.ttl <= 0:
+            self.misses += 1
+            return load(user_id)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[user_id]
+                self.expired += 1
+            self.misses += 1
+            generation = self.generation
+
+        row = load(user_id)
+        if row is None:
+            return None
+        with self._lock:
+            if generation == self.generation:
+                self._entries[user_id] = (now + self.ttl, row)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return row
+
+    def invalidate(self, user_id=None):
+        """移除單一玩家 (user_id 為 None 時清空全部)"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def invalidate_many(self, user_ids):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def record_request(self, hits):
+        """請求結束時記錄 flask.g 快取命中次數 (= 省下的 users 查詢)"""
+        with self._lock:
+            self.requests += 1
+            self.request_hits += hits
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'ttl': self.ttl,
+            'size': size,
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'requests': self.requests,
+            'request_hits': self.request_hits,
+            'saved_per_request': round(self.request_hits / self.requests, 3) if self.requests else 0.0,
+        }
+
+
+user_cache = UserCache(
+    ttl=float(os.environ.get('ARCADE_USER_CACHE_TTL', '1')),
+    maxsize=int(os.environ.get('ARCADE_USER_CACHE_SIZE', '1024')),
+)
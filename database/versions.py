@@ -0,0 +1,92 @@
+"""
+每款遊戲的單調遞增版本號 (快取失效與 ETag 依據)。
+
+- scores:<game>  每次 insert_score 都遞增 (影響名次)
+- board:<game>   前 N 名內容變動時遞增 (見 leaderboard_cache)
+
+多個 gunicorn worker 時設定 ARCADE_SHARED_VERSION_FILE=/tmp/arcade-versions.bin，
+以 mmap 檔案共用；未設定時只在單一行程內有效。
+epoch 用來區分不同的版本序列 (行程重啟 / 新檔案)，避免舊 ETag 撞號。
+"""
+
+import mmap
+import os
+import struct
+import threading
+import uuid
+
+
+class LocalVersionBackend:
+    """單一行程內的版本號 (預設)"""
+
+    def __init__(self, keys):
+        self._versions = dict.fromkeys(keys, 0)
+        self._lock = threading.Lock()
+        self.epoch = uuid.uuid4().hex[:12]
+
+    def version(self, key):
+        return self._versions.get(key, 0)
+
+    def bump(self, key):
+        if key not in self._versions:
+            return 0
+        with self._lock:
+            v = self._versions[key] = self._versions[key] + 1
+            return v
+
+
+class FileVersionBackend:
+    """
+    以 mmap 檔案在多個行程間共用版本號。
+    讀取只是記憶體存取 (不經系統呼叫)，遞增時以 lockf 互斥 (lockf 以行程為單位，fork 後仍有效)。
+    檔案第 0 格存放 epoch，其後每個 key 佔一格。
+    """
+
+    _SLOT = struct.Struct('<Q')
+
+    def __init__(self, path, keys):
+        import fcntl
+
+        self._fcntl = fcntl
+        self._slots = {k: (i + 1) * self._SLOT.size for i, k in enumerate(keys)}
+        size = self._SLOT.size * (len(keys) + 1)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._lock = threading.Lock()
+        fcntl.lockf(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < size:
+                os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            epoch = self._SLOT.unpack_from(self._map, 0)[0]
+            if epoch == 0:
+                epoch = int.from_bytes(os.urandom(6), 'little') or 1
+                self._SLOT.pack_into(self._map, 0, epoch)
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self.epoch = f'{epoch:012x}'
+
+    def version(self, key):
+        offset = self._slots.get(key)
+        if offset is None:
+            return 0
+        return self._SLOT.unpack_from(self._map, offset)[0]
+
+    def bump(self, key):
+        offset = self._slots.get(key)
+        if offset is None:
+            return 0
+        with self._lock:
+            self._fcntl.lockf(self._fd, self._fcntl.LOCK_EX)
+            try:
+                v = self._SLOT.unpack_from(self._map, offset)[0] + 1
+                self._SLOT.pack_into(self._map, offset, v)
+                return v
+            finally:
+                self._fcntl.lockf(self._fd, self._fcntl.LOCK_UN)
+
+
+def create_version_store(keys):
+    path = os.environ.get('ARCADE_SHARED_VERSION_FILE')
+    if path:
+        return FileVersionBackend(path, keys)
+    return LocalVersionBackend(keys)
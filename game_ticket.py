@@ -0,0 +1,255 @@
+"""
+無狀態的遊戲票券 (取代 Flask session 中的 game_start_time / current_game / game_nonce / game_seed)。
+
+/api/start_game 簽發 ticket = base64url(payload) + "." + base64url(HMAC-SHA256 前 16 bytes)，
+payload 為固定 38 bytes：user_id、遊戲編號、開始時間 (ms)、replay seed、16 bytes nonce。
+/api/submit_score 驗證簽章後直接從票券取得開局資訊，不必讀寫 session cookie，
+同一個瀏覽器可以同時在多個分頁各玩一局。
+
+每張票券只能成功提交一次：提交時把 nonce 放進「已使用」集合，保留到票券過期為止。
+- MemoryNonceStore  單一行程內的 dict (預設)
+- SQLiteNonceStore  多個 worker 共用 (ARCADE_TICKET_DB=/tmp/arcade-tickets.db)
+
+    ARCADE_TICKET_KEY=...     簽章金鑰 (未設定時由 FLASK_SECRET_KEY 衍生)
+    ARCADE_TICKET_TTL=7200    票券有效秒數 (與 replay.MAX_SECONDS 一致)
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from database import GAMES
+from database.pool import get_pool
+
+TTL = int(os.environ.get('ARCADE_TICKET_TTL', '7200'))
+
+_PAYLOAD = struct.Struct('>IBQI16s')    # user_id, game index, issued_ms, seed, nonce
+_SIG_BYTES = 16
+_GAME_INDEX = {g: i for i, g in enumerate(GAMES)}
+
+
+class InvalidTicket(Exception):
+    pass
+
+
+class Ticket:
+    __slots__ = ('user_id', 'game_name', 'issued_ms', 'seed', 'nonce')
+
+    def __init__(self, user_id, game_name, issued_ms, seed, nonce):
+        self.user_id = user_id
+        self.game_name = game_name
+        self.issued_ms = issued_ms
+        self.seed = seed
+        self.nonce = nonce          # hex 字串 (前端雜湊用的 nonce)
+
+    @property
+    def start_time(self):
+        return self.issued_ms / 1000
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TicketSigner:
+    def __init__(self, key, ttl=TTL):
+        self.key = key if isinstance(key, bytes) else key.encode()
+        self.ttl = ttl
+
+    def _sign(self, payload):
+        return hmac.new(self.key, payload, hashlib.sha256).digest()[:_SIG_BYTES]
+
+    def issue(self, user_id, game_name, now=None):
+        """簽發票券，回傳 (ticket 字串, Ticket)"""
+        if game_name not in _GAME_INDEX:
+            raise InvalidTicket('Unknown game')
+        issued_ms = int((time.time() if now is None else now) * 1000)
+        nonce = secrets.token_bytes(16)
+        seed = secrets.randbits(32)
+        payload = _PAYLOAD.pack(user_id, _GAME_INDEX[game_name], issued_ms, seed, nonce)
+        token = f'{_b64encode(payload)}.{_b64encode(self._sign(payload))}'
+        return token, Ticket(user_id, game_name, issued_ms, seed, nonce.hex())
+
+    def verify(self, token, now=None):
+        """檢查格式、簽章與有效期限，回傳 Ticket；不合法時丟 InvalidTicket"""
+        if not isinstance(token, str) or token.count('.') != 1 or len(token) > 128:
+            raise InvalidTicket('Malformed ticket')
+        body, sig = token.split('.')
+        try:
+            payload, sig = _b64decode(body), _b64decode(sig)
+        except ValueError:
+            raise InvalidTicket('Malformed ticket')
+        if len(payload) != _PAYLOAD.size or not hmac.compare_digest(sig, self._sign(payload)):
+            raise InvalidTicket('Bad signature')
+        user_id, game_index, issued_ms, seed, nonce = _PAYLOAD.unpack(payload)
+        if game_index >= len(GAMES):
+            raise InvalidTicket('Unknown game')
+        age = (time.time() if now is None else now) - issued_ms / 1000
+        if age > self.ttl or age < -5:
+            raise InvalidTicket('Ticket expired')
+        return Ticket(user_id, GAMES[game_index], issued_ms, seed, nonce.hex())
+
+
+class MemoryNonceStore:
+    """nonce -> 過期時間；依插入順序 (= 約略依過期時間) 淘汰"""
+
+    EVICT_BATCH = 64
+
+    def __init__(self):
+        self._expires = OrderedDict()
+        self._lock = threading.Lock()
+
+    def contains(self, nonce, now):
+        expires = self._expires.get(nonce)
+        return expires is not None and expires > now
+
+    def add(self, nonce, expires, now):
+        """加入 nonce；已存在 (已提交過) 時回傳 False"""
+        entries = self._expires
+        with self._lock:
+            old = entries.get(nonce)
+            if old is not None and old > now:
+                return False
+            entries[nonce] = expires
+            for _ in range(self.EVICT_BATCH):
+                oldest = next(iter(entries))
+                if entries[oldest] > now:
+                    break
+                del entries[oldest]
+            return True
+
+    def __len__(self):
+        return len(self._expires)
+
+
+class SQLiteNonceStore:
+    """跨行程共用；以主鍵衝突判斷是否已使用"""
+
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, path):
+        self._pool = get_pool(path)
+        self._calls = 0
+        conn = self._pool.acquire()
+        try:
+            conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS used_ticket_nonces (
+                    nonce TEXT PRIMARY KEY,
+                    expires REAL NOT NULL
+                )
+            '''
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_used_ticket_nonces_expires ON used_ticket_nonces (expires)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def contains(self, nonce, now):
+        conn = self._pool.acquire()
+        try:
+            return conn.execute(
+                'SELECT 1 FROM used_ticket_nonces WHERE nonce = ? AND expires > ?',
+                (nonce, now),
+            ).fetchone() is not None
+        finally:
+            conn.close()
+
+    def add(self, nonce, expires, now):
+        conn = self._pool.acquire()
+        try:
+            # 過期的同名 nonce 可以覆寫；未過期的保持原樣 (rowcount = 0)
+            cur = conn.execute(
+                '''
+                INSERT INTO used_ticket_nonces (nonce, expires) VALUES (?, ?)
+                ON CONFLICT (nonce) DO UPDATE SET expires = excluded.expires
+                WHERE used_ticket_nonces.expires <= ?
+            ''',
+                (nonce, expires, now),
+            )
+            self._calls += 1
+            if self._calls % self.CLEANUP_EVERY == 0:
+                conn.execute('DELETE FROM used_ticket_nonces WHERE expires <= ?', (now,))
+            conn.commit()
+            return cur.rowcount == 1
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def __len__(self):
+        conn = self._pool.acquire()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM used_ticket_nonces').fetchone()[0]
+        finally:
+            conn.close()
+
+
+class TicketBook:
+    def __init__(self, signer, store=None):
+        self.signer = signer
+        self.store = store if store is not None else MemoryNonceStore()
+        self.issued = 0
+        self.redeemed = 0
+        self.rejected = 0
+        self.replayed = 0
+
+    def issue(self, user_id, game_name):
+        token, ticket = self.signer.issue(user_id, game_name)
+        self.issued += 1
+        return token, ticket
+
+    def check(self, token, user_id):
+        """驗證票券屬於 user_id 且尚未提交過 (不消耗)；不合法時丟 InvalidTicket"""
+        try:
+            ticket = self.signer.verify(token)
+            if ticket.user_id != user_id:
+                raise InvalidTicket('Ticket belongs to another user')
+        except InvalidTicket:
+            self.rejected += 1
+            raise
+        if self.store.contains(ticket.nonce, time.time()):
+            self.replayed += 1
+            raise InvalidTicket('Ticket already used')
+        return ticket
+
+    def redeem(self, ticket):
+        """標記票券已使用；同一張票券同時提交時只有一個會成功"""
+        now = time.time()
+        if not self.store.add(ticket.nonce, ticket.start_time + self.signer.ttl + 5, now):
+            self.replayed += 1
+            return False
+        self.redeemed += 1
+        return True
+
+    def stats(self):
+        return {
+            'backend': type(self.store).__name__,
+            'tracked_nonces': len(self.store),
+            'issued': self.issued,
+            'redeemed': self.redeemed,
+            'rejected': self.rejected,
+            'replayed': self.replayed,
+            'ttl': self.signer.ttl,
+        }
+
+
+def create_ticket_book(secret_key):
+    """依環境變數建立；ARCADE_TICKET_KEY 未設定時以 secret_key 衍生簽章金鑰"""
+    key = os.environ.get('ARCADE_TICKET_KEY')
+    if not key:
+        key = hmac.new(secret_key.encode(), b'arcade-game-ticket', hashlib.sha256).digest()
+    path = os.environ.get('ARCADE_TICKET_DB')
+    store = SQLiteNonceStore(path) if path else MemoryNonceStore()
+    return TicketBook(TicketSigner(key), store)
@@ -0,0 +1,208 @@
+"""
+行程內的計量指標，以 Prometheus 文字格式輸出 (GET /metrics)。
+
+- Counter     只增不減的計數 (可帶 label)
+- Histogram   延遲分布 (固定 bucket，輸出時轉成累積值)
+- Gauge       輸出時才呼叫函式取值 (佇列長度、快取大小等；kind='counter' 用於既有的累計數字)
+
+每個 worker 各自計數；多個 gunicorn worker 時由 Prometheus 分別抓取後加總。
+觀測只在對應的 label 組合上做一次 bisect + 加法，鎖的範圍只有該指標。
+"""
+
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+# 秒；涵蓋 1ms 的快取命中到數秒的 KDF / 重播
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}      # label_values -> [每個 bucket 的次數..., +Inf 次數, 總和]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return sum(series[:-1]) if series else 0
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        bounds = self.buckets + (float('inf'),)
+        for label_values, series in items:
+            cumulative = 0
+            for bound, n in zip(bounds, series):
+                cumulative += n
+                le = f'le="{_format_value(float(bound))}"'
+                yield f'{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}'
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {_format_value(round(series[-1], 6))}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class Gauge:
+    def __init__(self, name, help_text, fn, labels=(), kind='gauge'):
+        """fn() 回傳數值；有 labels 時回傳 {(label 值, ...): 數值}"""
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return
+        items = sorted(value.items()) if self.labels else [((), value)]
+        for label_values, v in items:
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(v)}'
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Prometheus 文字格式的 Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def counter(name, help_text, labels=()):
+    return REGISTRY.register(Counter(name, help_text, labels))
+
+
+def histogram(name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, labels, buckets))
+
+
+def gauge(name, help_text, fn, labels=(), kind='gauge'):
+    return REGISTRY.register(Gauge(name, help_text, fn, labels, kind))
+
+
+def render():
+    return REGISTRY.render()
+
+
+# --- 資料庫函式計時 ---
+db_call_seconds = histogram(
+    'arcade_db_call_duration_seconds', 'Duration of database.* calls', labels=('function',)
+)
+db_call_errors = counter(
+    'arcade_db_call_errors_total', 'database.* calls that raised', labels=('function',)
+)
+
+
+def _timed(fn, label):
+    perf_counter = time.perf_counter
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            db_call_errors.inc(label)
+            raise
+        finally:
+            db_call_seconds.observe(perf_counter() - start, label)
+
+    wrapper.__wrapped_for_metrics__ = True
+    return wrapper
+
+
+def instrument_module(module, names=None):
+    """
+    把 module 上的函式換成計時版本 (只影響透過 module.xxx 呼叫的地方)。
+    names 預設為 module.__all__ 中所有一般函式；重複呼叫不會重複包裝。
+    """
+    for name in names if names is not None else getattr(module, '__all__', ()):
+        fn = getattr(module, name, None)
+        if not inspect.isfunction(fn) or getattr(fn, '__wrapped_for_metrics__', False):
+            continue
+        setattr(module, name, _timed(fn, name))
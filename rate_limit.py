@@ -0,0 +1,164 @@
+"""
+送分數頻率限制 (sliding window counter)。
+
+每個 key 只保存「目前時間窗計數 + 前一個時間窗計數」，
+以前一窗重疊比例估算過去 window 秒內的次數，每次檢查都是 O(1)。
+
+後端：
+- MemoryBackend  單一行程內的 dict，閒置超過兩個時間窗的 key 會被淘汰
+- SQLiteBackend  多個 worker 共用同一個 SQLite 檔案 (ARCADE_RATE_LIMIT_DB=/tmp/arcade-ratelimit.db)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from database.pool import get_pool
+
+
+def _estimate(state, now, window):
+    """回傳 (window_index, curr, prev, 估計次數)"""
+    index = int(now // window)
+    if state is None:
+        return index, 0, 0, 0.0
+    w, curr, prev = state[:3]
+    if w == index:
+        pass
+    elif w == index - 1:
+        curr, prev = 0, curr
+    else:
+        curr, prev = 0, 0
+    elapsed = (now - index * window) / window
+    return index, curr, prev, prev * (1.0 - elapsed) + curr
+
+
+class MemoryBackend:
+    EVICT_BATCH = 64
+
+    def __init__(self):
+        self._states = OrderedDict()   # key -> (window_index, curr, prev, last_seen)，依最後使用時間排序
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, now):
+        states = self._states
+        with self._lock:
+            index, curr, prev, estimated = _estimate(states.pop(key, None), now, window)
+            allowed = estimated < limit
+            if allowed:
+                curr += 1
+            # 重新插入即移到最後 (最近使用)
+            states[key] = (index, curr, prev, now)
+
+            # 最舊的 key 在最前面：閒置超過兩個時間窗就淘汰。
+            # 每個 key 只會被淘汰一次，攤銷後仍是 O(1)；單次上限避免長時間閒置後的延遲尖峰
+            cutoff = now - 2 * window
+            for _ in range(self.EVICT_BATCH):
+                oldest = next(iter(states))
+                if states[oldest][3] >= cutoff:
+                    break
+                del states[oldest]
+            return allowed
+
+    def __len__(self):
+        return len(self._states)
+
+
+class SQLiteBackend:
+    """跨行程共用；每次檢查一個 BEGIN IMMEDIATE 交易 (主鍵讀 + upsert)"""
+
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, path):
+        self._pool = get_pool(path)
+        self._calls = 0
+        conn = self._pool.acquire()
+        try:
+            conn.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    window_index INTEGER NOT NULL,
+                    curr INTEGER NOT NULL,
+                    prev INTEGER NOT NULL,
+                    last_seen REAL NOT NULL
+                )
+            '''
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_limits_last_seen ON rate_limits (last_seen)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def hit(self, key, limit, window, now):
+        key = str(key)
+        conn = self._pool.acquire()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT window_index, curr, prev FROM rate_limits WHERE key = ?',
+                (key,),
+            ).fetchone()
+            index, curr, prev, estimated = _estimate(tuple(row) if row else None, now, window)
+            allowed = estimated < limit
+            if allowed:
+                curr += 1
+            conn.execute(
+                '''
+                INSERT INTO rate_limits (key, window_index, curr, prev, last_seen) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    window_index = excluded.window_index, curr = excluded.curr,
+                    prev = excluded.prev, last_seen = excluded.last_seen
+            ''',
+                (key, index, curr, prev, now),
+            )
+            self._calls += 1
+            if self._calls % self.CLEANUP_EVERY == 0:
+                conn.execute('DELETE FROM rate_limits WHERE last_seen < ?', (now - 2 * window,))
+            conn.commit()
+            return allowed
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def __len__(self):
+        conn = self._pool.acquire()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM rate_limits').fetchone()[0]
+        finally:
+            conn.close()
+
+
+class RateLimiter:
+    def __init__(self, limit, window, backend=None):
+        self.limit = limit
+        self.window = window
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.allowed = 0
+        self.rejected = 0
+
+    def hit(self, key, now=None):
+        """記錄一次請求；超過上限時回傳 False (被拒絕的請求不計入次數)"""
+        ok = self.backend.hit(key, self.limit, self.window, time.time() if now is None else now)
+        if ok:
+            self.allowed += 1
+        else:
+            self.rejected += 1
+        return ok
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'tracked_keys': len(self.backend),
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+        }
+
+
+def create_rate_limiter(limit, window):
+    """依環境變數選擇後端：設定 ARCADE_RATE_LIMIT_DB 時使用共用的 SQLite"""
+    path = os.environ.get('ARCADE_RATE_LIMIT_DB')
+    backend = SQLiteBackend(path) if path else MemoryBackend()
+    return RateLimiter(limit, window, backend)
@@ -0,0 +1,493 @@
+"""
+伺服器端重播驗證 (Snake / Tetris)。
+
+/api/start_game 會回傳 seed，前端以 static/replay.js 的 mulberry32 產生食物位置 / 方塊順序，
+並記錄輸入：replay = {"ticks": 結束時的 tick, "inputs": [tick, code, tick, code, ...]}。
+伺服器以相同規則重新模擬，得到真正的分數與遊戲數據，再和前端送來的比對。
+
+- Snake   一個 tick = 100ms (TICK_RATE)，code 為方向 0 上 / 1 右 / 2 下 / 3 左 (該 tick 生效的轉向)
+- Tetris  一個 tick = 16ms，code 為 0 左 / 1 右 / 2 軟降 / 3 左轉 / 4 右轉 / 5 硬降 / 6 Hold
+
+模擬器只用固定大小的 bytearray / int 狀態，每個 tick 不建立新的 list / dict。
+
+    ARCADE_REPLAY_REQUIRED=1       Snake / Tetris 沒附 replay 就拒絕 (預設為選用)
+    ARCADE_REPLAY_WORKERS=4        在 process pool 中重播，不佔用 request worker (預設 0 = 直接執行)
+    ARCADE_REPLAY_MAX_PENDING=64   同時最多幾件重播，超過回 503 (見 database/offload.py)
+    ARCADE_REPLAY_TIMEOUT=2        等待結果的上限 (秒)
+"""
+
+import os
+import threading
+import time
+
+from database.offload import Overloaded, get_executor
+
+REQUIRED = os.environ.get('ARCADE_REPLAY_REQUIRED', '0') == '1'
+
+TOLERANCE = 1.2
+TIME_SLACK = 2.0               # 秒；網路延遲與 start_game 來回
+MAX_SECONDS = 2 * 60 * 60      # 單局重播上限，避免超大 payload 佔住 CPU
+
+
+def mulberry32(seed):
+    """與 static/replay.js 相同的 32-bit PRNG，回傳 [0, 1) 的產生器函式"""
+    state = seed & 0xFFFFFFFF
+
+    def rng():
+        nonlocal state
+        state = (state + 0x6D2B79F5) & 0xFFFFFFFF
+        t = ((state ^ (state >> 15)) * (1 | state)) & 0xFFFFFFFF
+        t = ((t + (((t ^ (t >> 7)) * (61 | t)) & 0xFFFFFFFF)) & 0xFFFFFFFF) ^ t
+        return ((t ^ (t >> 14)) & 0xFFFFFFFF) / 4294967296
+
+    return rng
+
+
+# ==========================================
+# 🐍 Snake
+# ==========================================
+
+SNAKE_SIZE = 20                # 400px / gridSize 20
+SNAKE_TICK_SECONDS = 0.1
+_SNAKE_CELLS = SNAKE_SIZE * SNAKE_SIZE
+_SNAKE_DIRS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+
+
+def simulate_snake(seed, inputs, ticks):
+    """
+    依 static/snake.js 的 update() 重播 ticks 個 tick。
+    回傳 {'over', 'ticks', 'score', 'moves'}；over=False 代表到 ticks 時蛇還活著。
+    """
+    rng = mulberry32(seed)
+    size = SNAKE_SIZE
+    cells = _SNAKE_CELLS
+    occupied = bytearray(cells)
+    body = bytearray(cells * 2)        # 環狀佇列，每格 2 bytes (cell index < 400)
+    # 初始蛇：(10,10) (9,10) (8,10)，頭朝右
+    head_slot = 2
+    tail_slot = 0
+    for slot, (x, y) in enumerate(((8, 10), (9, 10), (10, 10))):
+        c = y * size + x
+        body[slot * 2] = c & 0xFF
+        body[slot * 2 + 1] = c >> 8
+        occupied[c] = 1
+    hx, hy = 10, 10
+    dx, dy = 1, 0
+
+    def spawn_food():
+        while True:
+            fx = int(rng() * size)
+            fy = int(rng() * size)
+            c = fy * size + fx
+            if not occupied[c]:
+                return c
+
+    food = spawn_food()
+    score = 0
+    n_inputs = len(inputs)
+    i = 0
+    next_tick = inputs[0] if n_inputs else -1
+
+    for tick in range(1, ticks + 1):
+        if tick == next_tick:
+            dx, dy = _SNAKE_DIRS[inputs[i + 1]]
+            i += 2
+            next_tick = inputs[i] if i < n_inputs else -1
+        hx = (hx + dx) % size
+        hy = (hy + dy) % size
+        head = hy * size + hx
+        tail = body[tail_slot * 2] | (body[tail_slot * 2 + 1] << 8)
+        # 撞到自己 (前端的檢查不含尾巴那一格)
+        if occupied[head] and head != tail:
+            return {'over': True, 'ticks': tick, 'score': score, 'moves': tick}
+        if head == food:
+            score += 1
+        else:
+            occupied[tail] = 0
+            tail_slot = (tail_slot + 1) % cells
+        head_slot = (head_slot + 1) % cells
+        body[head_slot * 2] = head & 0xFF
+        body[head_slot * 2 + 1] = head >> 8
+        occupied[head] = 1
+        if head == food:
+            food = spawn_food()
+    return {'over': False, 'ticks': ticks, 'score': score, 'moves': ticks}
+
+
+# ==========================================
+# 🧱 Tetris
+# ==========================================
+
+TETRIS_WIDTH = 12
+TETRIS_HEIGHT = 20
+TETRIS_TICK_MS = 16
+TETRIS_CLEAR_TICKS = 9         # 消行動畫約 150ms，期間暫停下落與操作
+# floor(1000 * 0.85^level)，最低 50ms (與 tetris.js 的 DROP_INTERVALS 相同)
+DROP_INTERVALS = (1000, 850, 722, 614, 522, 443, 377, 320, 272, 231, 196, 167, 142, 120, 102, 87, 74, 63, 53, 50)
+_LINE_SCORES = (0, 40, 100, 300, 1200)
+_FULL_ROW = (1 << TETRIS_WIDTH) - 1
+
+_PIECE_ORDER = ('I', 'L', 'J', 'O', 'Z', 'S', 'T')
+_PIECE_MATRICES = {
+    'I': [[0, 1, 0, 0], [0, 1, 0, 0], [0, 1, 0, 0], [0, 1, 0, 0]],
+    'L': [[0, 2, 0], [0, 2, 0], [0, 2, 2]],
+    'J': [[0, 3, 0], [0, 3, 0], [3, 3, 0]],
+    'O': [[4, 4], [4, 4]],
+    'Z': [[5, 5, 0], [0, 5, 5], [0, 0, 0]],
+    'S': [[0, 6, 6], [6, 6, 0], [0, 0, 0]],
+    'T': [[0, 7, 0], [7, 7, 7], [0, 0, 0]],
+}
+
+
+def _rotate(matrix, direction):
+    """與 tetris.js 的 rotate() 相同：轉置後反轉每列 (右轉) 或反轉列順序 (左轉)"""
+    m = [row[:] for row in matrix]
+    n = len(m)
+    for y in range(n):
+        for x in range(y):
+            m[x][y], m[y][x] = m[y][x], m[x][y]
+    if direction > 0:
+        for row in m:
+            row.reverse()
+    else:
+        m.reverse()
+    return m
+
+
+def _build_shapes():
+    """
+    SHAPES[piece][rotation][x + _X_OFFSET] = ((row_offset, row_bitmask), ...) 或 None (超出左右邊界)。
+    碰撞檢查只需查表再和 arena 的列 bitmask 做 AND。
+    """
+    shapes = []
+    bottoms = []
+    for name in _PIECE_ORDER:
+        matrix = _PIECE_MATRICES[name]
+        rotations = [matrix]
+        for _ in range(3):
+            rotations.append(_rotate(rotations[-1], 1))
+        per_rot = []
+        per_bottom = []
+        for m in rotations:
+            cols = [x for row in m for x, v in enumerate(row) if v]
+            rows = [(y, sum(1 << x for x, v in enumerate(row) if v)) for y, row in enumerate(m) if any(row)]
+            per_x = []
+            for x in range(-_X_OFFSET, TETRIS_WIDTH + _X_OFFSET):
+                if x + min(cols) < 0 or x + max(cols) >= TETRIS_WIDTH:
+                    per_x.append(None)
+                else:
+                    per_x.append(tuple((y, mask << x if x >= 0 else mask >> -x) for y, mask in rows))
+            per_rot.append(tuple(per_x))
+            per_bottom.append(max(y for y, _ in rows))
+        shapes.append(tuple(per_rot))
+        bottoms.append(tuple(per_bottom))
+    return tuple(shapes), tuple(bottoms)
+
+
+_X_OFFSET = 8
+_SHAPES, _BOTTOMS = _build_shapes()
+_PIECE_SIZE = tuple(len(_PIECE_MATRICES[name]) for name in _PIECE_ORDER)
+
+
+class _Tetris:
+    """tetris.js 遊戲狀態的精簡版：arena 為 20 個 12-bit 列 bitmask"""
+
+    __slots__ = (
+        'rng', 'arena', 'bag', 'piece', 'rot', 'x', 'y', 'next_piece', 'hold_piece', 'can_hold',
+        'score', 'lines', 'level', 'pieces', 'combo', 'drop_counter', 'drop_interval',
+        'clear_ticks', 'over',
+    )
+
+    def __init__(self, seed):
+        self.rng = mulberry32(seed)
+        self.arena = [0] * TETRIS_HEIGHT
+        self.bag = []
+        self.hold_piece = None
+        self.can_hold = True
+        self.score = self.lines = self.level = self.pieces = 0
+        self.combo = -1
+        self.drop_counter = 0
+        self.drop_interval = DROP_INTERVALS[0]
+        self.clear_ticks = 0
+        self.over = False
+        self.next_piece = self.draw_piece()
+        self.reset_player()
+
+    def draw_piece(self):
+        bag = self.bag
+        if not bag:
+            bag.extend(range(7))
+            rng = self.rng
+            for i in range(6, 0, -1):
+                j = int(rng() * (i + 1))
+                bag[i], bag[j] = bag[j], bag[i]
+        return bag.pop()
+
+    def collide(self, rot, x, y):
+        if x < -_X_OFFSET or x >= TETRIS_WIDTH + _X_OFFSET:
+            return True
+        rows = _SHAPES[self.piece][rot][x + _X_OFFSET]
+        if rows is None or y + _BOTTOMS[self.piece][rot] >= TETRIS_HEIGHT:
+            return True
+        arena = self.arena
+        for dy, mask in rows:
+            if arena[y + dy] & mask:
+                return True
+        return False
+
+    def spawn(self, piece):
+        self.piece = piece
+        self.rot = 0
+        self.y = 0
+        self.x = TETRIS_WIDTH // 2 - _PIECE_SIZE[piece] // 2
+
+    def reset_player(self):
+        self.spawn(self.next_piece)
+        self.next_piece = self.draw_piece()
+        self.pieces += 1
+        self.can_hold = True
+        if self.collide(0, self.x, 0):
+            self.over = True
+
+    def lock(self):
+        """合併目前方塊；有滿列就進入消行動畫，否則直接出下一個方塊"""
+        arena = self.arena
+        y = self.y
+        for dy, mask in _SHAPES[self.piece][self.rot][self.x + _X_OFFSET]:
+            arena[y + dy] |= mask
+        if _FULL_ROW in arena:
+            self.clear_ticks = TETRIS_CLEAR_TICKS
+        else:
+            self.combo = -1
+            self.reset_player()
+
+    def sweep(self):
+        arena = self.arena
+        kept = [row for row in arena if row != _FULL_ROW]
+        cleared = TETRIS_HEIGHT - len(kept)
+        arena[:] = [0] * cleared + kept
+        level = self.level
+        points = _LINE_SCORES[cleared] * (level + 1)
+        if self.combo < 0:
+            self.combo = 0
+        self.combo += 1
+        if self.combo > 0:
+            points += 50 * self.combo * (level + 1)
+        self.score += points
+        self.lines += cleared
+        new_level = self.lines // 10
+        if new_level > level:
+            self.level = new_level
+            self.drop_interval = DROP_INTERVALS[min(new_level, len(DROP_INTERVALS) - 1)]
+
+    def drop(self, soft):
+        if not self.collide(self.rot, self.x, self.y + 1):
+            self.y += 1
+            if soft:
+                self.score += 1
+        else:
+            self.lock()
+        self.drop_counter = 0
+
+    def hard_drop(self):
+        cells = 0
+        while not self.collide(self.rot, self.x, self.y + 1):
+            self.y += 1
+            cells += 1
+        if cells > 0:
+            self.score += cells * 2
+        self.lock()
+        self.drop_counter = 0
+
+    def rotate(self, direction):
+        rot = (self.rot + direction) % 4
+        start_x = x = self.x
+        offset = 1
+        size = _PIECE_SIZE[self.piece]
+        while self.collide(rot, x, self.y):
+            x += offset
+            offset = -(offset + (1 if offset > 0 else -1))
+            if offset > size:
+                self.x = start_x
+                return
+        self.rot = rot
+        self.x = x
+
+    def hold(self):
+        if not self.can_hold:
+            return
+        current = self.piece
+        if self.hold_piece is None:
+            self.hold_piece = current
+            self.reset_player()
+        else:
+            self.spawn(self.hold_piece)
+            self.hold_piece = current
+        self.can_hold = False
+
+    def key(self, code):
+        if self.clear_ticks:
+            return                     # 消行動畫期間鎖定操作
+        if code == 0:
+            if not self.collide(self.rot, self.x - 1, self.y):
+                self.x -= 1
+        elif code == 1:
+            if not self.collide(self.rot, self.x + 1, self.y):
+                self.x += 1
+        elif code == 2:
+            self.drop(True)
+        elif code == 3:
+            self.rotate(-1)
+        elif code == 4:
+            self.rotate(1)
+        elif code == 5:
+            self.hard_drop()
+        elif code == 6:
+            self.hold()
+        else:
+            raise ValueError(f'unknown tetris input {code}')
+
+
+def simulate_tetris(seed, inputs, ticks):
+    """
+    依 static/tetris.js 的 step() 重播 ticks 個 tick。
+    回傳 {'over', 'ticks', 'score', 'pieces', 'lines', 'level'}。
+    """
+    game = _Tetris(seed)
+    n_inputs = len(inputs)
+    i = 0
+    tick = 0
+    if not game.over:
+        for tick in range(1, ticks + 1):
+            while i < n_inputs and inputs[i] == tick:
+                game.key(inputs[i + 1])
+                i += 2
+                if game.over:
+                    break
+            if game.over:
+                break
+            if game.clear_ticks:
+                game.clear_ticks -= 1
+                if not game.clear_ticks:
+                    game.sweep()
+                    game.reset_player()
+            else:
+                game.drop_counter += TETRIS_TICK_MS
+                if game.drop_counter > game.drop_interval:
+                    game.drop(False)
+            if game.over:
+                break
+    return {
+        'over': game.over,
+        'ticks': tick,
+        'score': game.score,
+        'pieces': game.pieces,
+        'lines': game.lines,
+        'level': game.level,
+    }
+
+
+# ==========================================
+# 驗證入口
+# ==========================================
+
+SIMULATORS = {
+    'snake': {
+        'simulate': simulate_snake,
+        'tick_seconds': SNAKE_TICK_SECONDS,
+        'fields': ('moves',),           # 需與前端比對的欄位 (score 一定會比對)
+        'codes': len(_SNAKE_DIRS),
+        'one_input_per_tick': True,     # 每個 tick 最多從 inputQueue 取出一個方向
+    },
+    'tetris': {
+        'simulate': simulate_tetris,
+        'tick_seconds': TETRIS_TICK_MS / 1000,
+        'fields': ('pieces', 'lines', 'level'),
+        'codes': 7,
+        'one_input_per_tick': False,
+    },
+}
+
+executor = get_executor('replay', workers=0, max_pending=64, timeout=2.0)
+_stats_lock = threading.Lock()
+_stats = {'verified': 0, 'rejected': 0, 'unavailable': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+
+def parse_replay(game_name, payload, duration):
+    """檢查 replay 格式與長度，回傳 (ticks, inputs)；不合法時丟 ValueError"""
+    if not isinstance(payload, dict):
+        raise ValueError('Malformed replay')
+    ticks = payload.get('ticks')
+    inputs = payload.get('inputs')
+    if type(ticks) is not int or not isinstance(inputs, list) or len(inputs) % 2:
+        raise ValueError('Malformed replay')
+    spec = SIMULATORS[game_name]
+    max_ticks = int(min(duration * TOLERANCE + TIME_SLACK, MAX_SECONDS) / spec['tick_seconds'])
+    if not 0 < ticks <= max_ticks:
+        raise ValueError(f'Replay length {ticks} ticks exceeds {max_ticks} allowed for {duration:.1f}s')
+    if len(inputs) > 2 * ticks * 8:
+        raise ValueError('Too many replay inputs')
+    codes = spec['codes']
+    # tick 必須遞增 (Snake 需嚴格遞增)
+    last = 0 if spec['one_input_per_tick'] else 1
+    step = 1 if spec['one_input_per_tick'] else 0
+    for k in range(0, len(inputs), 2):
+        t, code = inputs[k], inputs[k + 1]
+        if type(t) is not int or type(code) is not int or not last + step <= t <= ticks or not 0 <= code < codes:
+            raise ValueError('Malformed replay input')
+        last = t
+    return ticks, inputs
+
+
+def simulate(game_name, seed, inputs, ticks):
+    """直接執行模擬 (也是 process pool 的工作函式)"""
+    return SIMULATORS[game_name]['simulate'](seed, inputs, ticks)
+
+
+def verify(game_name, seed, payload, score, data, duration):
+    """
+    重播並比對前端送來的分數與欄位，回傳 (ok, reason)。
+    執行器已滿或逾時丟 Overloaded (不是玩家的問題，由 app 回 503，不標記作弊)。
+    """
+    start = time.perf_counter()
+    try:
+        try:
+            ticks, inputs = parse_replay(game_name, payload, duration)
+            result = executor.run(simulate, game_name, seed, inputs, ticks)
+        except ValueError as e:
+            return _finish(start, False, str(e))
+        if not result['over'] or result['ticks'] != ticks:
+            return _finish(start, False, f"Replay did not end at tick {ticks}")
+        if result['score'] != score:
+            return _finish(start, False, f"Replay mismatch: score {score} != simulated {result['score']}")
+        for field in SIMULATORS[game_name]['fields']:
+            try:
+                claimed = int(data.get(field, 0))
+            except (TypeError, ValueError):
+                claimed = None
+            if claimed != result[field]:
+                return _finish(start, False, f"Replay mismatch: {field} {claimed} != simulated {result[field]}")
+        return _finish(start, True, 'Valid')
+    except Overloaded:
+        with _stats_lock:
+            _stats['unavailable'] += 1
+        raise
+
+
+def _finish(start, ok, reason):
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with _stats_lock:
+        _stats['verified' if ok else 'rejected'] += 1
+        _stats['total_ms'] += elapsed_ms
+        _stats['max_ms'] = max(_stats['max_ms'], elapsed_ms)
+    return ok, reason
+
+
+def stats():
+    with _stats_lock:
+        data = dict(_stats)
+    runs = data['verified'] + data['rejected']
+    data['avg_ms'] = round(data.pop('total_ms') / runs, 3) if runs else 0.0
+    data['max_ms'] = round(data['max_ms'], 3)
+    data['required'] = REQUIRED
+    return data
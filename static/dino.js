@@ -40,6 +40,7 @@
     let stars = [];
     let groundOffset = 0;
     let serverNonce = "";
+    let gameTicket = "";   // start_game 簽發的遊戲票券，送分數時原樣帶回
 
     let gameHash = 0;
     function updateHash(dt) { gameHash = (gameHash + Math.floor(dt * 1000)) % 999999; }
@@ -93,7 +94,7 @@
         })
         .then(res => res.json())
         .then(data => {
-            if(data.status === 'success') serverNonce = data.nonce;
+            if(data.status === 'success') { serverNonce = data.nonce; gameTicket = data.ticket; }
         })
         .catch(console.error);
 
@@ -336,7 +337,8 @@
                 game_name: 'dino', 
                 score: finalScore, 
                 jumps: jumpCount,
-                hash: secureHash
+                hash: secureHash,
+                ticket: gameTicket
             })
         }).then(res => res.json())
         .then(data => {
@@ -22,6 +22,7 @@
     let gameActive = false;
     let combo = 0;
     let serverNonce = "";
+    let gameTicket = "";   // start_game 簽發的遊戲票券，送分數時原樣帶回
 
     // 🛡️ 隱藏答案：圖示不寫在 HTML 上，而是存在這個封閉陣列
     let icons = ["🚀", "🪐", "👽", "☄️", "🌟", "🛰️", "🛸", "🌑"];
@@ -40,7 +41,7 @@
         })
         .then(res => res.json())
         .then(data => {
-            if(data.status === 'success') serverNonce = data.nonce;
+            if(data.status === 'success') { serverNonce = data.nonce; gameTicket = data.ticket; }
         });
 
         timer = 0;
@@ -229,7 +230,8 @@
                 game_name: 'memory', 
                 score: calculatedScore, 
                 moves: moves,
-                hash: secureHash
+                hash: secureHash,
+                ticket: gameTicket
             })
         })
         .then(res => res.json())
@@ -0,0 +1,20 @@
+// 🎬 重播驗證共用工具：以 /api/start_game 回傳的 seed 產生可重現的亂數
+// 演算法必須與 replay.py 的 mulberry32 完全一致
+(function() {
+    function mulberry32(seed) {
+        let a = seed >>> 0;
+        return function() {
+            a = a + 0x6D2B79F5 | 0;
+            let t = Math.imul(a ^ a >>> 15, 1 | a);
+            t = t + Math.imul(t ^ t >>> 7, 61 | t) ^ t;
+            return ((t ^ t >>> 14) >>> 0) / 4294967296;
+        };
+    }
+
+    window.GameReplay = {
+        // 有 seed 時回傳可重現的產生器；沒有 (start_game 失敗) 就退回 Math.random
+        createRng(seed) {
+            return Number.isInteger(seed) ? mulberry32(seed) : Math.random;
+        }
+    };
+})();
@@ -30,6 +30,7 @@
     let accumulator = 0; 
     let moves = 0; 
     let serverNonce = "";
+    let gameTicket = "";   // start_game 簽發的遊戲票券，送分數時原樣帶回
 
     let gameHash = 0;
     function updateHash(val) { gameHash = (gameHash + val * 13) % 999999; }
@@ -117,7 +118,7 @@
         })
         .then(res => res.json())
         .then(data => {
-            if(data.status === 'success') serverNonce = data.nonce;
+            if(data.status === 'success') { serverNonce = data.nonce; gameTicket = data.ticket; }
         })
         .catch(err => console.error("Start game tracking failed:", err));
 
@@ -352,7 +353,8 @@
                 game_name: 'shaft', 
                 score: score, 
                 moves: moves,
-                hash: secureHash
+                hash: secureHash,
+                ticket: gameTicket
             })
         })
         .then(res => res.json())
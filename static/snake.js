@@ -14,6 +14,14 @@
     let totalMoves = 0;
     let integrityCheck = 0;
     let serverNonce = "";
+    let gameTicket = "";   // start_game 簽發的遊戲票券，送分數時原樣帶回
+
+    // 🎬 重播驗證：以伺服器給的 seed 產生食物，並記錄每個 tick 生效的轉向 [tick, 方向, ...]
+    let rng = Math.random;
+    let replayEnabled = false;
+    let inputLog = [];
+    let isStarting = false;
+    const DIR_CODES = { '0,-1': 0, '1,0': 1, '0,1': 2, '-1,0': 3 };
 
     // 🛡️ 簡單的路徑校驗雜湊值
     let pathHash = 0;
@@ -33,13 +41,14 @@
         scoreEl.textContent = 0;
         food = spawnFood();
         totalMoves = 0;
+        inputLog = [];
         pathHash = 0; // 重置 hash
         modal.classList.add("hidden");
     }
 
-    function initGame() {
-        resetState();
-        isGameRunning = true;
+    function initGame(firstKey) {
+        // 等拿到 seed 再開始，食物位置才能在伺服器端重現
+        isStarting = true;
         fetch('/api/start_game', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -47,7 +56,16 @@
         })
         .then(res => res.json())
         .then(data => {
-            if(data.status === 'success') serverNonce = data.nonce;
+            if(data.status === 'success') { serverNonce = data.nonce; gameTicket = data.ticket; }
+            replayEnabled = data.status === 'success' && Number.isInteger(data.seed);
+            rng = GameReplay.createRng(replayEnabled ? data.seed : null);
+        })
+        .catch(() => { replayEnabled = false; rng = Math.random; })
+        .finally(() => {
+            isStarting = false;
+            resetState();
+            isGameRunning = true;
+            queueDirection(firstKey);
         });
     }
 
@@ -74,7 +92,10 @@
         // 🛡️ 每次移動都更新 Hash
         updateHash(direction, score);
 
-        if (inputQueue.length > 0) direction = inputQueue.shift();
+        if (inputQueue.length > 0) {
+            direction = inputQueue.shift();
+            inputLog.push(totalMoves, DIR_CODES[`${direction.x},${direction.y}`]);
+        }
         prevSnake = JSON.parse(JSON.stringify(snake));
         let head = { x: snake[0].x + direction.x * gridSize, y: snake[0].y + direction.y * gridSize };
         
@@ -116,7 +137,7 @@
 
     function spawnFood() {
         let newFood;
-        do { newFood = { x: Math.floor(Math.random() * 20) * 20, y: Math.floor(Math.random() * 20) * 20 }; } 
+        do { newFood = { x: Math.floor(rng() * 20) * 20, y: Math.floor(rng() * 20) * 20 }; } 
         while (snake.some(p => p.x === newFood.x && p.y === newFood.y));
         return newFood;
     }
@@ -128,15 +149,20 @@
         // 如果遊戲結束視窗開啟，禁止按鍵重啟
         if (!modal.classList.contains("hidden")) return;
 
-        if (!isGameRunning && ["ArrowUp", "ArrowDown", "ArrowLeft", "ArrowRight"].includes(e.key)) initGame();
+        if (isStarting) return;
+        if (!isGameRunning && ["ArrowUp", "ArrowDown", "ArrowLeft", "ArrowRight"].includes(e.key)) return initGame(e.key);
         if (!isGameRunning) return;
 
+        queueDirection(e.key);
+    }
+
+    function queueDirection(key) {
         const last = inputQueue.length > 0 ? inputQueue[inputQueue.length - 1] : direction;
         let newDir = null;
-        if (e.key === "ArrowUp" && last.y === 0) newDir = { x: 0, y: -1 };
-        else if (e.key === "ArrowDown" && last.y === 0) newDir = { x: 0, y: 1 };
-        else if (e.key === "ArrowLeft" && last.x === 0) newDir = { x: -1, y: 0 };
-        else if (e.key === "ArrowRight" && last.x === 0) newDir = { x: 1, y: 0 };
+        if (key === "ArrowUp" && last.y === 0) newDir = { x: 0, y: -1 };
+        else if (key === "ArrowDown" && last.y === 0) newDir = { x: 0, y: 1 };
+        else if (key === "ArrowLeft" && last.x === 0) newDir = { x: -1, y: 0 };
+        else if (key === "ArrowRight" && last.x === 0) newDir = { x: 1, y: 0 };
 
         if (newDir && inputQueue.length < 3) {
             inputQueue.push(newDir);
@@ -159,8 +185,10 @@
                 game_name: 'snake', 
                 score: score, 
                 moves: totalMoves,
-                hash: secureHash, 
-                check: integrityCheck
+                hash: secureHash,
+                ticket: gameTicket,
+                check: integrityCheck,
+                replay: replayEnabled ? { ticks: totalMoves, inputs: inputLog } : undefined
             })
         })
         .then(res => res.json())
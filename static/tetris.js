@@ -34,6 +34,7 @@
     let pieceBag = [];
     let gameHash = 0;
     let serverNonce = "";
+    let gameTicket = "";   // start_game 簽發的遊戲票券，送分數時原樣帶回
     
     let nextPieceType = null;
     let holdPieceType = null;
@@ -43,7 +44,21 @@
     // Animation State
     let clearingRows = []; // Rows currently being cleared (animation)
     let clearAnimationTimer = 0;
-    const CLEAR_ANIMATION_DURATION = 150; // ms
+
+    // 🎬 Replay: fixed 16ms steps so the server (replay.py) can re-simulate the game
+    const TICK_MS = 16;
+    const CLEAR_TICKS = 9; // ~150ms line-clear animation
+    // floor(1000 * 0.85 ^ level), min 50ms (same table as replay.py)
+    const DROP_INTERVALS = [1000, 850, 722, 614, 522, 443, 377, 320, 272, 231, 196, 167, 142, 120, 102, 87, 74, 63, 53, 50];
+    const KEY_CODES = { 'arrowleft': 0, 'arrowright': 1, 'arrowdown': 2, 'z': 3, 'x': 4, ' ': 5, 'c': 6 };
+    let rng = Math.random;
+    let replayEnabled = false;
+    let isStarting = false;
+    let tick = 0;
+    let accumulator = 0;
+    let clearTicks = 0;
+    let pendingKeys = [];
+    let inputLog = []; // [tick, code, tick, code, ...]
 
     // Hashing for Anti-Cheat
     function updateHash(val) { 
@@ -61,7 +76,7 @@
 
     function shuffle(array) {
         for (let i = array.length - 1; i > 0; i--) {
-            const j = Math.floor(Math.random() * (i + 1));
+            const j = Math.floor(rng() * (i + 1));
             [array[i], array[j]] = [array[j], array[i]];
         }
         return array;
@@ -208,12 +223,8 @@
             clearingRows = rowsToClear;
             clearAnimationTimer = Date.now();
             
-            // Delay the actual sweep until animation is done
-            setTimeout(() => {
-                performSweep(rowsToClear);
-                clearingRows = [];
-                playerReset(); // Reset player only AFTER animation
-            }, CLEAR_ANIMATION_DURATION);
+            // The actual sweep happens in step() once the animation ticks run out
+            clearTicks = CLEAR_TICKS;
             
             return true; // Indicate that a clear is happening
         }
@@ -259,7 +270,7 @@
             // Level 2: 650ms
             // ...
             // Formula: 1000 * (0.85 ^ level)
-            dropInterval = Math.max(50, 1000 * Math.pow(0.85, level)); 
+            dropInterval = DROP_INTERVALS[Math.min(level, DROP_INTERVALS.length - 1)];
             showFloatingText("LEVEL UP!", 4, 10, '#0DFF72', '2rem');
         }
 
@@ -336,11 +347,12 @@
         if (!isGameRunning) return;
         const deltaTime = time - lastTime;
         lastTime = time;
-        
-        // Pause dropping during clear animation
-        if (clearingRows.length === 0) {
-            dropCounter += deltaTime;
-            if (dropCounter > dropInterval) playerDrop();
+
+        // Cap catch-up after the tab was in the background
+        accumulator += Math.min(deltaTime, 250);
+        while (accumulator >= TICK_MS && isGameRunning) {
+            step();
+            accumulator -= TICK_MS;
         }
         
         draw();
@@ -348,6 +360,31 @@
         requestID = requestAnimationFrame(update);
     }
 
+    // One fixed tick: queued keys first, then the clear animation or gravity
+    function step() {
+        tick++;
+        for (const code of pendingKeys) {
+            if (gameOver) break;
+            inputLog.push(tick, code);
+            applyKey(code);
+        }
+        pendingKeys.length = 0;
+        if (gameOver) return;
+
+        if (clearTicks > 0) {
+            // Pause dropping during clear animation
+            clearTicks--;
+            if (clearTicks === 0) {
+                performSweep(clearingRows);
+                clearingRows = [];
+                playerReset(); // Reset player only AFTER animation
+            }
+        } else {
+            dropCounter += TICK_MS;
+            if (dropCounter > dropInterval) playerDrop();
+        }
+    }
+
     function playerDrop() {
         if(clearingRows.length > 0) return; // Lock
         
@@ -361,7 +398,7 @@
                 combo = -1; // Reset combo if no line cleared
                 playerReset();
             }
-            // If clearing, playerReset is called after animation in setTimeout
+            // If clearing, playerReset is called after the animation in step()
         }
         dropCounter = 0;
     }
@@ -458,7 +495,9 @@
     }
 
     function startGame() {
-        if (isGameRunning) return;
+        if (isGameRunning || isStarting) return;
+        // Wait for the seed so the piece order can be replayed on the server
+        isStarting = true;
         fetch('/api/start_game', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
@@ -466,8 +505,18 @@
         })
         .then(res => res.json())
         .then(data => {
-            if(data.status === 'success') serverNonce = data.nonce;
+            if(data.status === 'success') { serverNonce = data.nonce; gameTicket = data.ticket; }
+            replayEnabled = data.status === 'success' && Number.isInteger(data.seed);
+            rng = GameReplay.createRng(replayEnabled ? data.seed : null);
+        })
+        .catch(() => { replayEnabled = false; rng = Math.random; })
+        .finally(() => {
+            isStarting = false;
+            beginRound();
         });
+    }
+
+    function beginRound() {
         arena.forEach(row => row.fill(0));
         score = 0;
         lines = 0;
@@ -483,7 +532,13 @@
         gameHash = 0;
         gameOver = false;
         isGameRunning = true;
-        dropInterval = 1000;
+        dropInterval = DROP_INTERVALS[0];
+        dropCounter = 0;
+        tick = 0;
+        accumulator = 0;
+        clearTicks = 0;
+        pendingKeys = [];
+        inputLog = [];
         
         nextPieceType = getNextPieceType();
         holdPieceType = null;
@@ -497,7 +552,8 @@
         modal.classList.add("hidden");
 
         playerReset();
-        update();
+        lastTime = performance.now();
+        requestID = requestAnimationFrame(update);
     }
 
     async function endGame() {
@@ -523,7 +579,9 @@
                 pieces: pieceCount, 
                 lines: lines, 
                 level: level, 
-                hash: secureHash
+                hash: secureHash,
+                ticket: gameTicket,
+                replay: replayEnabled ? { ticks: tick, inputs: inputLog } : undefined
             })
         })
         .then(res => res.json())
@@ -550,24 +608,31 @@
             event.preventDefault();
         }
 
-        if (key === 'arrowleft') { // Left
+        // Applied on the next tick (see step())
+        if (key in KEY_CODES) pendingKeys.push(KEY_CODES[key]);
+    });
+
+    function applyKey(code) {
+        if (clearingRows.length > 0) return; // Lock input during animation
+
+        if (code === 0) { // Left
             player.pos.x--;
             if (collide(arena, player)) player.pos.x++;
-        } else if (key === 'arrowright') { // Right
+        } else if (code === 1) { // Right
             player.pos.x++;
             if (collide(arena, player)) player.pos.x--;
-        } else if (key === 'arrowdown') { // Soft Drop
+        } else if (code === 2) { // Soft Drop
             playerSoftDrop();
-        } else if (key === 'z') { // Rotate Left
+        } else if (code === 3) { // Rotate Left
             playerRotate(-1);
-        } else if (key === 'x') { // Rotate Right
+        } else if (code === 4) { // Rotate Right
             playerRotate(1);
-        } else if (key === ' ') { // Hard Drop
+        } else if (code === 5) { // Hard Drop
             playerHardDrop();
-        } else if (key === 'c') { // Hold
+        } else if (code === 6) { // Hold
             performHold();
         }
-    });
+    }
 
     // Initial draw
     context.fillStyle = '#000';
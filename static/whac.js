@@ -21,6 +21,7 @@
     let lastClickTime = 0;
     const HUMAN_LIMIT_MS = 80; // 人類極限手速
     let serverNonce = "";
+    let gameTicket = "";   // start_game 簽發的遊戲票券，送分數時原樣帶回
 
     let gameHash = 0;
     function updateHash(x, y) { gameHash = (gameHash + x + y + 17) % 999999; }
@@ -60,7 +61,7 @@
         })
         .then(res => res.json())
         .then(data => {
-            if(data.status === 'success') serverNonce = data.nonce;
+            if(data.status === 'success') { serverNonce = data.nonce; gameTicket = data.ticket; }
         });
         
         gameHash = 0;
@@ -188,7 +189,8 @@
                 game_name: 'whac', 
                 score: score, 
                 hits: hitCount,
-                hash: secureHash
+                hash: secureHash,
+                ticket: gameTicket
             })
         })
         .then(res => res.json())
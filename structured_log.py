@@ -0,0 +1,145 @@
+"""
+非阻塞的結構化日誌。
+
+請求執行緒只把 LogRecord 放進有上限的佇列 (put_nowait)，由背景的 QueueListener 執行緒
+格式化成一行 JSON 寫到 stderr；stdout / 終端機塞住時不會拖慢請求。
+佇列滿了就丟棄該筆並計數 (dropped)，不會阻塞也不會印 traceback。
+
+    log = structured_log.get_logger('arcade.app')
+    log.warning('cheat_blocked', user='alice', game='snake', reason='Speed hack')
+
+    ARCADE_LOG_FORMAT=text       改用易讀的單行文字 (開發用，預設 json)
+    ARCADE_LOG_LEVEL=INFO
+    ARCADE_LOG_QUEUE=10000       佇列上限
+
+database 套件內的模組直接使用 logging.getLogger(__name__)，欄位放在 extra={'fields': {...}}；
+setup() 把處理器掛在 root logger 上，所以同樣會經過佇列。
+"""
+
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import traceback
+
+_RESERVED = ('exc_info', 'stack_info', 'stacklevel', 'extra')
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = getattr(record, 'fields', None) or {}
+        line = f'{record.levelname[0]} {record.name} {record.getMessage()}'
+        if fields:
+            line += ' | ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """佇列滿時丟棄並計數，而不是阻塞或呼叫 handleError"""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 訊息與例外在這裡就轉成字串 (record 之後會在另一條執行緒格式化)
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """log.info('event', key=value, ...)：關鍵字參數成為 JSON 欄位"""
+
+    def process(self, msg, kwargs):
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in _RESERVED}
+        if fields:
+            extra = kwargs.setdefault('extra', {})
+            extra['fields'] = {**extra.get('fields', {}), **fields}
+        return msg, kwargs
+
+
+_queue = None
+_handler = None
+_output = None
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup(stream=None):
+    """把佇列處理器掛到 root logger 並啟動背景寫出執行緒 (重複呼叫無作用)"""
+    global _queue, _handler, _output, _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _handler
+        _queue = queue.Queue(int(os.environ.get('ARCADE_LOG_QUEUE', '10000')))
+        output = logging.StreamHandler(stream or sys.stderr)
+        text = os.environ.get('ARCADE_LOG_FORMAT', 'json') == 'text'
+        output.setFormatter(TextFormatter() if text else JsonFormatter())
+        _handler = DroppingQueueHandler(_queue)
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(os.environ.get('ARCADE_LOG_LEVEL', 'INFO').upper())
+        _output = output
+        _listener = logging.handlers.QueueListener(_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown)
+        return _handler
+
+
+def shutdown():
+    """
+    寫完佇列中剩下的紀錄並停止背景執行緒。
+    之後的紀錄直接由 output handler 同步寫出：atexit 以註冊的相反順序執行，
+    比這裡早註冊的收尾工作 (例如 score_queue 寫完佇列時的 score_batch_failed) 會在這之後才記錄。
+    """
+    global _listener
+    with _setup_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        root = logging.getLogger()
+        root.removeHandler(_handler)
+        root.addHandler(_output)
+
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(name), {})
+
+
+def stats():
+    return {
+        'queued': _queue.qsize() if _queue is not None else 0,
+        'dropped': _handler.dropped if _handler is not None else 0,
+    }